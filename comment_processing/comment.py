@@ -4,11 +4,17 @@ import os
 import ast
 from tqdm import tqdm
 
+from comment_processing.snippet_pool import SnippetPool, build_snippet_pool
+
 # --- Configuration Variables ---
 INPUT_JSONL_FILE = "output_good2.jsonl"
 TEMPLATE_CONFIG_FILE = "template_config.json"
 OUTPUT_JSONL_FILE = "train.jsonl"
 TARGET_SAMPLE_COUNT = 80000
+SNIPPET_POOL_FILE = "snippet_pool.jsonl"  # 검증을 통과한 스니펫만 모은 파일 (입력이 바뀌지 않으면 재사용)
+SNIPPET_VALIDATION_CACHE_FILE = "snippet_validation_cache.bin"  # 내용 해시별 검증 결과
+# 검증 규칙(is_valid_snippet)을 바꾸면 올려서 이전 캐시/풀을 무효화합니다
+SNIPPET_VALIDATION_VERSION = b"comment-v1"
 
 # --- Helper Functions ---
 def is_valid_python_code(code_str: str) -> bool:
@@ -28,15 +34,16 @@ def is_allowed_text(text: str) -> bool:
     if not isinstance(text, str):
         return False
     
-    allowed_special_chars = {'<', '>', '｜'}
-    
-    for char in text:
-        if ord(char) < 128:
-            continue
-        if char in allowed_special_chars:
-            continue
-        return False
-    return True
+    if text.isascii():
+        return True
+    # 비ASCII 문자가 있을 때만 서로 다른 문자 집합을 검사 (문자 단위 파이썬 루프를 피함)
+    return all(ord(char) < 128 or char in ALLOWED_SPECIAL_CHARS for char in set(text))
+
+ALLOWED_SPECIAL_CHARS = frozenset({'<', '>', '｜'})
+
+def is_valid_snippet(snippet: str) -> bool:
+    """Snippet pool filter: allowed characters only (cheap check first) and parseable Python."""
+    return is_allowed_text(snippet) and is_valid_python_code(snippet)
 
 def build_system_prompt(persona: dict) -> str:
     """
@@ -124,27 +131,22 @@ def create_conversation_pair(snippet: str, persona: dict) -> tuple[str | None, s
     return user_prompt, final_assistant_answer
 
 # --- Main Logic Function ---
-def generate_completed_dataset(input_path: str, config_path: str, output_path: str, target_count: int):
+def generate_completed_dataset(input_path: str, config_path: str, output_path: str, target_count: int,
+                               pool_path: str = SNIPPET_POOL_FILE):
     """
     Generates a completed training dataset, automatically filtering out any
     non-allowed content and examples with empty answers.
+    Valid snippets are kept in an indexed pool file and read from disk only when sampled.
     """
     print(f"[INFO] Loading and filtering allowed code snippets from '{input_path}'...")
-    valid_snippets = []
     try:
-        with open(input_path, "r", encoding="utf-8") as f:
-            for line in f:
-                try:
-                    data = json.loads(line.strip())
-                    snippet = data.get("content")
-                    if snippet and is_valid_python_code(snippet) and is_allowed_text(snippet):
-                        valid_snippets.append(snippet)
-                except (json.JSONDecodeError, KeyError):
-                    continue
-        if not valid_snippets:
+        valid_count = build_snippet_pool(input_path, pool_path, is_valid_snippet,
+                                         cache_path=SNIPPET_VALIDATION_CACHE_FILE, tag=SNIPPET_VALIDATION_VERSION)
+        if not valid_count:
             print("[ERROR] No valid (allowed text) code snippets found.")
             return
-        print(f"[INFO] Loaded {len(valid_snippets)} valid code snippets.")
+        snippet_pool = SnippetPool(pool_path)
+        print(f"[INFO] Loaded {len(snippet_pool)} valid code snippets.")
     except Exception as e:
         print(f"[ERROR] Failed to load the original file: {e}")
         return
@@ -161,19 +163,21 @@ def generate_completed_dataset(input_path: str, config_path: str, output_path: s
         
         if not allowed_personas:
             print(f"[ERROR] No allowed personas found in '{config_path}'. Please check the file content.")
+            snippet_pool.close()
             return
         print(f"[INFO] Loaded {len(allowed_personas)} allowed personas.")
     except Exception as e:
         print(f"[ERROR] Failed to load the template file: {e}")
+        snippet_pool.close()
         return
 
     print(f"[INFO] Starting to generate {target_count} completed training examples...")
     
     generated_count = 0
-    with open(output_path, "w", encoding="utf-8") as outfile:
+    with snippet_pool, open(output_path, "w", encoding="utf-8") as outfile:
         with tqdm(total=target_count, desc="Generating Training Data") as pbar:
             while generated_count < target_count:
-                chosen_snippet = random.choice(valid_snippets)
+                chosen_snippet = snippet_pool.choice(random)
                 chosen_persona = random.choice(allowed_personas)
 
                 system_prompt = build_system_prompt(chosen_persona)
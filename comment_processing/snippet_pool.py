@@ -0,0 +1,172 @@
+import hashlib
+import json
+import multiprocessing
+import os
+
+from jsonl_index import JsonlIndex
+from jsonl_reader import JsonlReader
+
+# 검증 결과 캐시: (16바이트 내용 해시, 1바이트 결과) 레코드를 이어 붙인 바이너리 파일.
+# 해시에는 검증 규칙 버전(tag)이 섞이므로, 규칙을 바꾸고 tag를 올리면 이전 결과는 자동으로 무시된다.
+_DIGEST_SIZE = 16
+_RECORD_SIZE = _DIGEST_SIZE + 1
+META_SUFFIX = ".meta.json"
+VALIDATE_CHUNKSIZE = 64
+
+
+def snippet_digest(snippet, tag=b""):
+    return hashlib.blake2b(snippet.encode("utf-8", "surrogatepass"), digest_size=_DIGEST_SIZE, person=tag[:16]).digest()
+
+
+class ValidationCache:
+    """
+    내용 해시 -> 검증 결과(bool) 캐시. 실행마다 새로 검증한 결과만 파일 끝에 이어 쓴다.
+
+    사용 예:
+        cache = ValidationCache("snippet_validation_cache.bin", tag=b"comment-v1")
+        verdict = cache.get(digest)   # 처음 보는 내용이면 None
+        cache.put(digest, True)
+        cache.close()
+    """
+    def __init__(self, path, tag=b""):
+        self.path = path
+        self.tag = tag
+        self.verdicts = {}
+        self.hits = 0
+        self.validated = 0
+        self._pending = bytearray()
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            usable = len(data) - len(data) % _RECORD_SIZE  # 중간에 끊긴 마지막 레코드는 버린다
+            for pos in range(0, usable, _RECORD_SIZE):
+                self.verdicts[data[pos:pos + _DIGEST_SIZE]] = data[pos + _DIGEST_SIZE] == 1
+
+    def __len__(self):
+        return len(self.verdicts)
+
+    def digest(self, snippet):
+        return snippet_digest(snippet, self.tag)
+
+    def get(self, digest):
+        verdict = self.verdicts.get(digest)
+        if verdict is not None:
+            self.hits += 1
+        return verdict
+
+    def put(self, digest, verdict):
+        if digest in self.verdicts:
+            return
+        self.verdicts[digest] = verdict
+        self.validated += 1
+        self._pending += digest + (b"\x01" if verdict else b"\x00")
+
+    def flush(self):
+        if self.path and self._pending:
+            with open(self.path, "ab") as f:
+                f.write(self._pending)
+        self._pending = bytearray()
+
+    def close(self):
+        self.flush()
+
+    def report(self):
+        print(f"[INFO] Validation cache: {self.hits} hits, {self.validated} newly validated, {len(self)} entries in '{self.path}'")
+
+
+def _content_of(record):
+    """리더 워커: 레코드에서 content 문자열만 꺼낸다."""
+    snippet = record.get("content") if isinstance(record, dict) else None
+    return [snippet] if snippet and isinstance(snippet, str) else []
+
+
+def _input_signature(input_path):
+    stat = os.stat(input_path)
+    return {"input": os.path.abspath(input_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _load_meta(pool_path):
+    try:
+        with open(pool_path + META_SUFFIX, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def build_snippet_pool(input_path, pool_path, validate, cache_path=None, tag=b"", num_workers=None, rebuild=False):
+    """
+    입력 JSONL의 content 중 validate(snippet)를 통과한 것만 pool_path에 {"content": ...} 한 줄씩 저장하고 레코드 수를 반환한다.
+
+      - 입력 파일의 크기/mtime과 tag가 지난 실행과 같으면 저장된 풀을 그대로 쓴다
+      - 파싱은 JsonlReader 워커가, 검증은 별도의 프로세스 풀이 병렬로 한다
+      - 이미 검증한 내용(해시 기준)은 캐시 결과를 쓰므로 입력이 조금 바뀐 경우에도 새 내용만 검증한다
+
+    validate는 워커 프로세스로 넘어가야 하므로 모듈 최상위 함수여야 한다.
+    """
+    signature = dict(_input_signature(input_path), tag=tag.hex())
+    meta = _load_meta(pool_path)
+    if not rebuild and os.path.exists(pool_path) and meta is not None and meta.get("signature") == signature:
+        print(f"[INFO] Reusing snippet pool '{pool_path}' ({meta['valid']} of {meta['total']} snippets valid).")
+        return meta["valid"]
+
+    cache = ValidationCache(cache_path, tag=tag)
+    reader = JsonlReader(input_path, num_workers=num_workers, transform=_content_of)
+    num_workers = reader.num_workers
+    total = valid = 0
+    tmp_path = pool_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as out, multiprocessing.Pool(num_workers) as pool:
+        for snippets in reader.iter_batches():
+            digests = [cache.digest(snippet) for snippet in snippets]
+            verdicts = [cache.get(digest) for digest in digests]
+            # 배치 안에서 처음 보는 내용만 한 번씩 검증한다
+            unknown = {}
+            for i, verdict in enumerate(verdicts):
+                if verdict is None:
+                    unknown.setdefault(digests[i], i)
+            if unknown:
+                results = pool.map(validate, [snippets[i] for i in unknown.values()], chunksize=VALIDATE_CHUNKSIZE)
+                for digest, verdict in zip(unknown, results):
+                    cache.put(digest, verdict)
+                verdicts = [cache.verdicts[digest] if verdict is None else verdict for digest, verdict in zip(digests, verdicts)]
+            for snippet, verdict in zip(snippets, verdicts):
+                if verdict:
+                    out.write(json.dumps({"content": snippet}, ensure_ascii=False) + "\n")
+                    valid += 1
+            total += len(snippets)
+            cache.flush()
+    os.replace(tmp_path, pool_path)
+    reader.report()
+    cache.close()
+    cache.report()
+
+    with open(pool_path + META_SUFFIX, "w", encoding="utf-8") as f:
+        json.dump({"signature": signature, "total": total, "valid": valid}, f)
+    print(f"[INFO] Built snippet pool '{pool_path}': {valid} of {total} snippets valid.")
+    return valid
+
+
+class SnippetPool:
+    """
+    build_snippet_pool로 만든 풀 파일을 라인 오프셋 인덱스로 열고, 필요할 때만 디스크에서 스니펫을 읽는다.
+    메모리에는 라인 오프셋 배열(memmap)만 올라간다.
+    """
+    def __init__(self, pool_path):
+        self.index = JsonlIndex(pool_path)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, n):
+        return self.index[n]["content"]
+
+    def choice(self, rng):
+        return self[rng.randrange(len(self))]
+
+    def close(self):
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
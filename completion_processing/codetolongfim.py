@@ -2,6 +2,9 @@ import json
 import re
 import random
 
+from jsonl_io import open_jsonl
+from jsonl_reader import JsonlReader
+
 def split_code_into_function_chunks(code_str, max_lines_per_chunk=30):
     """
     코드 문자열을 함수/클래스 단위 등 큰 기능 단위로 나누고,
@@ -48,17 +51,18 @@ def split_code_into_function_chunks(code_str, max_lines_per_chunk=30):
 def convert_jsonl_to_fim_format_with_limit(input_jsonl_path, output_jsonl_path,
                                            max_chunks_per_file=5,
                                            max_lines_per_chunk=30,
-                                           min_prefix_suffix_lines=3):
+                                           min_prefix_suffix_lines=3,
+                                           num_workers=None):
     """
     JSONL 파일을 읽어, 코드 청크를 기능 단위로 분할하고,
     파일당 최대 청크 수를 제한해서 FIM 학습용 JSONL 생성.
+    입력 파싱은 공용 JsonlReader로 num_workers개 프로세스에서 병렬로 수행.
     """
-    with open(input_jsonl_path, 'r', encoding='utf-8') as infile, \
-         open(output_jsonl_path, "w", encoding='utf-8') as outfile:
+    reader = JsonlReader(input_jsonl_path, num_workers=num_workers)
+    with open_jsonl(output_jsonl_path, "w") as outfile:
         
-        for line_num, line in enumerate(infile, 1):
+        for line_num, obj in enumerate(reader, 1):
             try:
-                obj = json.loads(line)
                 content = obj.get("content", "")
                 if not content.strip():
                     continue
@@ -120,11 +124,11 @@ def convert_jsonl_to_fim_format_with_limit(input_jsonl_path, output_jsonl_path,
                 
                 print(f"[Line {line_num}] Processed {len(chunks)} chunks.")
             
-            except json.JSONDecodeError as e:
-                print(f"[Line {line_num}] JSONDecodeError: {e}")
             except Exception as e:
                 print(f"[Line {line_num}] Unexpected error: {e}")
 
+    reader.report()
+
 if __name__ == "__main__":
     input_path = "data.jsonl"
     output_path = "fim_output_limited.jsonl"
@@ -1,6 +1,9 @@
 import json
 import ast
 
+from jsonl_io import open_jsonl
+from jsonl_reader import JsonlReader
+
 def extract_larger_chunks(code_str, min_suffix_lines=3):
     lines = code_str.splitlines()
     n = len(lines)
@@ -61,13 +64,10 @@ def extract_larger_chunks(code_str, min_suffix_lines=3):
 
     return chunks
 
-def process_jsonl_with_larger_chunks(input_path, output_path):
-    with open(input_path, 'r', encoding='utf-8') as fin, \
-         open(output_path, 'w', encoding='utf-8') as fout:
-        for line in fin:
-            if not line.strip():
-                continue
-            data = json.loads(line)
+def process_jsonl_with_larger_chunks(input_path, output_path, num_workers=None):
+    reader = JsonlReader(input_path, num_workers=num_workers)
+    with open_jsonl(output_path, 'w') as fout:
+        for data in reader:
             code_str = data.get("content", "")
             if not code_str.strip():
                 continue
@@ -75,6 +75,7 @@ def process_jsonl_with_larger_chunks(input_path, output_path):
             chunks = extract_larger_chunks(code_str)
             for chunk in chunks:
                 fout.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+    reader.report()
 
 if __name__ == "__main__":
     input_file = "data.jsonl"
@@ -0,0 +1,210 @@
+import json
+import os
+from array import array
+
+import numpy as np
+from tokenizers import Tokenizer
+from tqdm import tqdm
+
+from jsonl_io import open_jsonl
+from completion_processing.reformat_fim_data_for_training import FIM_START, FIM_HOLE, FIM_END, EOS_TOKEN
+
+# 토크나이저에서 ID를 찾아 메타데이터에 함께 저장할 특수 토큰
+SPECIAL_TOKENS = {
+    "fim_begin": FIM_START,
+    "fim_hole": FIM_HOLE,
+    "fim_end": FIM_END,
+    "eos": EOS_TOKEN,
+}
+
+# 'messages' 레코드를 렌더링하는 역할별 (머리말, 꼬리말). DeepSeek Coder instruct 채팅 형식과 같다.
+# 학습 스크립트의 채팅 템플릿이 다르면 여기만 맞추면 된다. assistant의 content와 꼬리말(<|EOT|>)이 손실 마스크 구간이다.
+ROLE_TEMPLATES = {
+    "system": ("", "\n"),
+    "user": ("### Instruction:\n", "\n"),
+    "assistant": ("### Response:\n", "\n" + EOS_TOKEN + "\n"),
+}
+
+
+def _role_template(role: str) -> tuple[str, str]:
+    return ROLE_TEMPLATES.get(role, (f"### {role.capitalize()}:\n", "\n"))
+
+
+def render_record(record: dict) -> tuple[str, list[tuple[int, int]]]:
+    """
+    학습 레코드 하나를 토크나이즈할 텍스트와, 손실을 계산할 문자 구간 [(시작, 끝), ...]으로 변환합니다.
+    'messages' 형식이면 ROLE_TEMPLATES의 역할 태그로 턴을 이어 붙이고 assistant 턴(content + 꼬리말)만 구간으로 둡니다.
+    아니면 'text' / 'content' 필드 전체를 하나의 구간으로 둡니다.
+    """
+    messages = record.get("messages")
+    if not isinstance(messages, list):
+        text = str(record.get("text", record.get("content", "")))
+        return text, [(0, len(text))]
+
+    parts = []
+    spans = []
+    length = 0
+    for message in messages:
+        role = message.get("role", "unknown_role")
+        header, footer = _role_template(role)
+        body = str(message.get("content", "")) + footer
+        parts.append(header)
+        length += len(header)
+        if role == "assistant":
+            spans.append((length, length + len(body)))
+        parts.append(body)
+        length += len(body)
+    return "".join(parts), spans
+
+
+def record_to_text(record: dict) -> str:
+    """학습 레코드 하나를 토크나이즈할 텍스트로 변환합니다. (render_record의 텍스트 부분)"""
+    return render_record(record)[0]
+
+
+def loss_mask_for(offsets, spans) -> np.ndarray:
+    """
+    토큰별 문자 오프셋 [(시작, 끝), ...]과 손실 구간으로 토큰별 마스크(uint8, 1 = 학습 대상)를 만듭니다.
+    토큰의 시작 문자가 구간 안에 있으면 대상이며, BOS처럼 텍스트에 없는(폭 0) 토큰은 제외합니다.
+    """
+    if not offsets:
+        return np.zeros(0, dtype=np.uint8)
+    token_offsets = np.asarray(offsets, dtype=np.int64).reshape(-1, 2)
+    starts, ends = token_offsets[:, 0], token_offsets[:, 1]
+    if not spans:
+        return np.zeros(len(starts), dtype=np.uint8)
+    span_starts = np.asarray([s for s, _ in spans], dtype=np.int64)
+    span_ends = np.asarray([e for _, e in spans], dtype=np.int64)
+    which = np.searchsorted(span_starts, starts, side="right") - 1
+    inside = (which >= 0) & (starts < span_ends[np.maximum(which, 0)]) & (ends > starts)
+    return inside.astype(np.uint8)
+
+
+def _output_paths(output_prefix: str) -> tuple[str, str, str, str]:
+    return f"{output_prefix}.bin", f"{output_prefix}.idx.npy", f"{output_prefix}.meta.json", f"{output_prefix}.mask.bin"
+
+
+def export_tokenized_memmap(input_jsonl_path: str, tokenizer_path: str, output_prefix: str,
+                            batch_size: int = 1000, add_special_tokens: bool = True):
+    """
+    reformat_fim_data_for_training 등에서 만든 학습용 JSONL을 배치 단위로 토크나이즈하여
+    하나의 평탄한 input_ids 바이너리(.bin), 샘플별 오프셋 인덱스(.idx.npy),
+    토큰별 손실 마스크(.mask.bin, uint8, 1 = assistant 구간),
+    FIM/특수 토큰 ID와 렌더링 형식이 담긴 메타데이터(.meta.json)로 저장합니다.
+    'messages' 레코드는 ROLE_TEMPLATES의 역할 태그 형식으로 렌더링합니다.
+
+    Args:
+        input_jsonl_path (str): 토크나이즈할 JSONL 파일 경로.
+        tokenizer_path (str): 로컬 tokenizer.json 경로.
+        output_prefix (str): 출력 파일 접두사 (예: "short_train" -> short_train.bin, ...).
+        batch_size (int): encode_batch 한 번에 넘길 레코드 수.
+        add_special_tokens (bool): 토크나이저의 BOS 등 특수 토큰 추가 여부.
+    """
+    tokenizer = Tokenizer.from_file(tokenizer_path)
+    vocab_size = tokenizer.get_vocab_size(with_added_tokens=True)
+    dtype = np.uint16 if vocab_size <= np.iinfo(np.uint16).max + 1 else np.uint32
+
+    bin_path, idx_path, meta_path, mask_path = _output_paths(output_prefix)
+    offsets = array("q", [0])
+    skipped = 0
+    masked_tokens = 0
+
+    def flush(rendered, outfile, maskfile):
+        nonlocal masked_tokens
+        texts = [text for text, _ in rendered]
+        for encoding, (_, spans) in zip(tokenizer.encode_batch(texts, add_special_tokens=add_special_tokens), rendered):
+            ids = np.asarray(encoding.ids, dtype=dtype)
+            mask = loss_mask_for(encoding.offsets, spans)
+            ids.tofile(outfile)
+            mask.tofile(maskfile)
+            masked_tokens += int(mask.sum())
+            offsets.append(offsets[-1] + len(ids))
+
+    with open_jsonl(input_jsonl_path, "r") as infile, open(bin_path, "wb") as outfile, open(mask_path, "wb") as maskfile:
+        rendered = []
+        for line_num, line in enumerate(tqdm(infile, desc="[*] Tokenizing"), 1):
+            if not line.strip():
+                continue
+            try:
+                rendered.append(render_record(json.loads(line)))
+            except json.JSONDecodeError as e:
+                print(f"[Line {line_num}] JSONDecodeError: {e}")
+                skipped += 1
+                continue
+            if len(rendered) >= batch_size:
+                flush(rendered, outfile, maskfile)
+                rendered = []
+        if rendered:
+            flush(rendered, outfile, maskfile)
+
+    np.save(idx_path, np.frombuffer(offsets, dtype=np.int64))
+
+    special_token_ids = {name: tokenizer.token_to_id(token) for name, token in SPECIAL_TOKENS.items()}
+    for name, token_id in special_token_ids.items():
+        if token_id is None:
+            print(f"[!] '{SPECIAL_TOKENS[name]}' 토큰을 토크나이저에서 찾을 수 없습니다.")
+
+    meta = {
+        "dtype": np.dtype(dtype).name,
+        "num_samples": len(offsets) - 1,
+        "num_tokens": offsets[-1],
+        "num_loss_tokens": masked_tokens,
+        "chat_format": {role: list(template) for role, template in ROLE_TEMPLATES.items()},
+        "loss_mask": "assistant content and footer (.mask.bin, uint8 per token)",
+        "vocab_size": vocab_size,
+        "tokenizer_path": os.path.abspath(tokenizer_path),
+        "special_tokens": SPECIAL_TOKENS,
+        "special_token_ids": special_token_ids,
+    }
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    print(f"[*] {meta['num_samples']}개 샘플, {meta['num_tokens']}개 토큰을 '{bin_path}'에 저장했습니다. (건너뛴 줄: {skipped})")
+    return meta
+
+
+class TokenizedDataset:
+    """
+    export_tokenized_memmap 결과를 메모리 매핑으로 읽는 데이터셋.
+    dataset[i]는 i번째 샘플의 input_ids를, dataset.loss_mask(i)는 같은 길이의 손실 마스크를
+    복사 없이 memmap 슬라이스로 반환합니다.
+    """
+    def __init__(self, output_prefix: str):
+        bin_path, idx_path, meta_path, mask_path = _output_paths(output_prefix)
+        with open(meta_path, "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.offsets = np.load(idx_path, mmap_mode="r")
+        if self.meta["num_tokens"] > 0:
+            self.input_ids = np.memmap(bin_path, dtype=self.meta["dtype"], mode="r")
+            self.loss_masks = np.memmap(mask_path, dtype=np.uint8, mode="r")
+        else:
+            self.input_ids = np.zeros(0, dtype=self.meta["dtype"])
+            self.loss_masks = np.zeros(0, dtype=np.uint8)
+        self.special_token_ids = self.meta["special_token_ids"]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _bounds(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"sample index {index} out of range")
+        return self.offsets[index], self.offsets[index + 1]
+
+    def __getitem__(self, index):
+        start, end = self._bounds(index)
+        return self.input_ids[start:end]
+
+    def loss_mask(self, index):
+        start, end = self._bounds(index)
+        return self.loss_masks[start:end]
+
+
+if __name__ == "__main__":
+    # reformat_fim_data_for_training.py 의 출력 파일을 토크나이즈
+    export_tokenized_memmap(
+        input_jsonl_path="short_train.jsonl",
+        tokenizer_path="tokenizer.json",
+        output_prefix="short_train",
+    )
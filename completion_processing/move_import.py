@@ -2,6 +2,9 @@ import json
 from pathlib import Path
 from tqdm import tqdm
 
+from jsonl_io import open_jsonl
+from jsonl_reader import JsonlReader
+
 def extract_import_lines(lines):
     return [i for i, line in enumerate(lines) if line.strip().startswith(("import ", "from "))]
 
@@ -33,25 +36,22 @@ def adjust_imports_in_prefix(sample):
     sample["suffix_code"] = suffix_code
     return sample
 
-def process_jsonl(input_path, output_path):
-    input_path = Path(input_path)
+def process_jsonl(input_path, output_path, num_workers=None):
     output_path = Path(output_path)
-    updated = []
+    reader = JsonlReader(input_path, num_workers=num_workers)
 
-    with input_path.open("r", encoding="utf-8") as f:
-        for line in tqdm(f, desc="[*] Adjusting import statements"):
+    # 샘플을 모아두지 않고 읽는 즉시 버퍼링된 출력 파일로 기록 (입력 크기와 무관한 메모리 사용량)
+    # 입력 파싱은 JsonlReader가 num_workers개 프로세스에서 병렬로 수행
+    with open_jsonl(output_path, "w") as fout:
+        for sample in tqdm(reader, desc="[*] Adjusting import statements"):
             try:
-                sample = json.loads(line)
                 sample = adjust_imports_in_prefix(sample)
-                updated.append(sample)
+                json.dump(sample, fout)
+                fout.write("\n")
             except Exception as e:
                 print(f"[!] Error: {e}")
 
-    with output_path.open("w", encoding="utf-8") as f:
-        for s in updated:
-            json.dump(s, f)
-            f.write("\n")
-
+    reader.report()
     print(f"[*] Saved adjusted dataset to {output_path}")
 
 # 사용 예시
@@ -1,103 +1,141 @@
+import itertools
 import json
+import multiprocessing
 import os
 
-def convert_to_fim_format_with_original_cols(input_file_path, output_file_path):
+from jsonl_io import open_jsonl
+
+# DeepSeek Coder의 FIM 토큰 (tokenizer.json에서 확인된 정확한 값 사용)
+FIM_START = '<｜fim begin｜>'
+FIM_HOLE = "<｜fim hole｜>"
+FIM_END = "<｜fim end｜>"
+EOS_TOKEN = "<|EOT|>" # End Of Turn / End Of Text 토큰
+
+# 병렬 처리 시 워커 하나에 한 번에 넘기는 줄 수
+DEFAULT_BATCH_SIZE = 2000
+
+
+def convert_record_to_training_format(original_data_record: dict) -> dict:
+    """
+    prefix_code, target_code, suffix_code 를 가진 레코드 하나를
+    'messages' 필드만 가진 학습용 레코드로 변환합니다.
+    """
+    # 원본 컬럼명은 그대로 유지하되, 그 값들을 가져옴
+    prefix_code = original_data_record.get("prefix_code", "")
+    target_code = original_data_record.get("target_code", "")
+    suffix_code = original_data_record.get("suffix_code", "")
+
+    # FIM 토큰과 코드를 결합하여 assistant의 content 생성
+    # <FIM_START> <prefix_code> <FIM_HOLE> <suffix_code> <FIM_END> <target_code> <EOS_TOKEN>
+    assistant_fim_content_raw = (
+        FIM_START + prefix_code +
+        FIM_HOLE + suffix_code +
+        FIM_END + target_code +
+        EOS_TOKEN
+    )
+
+    # user의 content (빈칸을 표시하는 코드)
+    user_content_str = (
+    "Please complete the blank part of the following Python code:\n\n"
+    "```python\n"
+    f"{prefix_code}"
+    "# (Complete the code here)\n"
+    f"{suffix_code}"
+    "```\n\n"
+    )
+
+    # assistant's content (wrapped in markdown code block)
+    assistant_full_content_str = (
+    "Yes, I have completed the code as requested. Here is the completed code:\n\n"
+    f"```python\n{assistant_fim_content_raw}\n```"
+    )
+
+    # 팀장님의 지시대로 원본 컬럼명은 유지하고 그 값은 변경되지 않음
+    # 하지만 대부분의 학습 스크립트는 'messages' 필드만 기대하므로
+    # 'messages'만 있는 새로운 레코드를 만듭니다 (가장 일반적인 학습 방식).
+    # 만약 원본 데이터를 그대로 유지하고 싶다면:
+    # original_data_record["messages"] = record_for_training["messages"]
+    return {
+        "messages": [
+            {"role": "user", "content": user_content_str},
+            {"role": "assistant", "content": assistant_full_content_str}
+        ]
+    }
+
+
+def _convert_numbered_line(numbered_line):
+    """
+    (줄 번호, 원본 줄) 하나를 변환해 (줄 번호, 직렬화된 줄 또는 None, 경고 메시지 또는 None)을 반환합니다.
+    워커 프로세스에서도 호출되므로 모듈 최상위 함수로 둡니다.
+    """
+    line_num, line = numbered_line
+    try:
+        record = convert_record_to_training_format(json.loads(line))
+        return line_num, json.dumps(record, ensure_ascii=False) + '\n', None
+    except json.JSONDecodeError as e:
+        return line_num, None, f"JSON 파싱 오류 발생: {e}"
+    except KeyError as e:
+        return line_num, None, f"필수 키 누락: {e}"
+    except Exception as e:
+        return line_num, None, f"알 수 없는 오류 발생: {e}"
+
+
+def _iter_converted_lines(infile, num_workers, batch_size):
+    """
+    입력 줄을 batch_size * num_workers 개씩만 읽어 변환 결과를 순서대로 내보냅니다.
+    한 번에 한 묶음만 메모리에 있으므로 입력 크기와 관계없이 메모리 사용량이 일정합니다.
+    """
+    numbered_lines = enumerate(infile)
+    if num_workers <= 1:
+        yield from map(_convert_numbered_line, numbered_lines)
+        return
+
+    with multiprocessing.Pool(num_workers) as pool:
+        while True:
+            batch = list(itertools.islice(numbered_lines, batch_size * num_workers))
+            if not batch:
+                break
+            yield from pool.imap(_convert_numbered_line, batch, chunksize=batch_size)
+
+
+def convert_to_fim_format_with_original_cols(input_file_path, output_file_path,
+                                             num_workers=1, batch_size=DEFAULT_BATCH_SIZE):
     """
     prefix_code, target_code, suffix_code 컬럼을 포함한 원본 JSONL 파일을 읽어와
     FIM 태그를 content 필드 안에 삽입한 DeepSeek Coder Instruct 모델 학습용
     JSONL 형식으로 변환합니다. 컬럼명은 변경하지 않습니다.
+    변환된 레코드는 모아두지 않고 버퍼링된 출력 파일로 바로 기록합니다.
+    .gz / .zst 확장자는 open_jsonl이 투명하게 압축/해제합니다.
 
     Args:
         input_file_path (str): 원본 FIM 데이터가 있는 JSONL 파일 경로.
         output_file_path (str): 변환된 FIM 데이터가 저장될 JSONL 파일 경로.
+        num_workers (int): 변환에 사용할 프로세스 수. 1이면 현재 프로세스에서 처리합니다.
+        batch_size (int): 병렬 처리 시 워커 하나에 넘기는 줄 수.
     """
+    converted_count = 0
 
-    # DeepSeek Coder의 FIM 토큰 (tokenizer.json에서 확인된 정확한 값 사용)
-    FIM_START = '<｜fim begin｜>'
-    FIM_HOLE = "<｜fim hole｜>"
-    FIM_END = "<｜fim end｜>"
-    EOS_TOKEN = "<|EOT|>" # End Of Turn / End Of Text 토큰
-
-    converted_data_entries = []
-
-    print(f"'{input_file_path}' 파일을 읽어오는 중...")
+    print(f"'{input_file_path}' 파일을 읽어 '{output_file_path}'에 변환 결과를 저장하는 중...")
     try:
-        with open(input_file_path, 'r', encoding='utf-8') as infile:
-            for line_num, line in enumerate(infile):
-                try:
-                    original_data_record = json.loads(line)
-                    
-                    # 원본 컬럼명은 그대로 유지하되, 그 값들을 가져옴
-                    prefix_code = original_data_record.get("prefix_code", "")
-                    target_code = original_data_record.get("target_code", "")
-                    suffix_code = original_data_record.get("suffix_code", "")
-
-                    # FIM 토큰과 코드를 결합하여 assistant의 content 생성
-                    # <FIM_START> <prefix_code> <FIM_HOLE> <suffix_code> <FIM_END> <target_code> <EOS_TOKEN>
-                    assistant_fim_content_raw = (
-                        FIM_START + prefix_code +
-                        FIM_HOLE + suffix_code +
-                        FIM_END + target_code +
-                        EOS_TOKEN
-                    )
-
-                    # user의 content (빈칸을 표시하는 코드)
-                    user_content_str = (
-                    "Please complete the blank part of the following Python code:\n\n"
-                    "```python\n"
-                    f"{prefix_code}"
-                    "# (Complete the code here)\n"
-                    f"{suffix_code}"
-                    "```\n\n"
-                    )
-
-# assistant's content (wrapped in markdown code block)
-                    assistant_full_content_str = (
-                    "Yes, I have completed the code as requested. Here is the completed code:\n\n"
-                    f"```python\n{assistant_fim_content_raw}\n```"
-                    )
-
-                    # 최종 messages 형식으로 추가할 딕셔너리
-                    # 팀장님의 지시대로 원본 컬럼명은 유지하고 그 값은 변경되지 않음
-                    # 하지만 학습을 위한 'messages' 필드를 추가함
-                    record_for_training = {
-                        "messages": [
-                            {"role": "user", "content": user_content_str},
-                            {"role": "assistant", "content": assistant_full_content_str}
-                        ]
-                    }
-                    
-                    # 원본 데이터를 그대로 유지하면서 'messages' 필드를 추가할 수도 있습니다.
-                    # 하지만 대부분의 학습 스크립트는 'messages' 필드만 기대하므로
-                    # 위와 같이 'messages'만 있는 새로운 레코드를 만드는 것이 일반적입니다.
-                    # 만약 원본 데이터를 그대로 유지하고 싶다면:
-                    # original_data_record["messages"] = record_for_training["messages"]
-                    # converted_data_entries.append(original_data_record)
-                    
-                    # 여기서는 'messages' 필드만 있는 새로운 레코드를 추가합니다 (가장 일반적인 학습 방식).
-                    converted_data_entries.append(record_for_training)
-
-                except json.JSONDecodeError as e:
-                    print(f"경고: {input_file_path} 파일의 {line_num + 1}번째 줄에서 JSON 파싱 오류 발생: {e}. 이 줄은 건너뜝니다.")
-                except KeyError as e:
-                    print(f"경고: {input_file_path} 파일의 {line_num + 1}번째 줄에서 필수 키 누락: {e}. 이 줄은 건너뜝니다.")
-                except Exception as e:
-                    print(f"경고: {input_file_path} 파일의 {line_num + 1}번째 줄에서 알 수 없는 오류 발생: {e}. 이 줄은 건너뜁니다.")
-
+        infile = open_jsonl(input_file_path, 'r')
     except FileNotFoundError:
         print(f"오류: 입력 파일 '{input_file_path}'을(를) 찾을 수 없습니다.")
         return
 
-    print(f"총 {len(converted_data_entries)}개의 레코드를 변환했습니다.")
-    print(f"변환된 데이터를 '{output_file_path}'에 저장하는 중...")
-
     try:
-        with open(output_file_path, 'w', encoding='utf-8') as outfile:
-            for entry in converted_data_entries:
-                outfile.write(json.dumps(entry, ensure_ascii=False) + '\n')
-        print("변환 및 저장이 완료되었습니다.")
+        with infile, open_jsonl(output_file_path, 'w') as outfile:
+            for line_num, converted_line, warning in _iter_converted_lines(infile, num_workers, batch_size):
+                if warning is not None:
+                    print(f"경고: {input_file_path} 파일의 {line_num + 1}번째 줄에서 {warning}. 이 줄은 건너뜁니다.")
+                    continue
+                outfile.write(converted_line)
+                converted_count += 1
     except IOError as e:
         print(f"오류: 출력 파일 '{output_file_path}'에 쓰는 중 오류 발생: {e}")
+        return
+
+    print(f"총 {converted_count}개의 레코드를 변환했습니다.")
+    print("변환 및 저장이 완료되었습니다.")
 
 # --- 스크립트 실행 부분 ---
 if __name__ == "__main__":
@@ -5,6 +5,7 @@ from data_processing.data_load_process.mongo_loader import load_data_from_mongo,
 from preprocessing import preprocess_rule_1, preprocess_rule_2 # Updated import
 from ml_validation import isolation_filter, lof_filter # IsolationForest, LOF 유지
 import os # 파일 존재 여부 확인을 위해 os 모듈 추가
+from jsonl_io import open_jsonl # .gz / .zst 확장자면 투명하게 압축
 
 # 데이터 처리 및 모델 학습/추론을 모듈화된 파이프라인 형태로 구성한 파일
 # 전체 작업 흐름을 하나로 묶는 “자동 실행 스크립트”
@@ -36,8 +37,10 @@ def save_dataframe_to_jsonl_in_chunks(df: pd.DataFrame, file_path: str, chunk_si
             # 이미 파일이 존재하면 (이전 실행에서 생성되었거나) 헤더 없이 추가
             header = not file_exists and i == 0
             
-            # mode='a'는 append 모드, lines=True는 JSONL 형식, force_ascii=False는 한글 깨짐 방지
-            chunk_df.to_json(file_path, orient="records", lines=True, force_ascii=False, mode='a')
+            # 'a'는 append 모드, lines=True는 JSONL 형식, force_ascii=False는 한글 깨짐 방지
+            # 압축 파일은 청크마다 새 프레임으로 이어 붙여지며, 읽을 때는 하나의 스트림으로 이어짐
+            with open_jsonl(file_path, 'a') as f:
+                chunk_df.to_json(f, orient="records", lines=True, force_ascii=False)
             saved_count += len(chunk_df)
             file_exists = True # 첫 청크가 저장되면 파일이 존재하게 됨
 
@@ -0,0 +1,164 @@
+import json
+import os
+import random
+import struct
+
+import numpy as np
+
+INDEX_SUFFIX = ".idx"
+SCAN_BLOCK_SIZE = 16 * 1024 * 1024
+
+# 사이드카 인덱스 파일 헤더: 매직, 원본 파일 크기, 원본 mtime(ns), 라인 수
+# 헤더 뒤에는 int64 라인 시작 오프셋 배열과 라인 끝 오프셋(개행 위치) 배열이 이어진다.
+_MAGIC = b"JSONLIX1"
+_HEADER = struct.Struct("<8sqqq")
+
+
+def index_path_for(path):
+    return str(path) + INDEX_SUFFIX
+
+
+def scan_line_offsets(path, block_size=SCAN_BLOCK_SIZE):
+    """
+    파일을 블록 단위로 읽어 개행 위치만 빠르게 찾고, 비어 있지 않은 각 라인의 (시작, 끝) 바이트 오프셋 배열을 반환한다.
+    끝 오프셋은 개행 문자 위치(마지막 라인에 개행이 없으면 파일 크기)이다.
+    """
+    newline_chunks = []
+    base = 0
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            positions = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == 0x0A)
+            if positions.size:
+                newline_chunks.append(positions.astype(np.int64) + base)
+            base += len(block)
+
+    newlines = np.concatenate(newline_chunks) if newline_chunks else np.zeros(0, dtype=np.int64)
+    starts = np.concatenate(([0], newlines + 1)).astype(np.int64)
+    ends = np.concatenate((newlines, [base])).astype(np.int64)
+    non_empty = ends > starts
+    return starts[non_empty], ends[non_empty]
+
+
+def _write_index(index_path, size, mtime_ns, starts, ends):
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, size, mtime_ns, len(starts)))
+        starts.astype("<i8").tofile(f)
+        ends.astype("<i8").tofile(f)
+    os.replace(tmp_path, index_path)
+
+
+def _read_index(index_path, size, mtime_ns):
+    """사이드카가 원본 파일의 크기/mtime과 일치하면 (starts, ends)를 memmap으로 반환하고, 아니면 None."""
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, "rb") as f:
+        header = f.read(_HEADER.size)
+    if len(header) != _HEADER.size:
+        return None
+    magic, indexed_size, indexed_mtime_ns, count = _HEADER.unpack(header)
+    if magic != _MAGIC or indexed_size != size or indexed_mtime_ns != mtime_ns:
+        return None
+    if os.path.getsize(index_path) != _HEADER.size + 16 * count:
+        return None
+    if count == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    offsets = np.memmap(index_path, dtype="<i8", mode="r", offset=_HEADER.size, shape=(2 * count,))
+    return offsets[:count], offsets[count:]
+
+
+def load_or_build_index(path, rebuild=False):
+    """
+    path의 사이드카 인덱스를 읽는다. 없거나 파일 크기/mtime이 바뀌었으면 새로 만들어 저장한다.
+    """
+    stat = os.stat(path)
+    index_path = index_path_for(path)
+    if not rebuild:
+        loaded = _read_index(index_path, stat.st_size, stat.st_mtime_ns)
+        if loaded is not None:
+            return loaded
+    starts, ends = scan_line_offsets(path)
+    try:
+        _write_index(index_path, stat.st_size, stat.st_mtime_ns, starts, ends)
+    except OSError as e:
+        print(f"[!] Failed to write index '{index_path}': {e}")
+    return starts, ends
+
+
+class JsonlIndex:
+    """
+    라인 바이트 오프셋 인덱스를 이용해 JSONL 파일의 N번째 레코드를 O(1)로 읽는 리더.
+
+    사용 예:
+        with JsonlIndex("train.jsonl") as index:
+            record = index[123]
+            samples = index.sample(10, seed=42)
+            ranges = index.split_byte_ranges(8)
+    """
+    def __init__(self, path, rebuild=False):
+        self.path = str(path)
+        self.starts, self.ends = load_or_build_index(self.path, rebuild=rebuild)
+        self.file_size = os.path.getsize(self.path)
+        self._file = open(self.path, "rb")
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.starts)
+
+    def read_line(self, n):
+        """n번째(0부터) 비어 있지 않은 라인의 원본 바이트를 반환한다."""
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError(f"record index {n} out of range")
+        start = int(self.starts[n])
+        self._file.seek(start)
+        return self._file.read(int(self.ends[n]) - start)
+
+    def __getitem__(self, n):
+        return json.loads(self.read_line(n))
+
+    def sample_indices(self, k, seed=None):
+        """전체 파싱 없이 균등하게 k개의 레코드 번호를 뽑는다 (중복 없음, 오름차순)."""
+        rng = random.Random(seed)
+        return sorted(rng.sample(range(len(self)), min(k, len(self))))
+
+    def sample(self, k, seed=None):
+        return [self[n] for n in self.sample_indices(k, seed)]
+
+    def split_byte_ranges(self, num_parts):
+        """
+        파일을 라인 경계에 맞춘 바이트 크기가 비슷한 num_parts개의 [start, end) 범위로 나눈다.
+        병렬 워커에 그대로 넘길 수 있으며, 빈 범위는 제외된다.
+        """
+        if len(self) == 0:
+            return []
+        targets = [self.file_size * i // num_parts for i in range(1, num_parts)]
+        cut_records = np.searchsorted(self.starts, targets, side="left")
+        boundaries = [0] + [int(self.starts[i]) if i < len(self) else self.file_size for i in cut_records] + [self.file_size]
+        return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+    def record_range_for_bytes(self, start, end):
+        """[start, end) 바이트 범위에 시작하는 레코드 번호 범위 [first, last)를 반환한다."""
+        first = int(np.searchsorted(self.starts, start, side="left"))
+        last = int(np.searchsorted(self.starts, end, side="left"))
+        return first, last
+
+
+if __name__ == "__main__":
+    with JsonlIndex("train.jsonl") as index:
+        print(f"[*] {len(index)} records indexed")
+        print(index.sample(3, seed=0))
+        print(index.split_byte_ranges(4))
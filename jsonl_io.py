@@ -0,0 +1,123 @@
+import gzip
+import io
+import json
+import os
+import sys
+import time
+
+# .zst 지원은 선택 사항: zstandard가 없으면 .zst 파일을 열 때만 오류를 낸다.
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+GZIP_DEFAULT_LEVEL = 6
+ZSTD_DEFAULT_LEVEL = 3
+
+
+def compression_of(path):
+    """확장자로 압축 형식을 판별한다. "gzip", "zstd" 또는 None."""
+    path = str(path)
+    if path.endswith(".gz"):
+        return "gzip"
+    if path.endswith(".zst"):
+        return "zstd"
+    return None
+
+
+def is_compressed(path):
+    return compression_of(path) is not None
+
+
+def open_jsonl(path, mode="r", encoding="utf-8", compresslevel=None, threads=-1):
+    """
+    확장자(.gz / .zst)에 따라 투명하게 압축/해제하며 파일을 연다. 그 외 확장자는 일반 파일로 연다.
+
+    Args:
+        path: 파일 경로.
+        mode (str): "r", "w", "a" (텍스트) 또는 "rb", "wb", "ab" (바이너리).
+        encoding (str): 텍스트 모드 인코딩.
+        compresslevel (int | None): 압축 레벨. None이면 형식별 기본값.
+        threads (int): zstd 압축 스레드 수. -1이면 CPU 코어 수만큼 사용.
+    """
+    binary = "b" in mode
+    base_mode = mode.replace("b", "").replace("t", "")
+    if base_mode not in ("r", "w", "a"):
+        raise ValueError(f"지원하지 않는 mode입니다: {mode}")
+
+    kind = compression_of(path)
+    if kind is None:
+        if binary:
+            return open(path, base_mode + "b", buffering=DEFAULT_BUFFER_SIZE)
+        return open(path, base_mode, encoding=encoding, buffering=DEFAULT_BUFFER_SIZE)
+
+    if kind == "gzip":
+        stream = gzip.open(path, base_mode + "b", compresslevel=compresslevel or GZIP_DEFAULT_LEVEL)
+    else:
+        if zstandard is None:
+            raise ImportError(f"'{path}'을(를) 열려면 zstandard 패키지가 필요합니다: pip install zstandard")
+        raw = open(path, base_mode + "b")
+        if base_mode == "r":
+            # 이어 쓰기(a)로 여러 프레임이 붙은 파일도 끝까지 읽는다
+            reader = zstandard.ZstdDecompressor().stream_reader(raw, read_size=DEFAULT_BUFFER_SIZE, read_across_frames=True)
+            stream = io.BufferedReader(reader, DEFAULT_BUFFER_SIZE)
+        else:
+            compressor = zstandard.ZstdCompressor(level=compresslevel or ZSTD_DEFAULT_LEVEL, threads=threads)
+            stream = io.BufferedWriter(compressor.stream_writer(raw), DEFAULT_BUFFER_SIZE)
+
+    if binary:
+        return stream
+    return io.TextIOWrapper(stream, encoding=encoding)
+
+
+def append_jsonl_records(path, records, fsync=True):
+    """
+    레코드들을 JSONL로 이어 쓰고 파일을 닫은 뒤 디스크에 동기화한다.
+    압축 파일은 호출마다 새 프레임/멤버로 추가되며, 읽을 때는 하나의 스트림으로 이어진다.
+    """
+    with open_jsonl(path, "a") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    if fsync:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def benchmark(input_path, output_dir=None):
+    """
+    input_path(JSONL)를 일반 텍스트, .gz, .zst로 각각 다시 써 보고 쓰기/읽기 처리량(MB/s)과 파일 크기를 비교한다.
+    """
+    output_dir = output_dir or os.path.dirname(os.path.abspath(input_path))
+    with open_jsonl(input_path, "rb") as f:
+        data = f.read()
+    raw_mb = len(data) / (1024 * 1024)
+    base = os.path.join(output_dir, "bench_jsonl_io")
+
+    kinds = [".jsonl", ".jsonl.gz"] + ([".jsonl.zst"] if zstandard is not None else [])
+    print(f"[*] Input: {input_path} ({raw_mb:.1f} MB uncompressed)")
+    print(f"{'format':<12}{'size(MB)':>10}{'ratio':>8}{'write MB/s':>12}{'read MB/s':>12}")
+    for ext in kinds:
+        path = base + ext
+        start = time.perf_counter()
+        with open_jsonl(path, "wb") as f:
+            f.write(data)
+        write_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with open_jsonl(path, "r") as f:
+            for _ in f:
+                pass
+        read_seconds = time.perf_counter() - start
+
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        print(f"{ext:<12}{size_mb:>10.1f}{raw_mb / size_mb if size_mb else 0:>8.2f}"
+              f"{raw_mb / write_seconds:>12.1f}{raw_mb / read_seconds:>12.1f}")
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    benchmark(sys.argv[1] if len(sys.argv) > 1 else "train.jsonl")
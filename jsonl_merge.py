@@ -1,8 +1,27 @@
+import hashlib
+import heapq
 import json
+import multiprocessing
+import os
+import tempfile
 from pathlib import Path
 from tqdm import tqdm
 from collections import OrderedDict
 
+import numpy as np
+
+from jsonl_io import open_jsonl
+from jsonl_shuffle import DEFAULT_SHUFFLE_MEMORY_BYTES, external_shuffle_jsonl
+
+DIGEST_SIZE = 16  # 128비트 해시 -> 레코드당 16바이트
+# 평소에는 항목당 16바이트지만, 정렬 배열을 합칠 때 잠시 사본이 생기므로 예산은 측정한 최대치(약 38바이트)로 잡는다
+DIGEST_ENTRY_BYTES = 40
+DIGEST_BATCH = 8192  # 다이제스트를 이만큼 모아 NumPy 호출 한 번으로 조회/추가한다
+# recent 배열이 이 크기(또는 main의 1/8)를 넘으면 main에 합친다
+RECENT_MERGE_MIN = 1 << 16
+# 파티션 하나가 메모리 예산을 넘으면 다이제스트의 다음 4바이트로 이만큼 다시 나눈다
+SUBPARTITIONS = 16
+
 def reorder_keys(obj):
     return OrderedDict([
         ("prefix_code", obj.get("prefix_code", "")),
@@ -10,29 +29,328 @@ def reorder_keys(obj):
         ("suffix_code", obj.get("suffix_code", "")),
     ])
 
-def merge_jsonl_unique(files, output_file):
-    seen = set()
+def digest_of(obj_str):
+    return hashlib.blake2b(obj_str.encode("utf-8"), digest_size=DIGEST_SIZE).digest()
+
+class MemoryBudgetExceeded(Exception):
+    pass
+
+def _digest_halves(digests):
+    """16바이트 다이제스트 목록을 (앞 8바이트, 뒤 8바이트) uint64 배열 두 개로 바꾼다."""
+    pairs = np.frombuffer(b"".join(digests), dtype="<u8").reshape(-1, 2)
+    return pairs[:, 0].copy(), pairs[:, 1].copy()
+
+def _sorted_contains(hi, lo, q_hi, q_lo):
+    """
+    (hi 기준으로 정렬된) hi/lo 배열에 (q_hi, q_lo) 각각이 있는지 확인한다.
+    hi는 숫자 이진 탐색으로 찾고 lo는 그 위치에서 비교한다. hi가 같은 항목이 여럿인 경우(64비트 충돌)만 구간을 훑는다.
+    """
+    found = np.zeros(len(q_hi), dtype=bool)
+    if not len(hi):
+        return found
+    pos = np.searchsorted(hi, q_hi)
+    inside = np.flatnonzero(pos < len(hi))
+    at = pos[inside]
+    same_hi = hi[at] == q_hi[inside]
+    found[inside] = same_hi & (lo[at] == q_lo[inside])
+    # 같은 hi가 뒤에 더 있는 경우 (극히 드묾)
+    nxt = at + 1
+    run = same_hi & (nxt < len(hi))
+    run[run] = hi[nxt[run]] == q_hi[inside][run]
+    for i in inside[run].tolist():
+        if not found[i]:
+            end = np.searchsorted(hi, q_hi[i], side="right")
+            found[i] = bool((lo[pos[i]:end] == q_lo[i]).any())
+    return found
+
+def _sorted_insert(hi, lo, new_hi, new_lo):
+    """hi 기준 정렬을 유지하며 (new_hi, new_lo)를 끼워 넣은 새 배열 두 개를 반환한다."""
+    order = np.argsort(new_hi, kind="stable")
+    new_hi, new_lo = new_hi[order], new_lo[order]
+    at = np.searchsorted(hi, new_hi)
+    return np.insert(hi, at, new_hi), np.insert(lo, at, new_lo)
+
+class DigestSet:
+    """
+    16바이트 다이제스트 집합. 다이제스트를 앞/뒤 8바이트의 uint64 배열 두 개(hi 기준 정렬)에 고정 폭으로 담는다.
+
+      - main   : 대부분의 다이제스트
+      - recent : 최근 추가분. RECENT_MERGE_MIN개(또는 main의 1/8)를 넘으면 main에 합친다
+
+    add_batch()가 다이제스트 묶음을 몇 번의 NumPy 호출로 조회(searchsorted)하고 추가하므로
+    항목당 메모리는 16바이트(합치는 동안 최대 약 40바이트)이다.
+    예상 메모리가 max_bytes를 넘게 커져야 하면 MemoryBudgetExceeded를 발생시킨다.
+    """
+    def __init__(self, max_bytes=None):
+        self.max_entries = None if max_bytes is None else max_bytes // DIGEST_ENTRY_BYTES
+        empty = np.empty(0, dtype=np.uint64)
+        self._main = (empty, empty)
+        self._recent = (empty, empty)
+
+    def __len__(self):
+        return len(self._main[0]) + len(self._recent[0])
+
+    def add_batch(self, digests):
+        """
+        다이제스트 목록을 추가하고, 각 항목이 처음 등장했는지(bool 배열)를 반환한다.
+        같은 묶음 안에서 반복되는 다이제스트는 첫 번째만 True이다.
+        """
+        hi, lo = _digest_halves(digests)
+        # 묶음 안의 중복 제거: (hi, lo)로 안정 정렬한 뒤 앞 항목과 같은 것은 버린다 (첫 등장 위치만 남음)
+        order = np.lexsort((lo, hi))
+        s_hi, s_lo = hi[order], lo[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (s_hi[1:] != s_hi[:-1]) | (s_lo[1:] != s_lo[:-1])
+        first_index, u_hi, u_lo = order[first], s_hi[first], s_lo[first]
+
+        new = ~(_sorted_contains(*self._main, u_hi, u_lo) | _sorted_contains(*self._recent, u_hi, u_lo))
+        first_index, u_hi, u_lo = first_index[new], u_hi[new], u_lo[new]
+        if self.max_entries is not None and len(self) + len(u_hi) > self.max_entries:
+            raise MemoryBudgetExceeded(f"{len(self) + len(u_hi)} digests (~{(len(self) + len(u_hi)) * DIGEST_ENTRY_BYTES} bytes) exceed the memory budget")
+        if len(u_hi):
+            self._recent = _sorted_insert(*self._recent, u_hi, u_lo)
+            if len(self._recent[0]) > max(RECENT_MERGE_MIN, len(self._main[0]) // 8):
+                self._main = _sorted_insert(*self._main, *self._recent)
+                empty = np.empty(0, dtype=np.uint64)
+                self._recent = (empty, empty)
+        is_new = np.zeros(len(hi), dtype=bool)
+        is_new[first_index] = True
+        return is_new
+
+    def add(self, digest):
+        """다이제스트 하나를 추가하고, 새로 추가되었으면 True를 반환한다. (여러 개는 add_batch가 훨씬 빠르다)"""
+        return bool(self.add_batch([digest])[0])
+
+def iter_new_in_batches(seen, items, digest_fn):
+    """items를 DIGEST_BATCH개씩 묶어 seen에 추가하고, 처음 등장한 항목만 원래 순서대로 내보낸다."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= DIGEST_BATCH:
+            yield from _new_items(seen, batch, digest_fn)
+            batch = []
+    if batch:
+        yield from _new_items(seen, batch, digest_fn)
+
+def _new_items(seen, batch, digest_fn):
+    is_new = seen.add_batch([digest_fn(item) for item in batch])
+    return [item for item, new in zip(batch, is_new.tolist()) if new]
+
+def iter_canonical_records(filename, show_progress=True):
+    """파일 하나를 읽어 (줄 번호, 정규화된 JSON 문자열)을 순서대로 내보낸다."""
+    with open_jsonl(filename, "r") as f:
+        lines = tqdm(f, desc=f"Reading {filename}") if show_progress else f
+        for line_no, line in enumerate(lines):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+                obj_ordered = reorder_keys(obj)
+            except json.JSONDecodeError:
+                print(f"[!] Failed to parse JSON in file {filename}: {line[:50]}...")
+                continue
+            yield line_no, json.dumps(obj_ordered, ensure_ascii=False)
+
+def iter_canonical_lines(files):
+    for filename in files:
+        for _, obj_str in iter_canonical_records(filename):
+            yield obj_str
+
+def partition_of(digest, num_partitions):
+    return int.from_bytes(digest[:4], "little") % num_partitions
+
+def _merge_with_digest_set(files, output_path, max_memory_bytes):
+    seen = DigestSet(max_bytes=max_memory_bytes)
+    with open_jsonl(output_path, "w") as fout:
+        for obj_str in iter_new_in_batches(seen, iter_canonical_lines(files), digest_of):
+            fout.write(obj_str + "\n")
+    return len(seen)
+
+# 파티션 파일의 각 줄은 "파일 인덱스\t줄 번호\t정규화된 JSON" 형식이다.
+# json.dumps 결과에는 탭/개행이 이스케이프되어 있으므로 구분자로 안전하다.
+def _line_digest(line):
+    return digest_of(line.rstrip("\n").split("\t", 2)[2])
+
+def _line_key(line):
+    file_idx, line_no, _ = line.split("\t", 2)
+    return int(file_idx), int(line_no)
+
+def _dedup_partition(part_paths, unique_path, max_memory_bytes=None, depth=0):
+    """
+    (파일 인덱스, 줄 번호) 순으로 정렬된 파티션 파일들을 차례로 읽어 첫 등장만 unique_path에 남긴다.
+    다이제스트 집합이 max_memory_bytes를 넘으면 이 파티션을 디스크에서 다시 나눠 처리한다.
+    """
+    # 다이제스트 앞 4바이트는 파티션 선택에 쓰였으므로, 하위 파티션은 그 다음 4바이트씩을 쓴다 (16바이트 안에서 최대 3단계)
+    budget = max_memory_bytes if depth < DIGEST_SIZE // 4 - 1 else None
+    seen = DigestSet(max_bytes=budget)
+    try:
+        with open(unique_path, "w", encoding="utf-8") as fout:
+            for part_path in part_paths:
+                if not os.path.exists(part_path):
+                    continue
+                with open(part_path, "r", encoding="utf-8") as fin:
+                    fout.writelines(iter_new_in_batches(seen, fin, _line_digest))
+    except MemoryBudgetExceeded as e:
+        seen = None  # 하위 파티션 처리 전에 집합을 해제한다
+        print(f"[*] {e}; splitting partition into {SUBPARTITIONS} sub-partitions")
+        unique_count = _dedup_subpartitions(part_paths, unique_path, max_memory_bytes, depth + 1)
+    else:
+        unique_count = len(seen)
+    for part_path in part_paths:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    return unique_count
+
+def _dedup_subpartitions(part_paths, unique_path, max_memory_bytes, depth):
+    """파티션을 다이제스트의 다음 4바이트로 다시 나눠 각각 중복 제거하고, (파일 인덱스, 줄 번호) 순으로 합친다."""
+    offset = 4 * depth
+    with tempfile.TemporaryDirectory(prefix="merge_sub_", dir=os.path.dirname(os.path.abspath(unique_path))) as tmp:
+        sub_paths = [os.path.join(tmp, f"sub_{i:02d}.tsv") for i in range(SUBPARTITIONS)]
+        sub_files = [open(p, "w", encoding="utf-8") for p in sub_paths]
+        try:
+            for part_path in part_paths:
+                if not os.path.exists(part_path):
+                    continue
+                with open(part_path, "r", encoding="utf-8") as fin:
+                    for line in fin:
+                        sub = int.from_bytes(_line_digest(line)[offset:offset + 4], "little") % SUBPARTITIONS
+                        sub_files[sub].write(line)
+        finally:
+            for f in sub_files:
+                f.close()
+
+        unique_count = 0
+        sub_unique_paths = []
+        for sub_path in sub_paths:
+            sub_unique_path = sub_path + ".unique"
+            unique_count += _dedup_partition([sub_path], sub_unique_path, max_memory_bytes, depth)
+            sub_unique_paths.append(sub_unique_path)
+
+        sub_unique_files = [open(p, "r", encoding="utf-8") for p in sub_unique_paths]
+        try:
+            with open(unique_path, "w", encoding="utf-8") as fout:
+                fout.writelines(heapq.merge(*sub_unique_files, key=_line_key))
+        finally:
+            for f in sub_unique_files:
+                f.close()
+    return unique_count
+
+def _write_in_first_occurrence_order(unique_paths, output_path):
+    """파티션별 결과를 (파일 인덱스, 줄 번호) 기준 k-way 병합하여 원래 첫 등장 순서로 기록한다."""
+    def keyed(f):
+        for line in f:
+            file_idx, line_no, obj_line = line.split("\t", 2)
+            yield (int(file_idx), int(line_no)), obj_line
+
+    unique_files = [open(p, "r", encoding="utf-8") for p in unique_paths]
+    try:
+        with open_jsonl(output_path, "w") as fout:
+            for _, obj_line in heapq.merge(*(keyed(f) for f in unique_files), key=lambda item: item[0]):
+                fout.write(obj_line)
+    finally:
+        for f in unique_files:
+            f.close()
+
+def _merge_external(files, output_path, num_partitions, temp_dir=None, max_memory_bytes=None):
+    """
+    디스크 기반 해시 파티션 중복 제거.
+    1) 각 레코드를 (파일 인덱스, 줄 번호, 정규화된 JSON)으로 해시 파티션 파일에 흩뿌리고
+    2) 파티션별로 첫 등장만 남긴 뒤
+    3) k-way 병합으로 원래 첫 등장 순서를 복원한다.
+    """
+    with tempfile.TemporaryDirectory(prefix="merge_unique_", dir=temp_dir) as tmp:
+        part_paths = [os.path.join(tmp, f"part_{i:04d}.tsv") for i in range(num_partitions)]
+        part_files = [open(p, "w", encoding="utf-8") for p in part_paths]
+        try:
+            for file_idx, filename in enumerate(files):
+                for line_no, obj_str in iter_canonical_records(filename):
+                    part = partition_of(digest_of(obj_str), num_partitions)
+                    part_files[part].write(f"{file_idx}\t{line_no}\t{obj_str}\n")
+        finally:
+            for f in part_files:
+                f.close()
+
+        unique_count = 0
+        unique_paths = []
+        for part_path in tqdm(part_paths, desc="Deduplicating partitions"):
+            unique_path = part_path + ".unique"
+            unique_count += _dedup_partition([part_path], unique_path, max_memory_bytes)
+            unique_paths.append(unique_path)
+
+        _write_in_first_occurrence_order(unique_paths, output_path)
+    return unique_count
+
+def _scatter_file_worker(args):
+    """리더 워커: 파일 하나를 파싱해 레코드를 해시 접두사 기준으로 파티션별 스풀 파일에 나눠 쓴다."""
+    file_idx, filename, tmp, num_partitions = args
+    part_files = {}
+    try:
+        for line_no, obj_str in iter_canonical_records(filename, show_progress=False):
+            part = partition_of(digest_of(obj_str), num_partitions)
+            if part not in part_files:
+                part_files[part] = open(os.path.join(tmp, f"file_{file_idx:05d}_part_{part:04d}.tsv"), "w", encoding="utf-8")
+            part_files[part].write(f"{file_idx}\t{line_no}\t{obj_str}\n")
+    finally:
+        for f in part_files.values():
+            f.close()
+    print(f"[*] Scattered {filename}")
+
+def _dedup_partition_worker(args):
+    part_paths, unique_path, max_memory_bytes = args
+    return _dedup_partition(part_paths, unique_path, max_memory_bytes)
+
+def _merge_parallel(files, output_path, num_workers, num_partitions, temp_dir=None, max_memory_bytes=None):
+    """
+    여러 입력 파일을 워커들이 동시에 읽어 해시 파티션으로 라우팅하고,
+    파티션 워커들이 각자 독립적으로 중복을 제거한 뒤 결과를 첫 등장 순서로 이어 붙인다.
+    max_memory_bytes는 동시에 도는 파티션 워커들이 나눠 쓴다.
+    """
+    worker_memory_bytes = max_memory_bytes // num_workers if max_memory_bytes else None
+    with tempfile.TemporaryDirectory(prefix="merge_unique_", dir=temp_dir) as tmp:
+        with multiprocessing.Pool(num_workers) as pool:
+            pool.map(_scatter_file_worker, [(i, f, tmp, num_partitions) for i, f in enumerate(files)], chunksize=1)
+
+            # 파티션별 스풀 파일을 파일 인덱스 순으로 넘겨 (파일 인덱스, 줄 번호) 순서를 유지한다
+            tasks = []
+            for part in range(num_partitions):
+                part_paths = [os.path.join(tmp, f"file_{i:05d}_part_{part:04d}.tsv") for i in range(len(files))]
+                tasks.append((part_paths, os.path.join(tmp, f"part_{part:04d}.unique"), worker_memory_bytes))
+            unique_count = sum(pool.map(_dedup_partition_worker, tasks, chunksize=1))
+
+        _write_in_first_occurrence_order([unique_path for _, unique_path, _ in tasks], output_path)
+    return unique_count
+
+def merge_jsonl_unique(files, output_file, max_memory_bytes=None, temp_dir=None, num_workers=1, num_partitions=None,
+                       shuffle=False, seed=None):
+    """
+    여러 JSONL 파일을 병합하면서 (prefix_code, target_code, suffix_code) 기준으로 중복을 제거한다.
+    중복 판정은 정규화된 JSON의 16바이트 해시로 하며, 해시 집합이 max_memory_bytes를
+    넘어서면 디스크 기반 해시 파티션 방식으로 다시 처리한다.
+    num_workers > 1이면 입력 파일을 병렬로 읽고 파티션별로 병렬 중복 제거한다. 이때 max_memory_bytes는
+    워커 수로 나눠 적용하고, 예산을 넘는 파티션은 디스크에서 다시 나눠 처리한다.
+    어느 방식이든 출력(첫 등장 순서)은 같다.
+    shuffle=True이면 병합 결과를 seed 기반 외부 셔플로 섞는다.
+    """
     output_path = Path(output_file)
 
-    with output_path.open("w", encoding="utf-8") as fout:
-        for filename in files:
-            with open(filename, "r", encoding="utf-8") as f:
-                for line in tqdm(f, desc=f"Reading {filename}"):
-                    line = line.strip()
-                    if not line:
-                        continue
-                    try:
-                        obj = json.loads(line)
-                        obj_ordered = reorder_keys(obj)
-                    except json.JSONDecodeError:
-                        print(f"[!] Failed to parse JSON in file {filename}: {line[:50]}...")
-                        continue
-                    obj_str = json.dumps(obj_ordered, ensure_ascii=False)
-                    if obj_str not in seen:
-                        seen.add(obj_str)
-                        fout.write(obj_str + "\n")
-
-    print(f"[*] Merged {len(files)} files with unique samples saved to {output_file}")
+    if num_workers > 1:
+        num_partitions = num_partitions or num_workers * 4
+        unique_count = _merge_parallel(files, output_path, num_workers, num_partitions, temp_dir, max_memory_bytes)
+    else:
+        try:
+            unique_count = _merge_with_digest_set(files, output_path, max_memory_bytes)
+        except MemoryBudgetExceeded as e:
+            total_bytes = sum(os.path.getsize(f) for f in files)
+            num_partitions = num_partitions or max(16, (2 * total_bytes) // max_memory_bytes + 1)
+            print(f"[*] {e}; falling back to external dedup with {num_partitions} partitions")
+            unique_count = _merge_external(files, output_path, num_partitions, temp_dir, max_memory_bytes)
+
+    print(f"[*] Merged {len(files)} files with {unique_count} unique samples saved to {output_file}")
+
+    if shuffle:
+        external_shuffle_jsonl(output_file, output_file, seed=seed,
+                               max_memory_bytes=max_memory_bytes or DEFAULT_SHUFFLE_MEMORY_BYTES, temp_dir=temp_dir)
 
 if __name__ == "__main__":
     input_files = [
@@ -40,4 +358,4 @@ if __name__ == "__main__":
         "merged_unique5.jsonl",
     ]
     output_file = 'merged_unique6.jsonl'
-    merge_jsonl_unique(input_files, output_file)
+    merge_jsonl_unique(input_files, output_file, max_memory_bytes=2 * 1024 ** 3)
@@ -0,0 +1,159 @@
+import json
+import multiprocessing
+import os
+from collections import deque
+
+from jsonl_io import is_compressed, open_jsonl
+
+# orjson이 설치되어 있으면 더 빠른 파서를 사용하고, 없으면 표준 json으로 동작한다.
+try:
+    import orjson
+    _loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    _loads = json.loads
+    JSON_BACKEND = "json"
+
+DEFAULT_CHUNK_BYTES = 8 * 1024 * 1024
+
+
+def split_newline_aligned_ranges(path, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    파일을 약 chunk_bytes 크기의 [start, end) 바이트 범위로 나눈다.
+    각 경계는 다음 개행 직후로 맞춰지므로 어떤 라인도 두 범위에 걸치지 않는다.
+    """
+    size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, "rb") as f:
+        pos = chunk_bytes
+        while pos < size:
+            f.seek(pos)
+            f.readline()
+            boundary = f.tell()
+            if boundary >= size:
+                break
+            boundaries.append(boundary)
+            pos = boundary + chunk_bytes
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+
+def iter_newline_aligned_blocks(path, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    (압축 파일처럼) 임의 위치로 이동할 수 없는 파일을 순차적으로 읽어
+    약 chunk_bytes 크기의 개행 정렬된 (시작 오프셋, 바이트 블록)을 내보낸다. 오프셋은 압축 해제 기준이다.
+    """
+    offset = 0
+    with open_jsonl(path, "rb") as f:
+        while True:
+            block = f.read(chunk_bytes)
+            if not block:
+                break
+            if not block.endswith(b"\n"):
+                block += f.readline()
+            yield offset, block
+            offset += len(block)
+
+
+def _parse_range(path, start, end, transform=None):
+    """
+    워커: [start, end) 범위의 라인들을 파싱하여 (레코드 목록, 파싱한 레코드 수, 잘못된 라인 수, 첫 오류 메시지)를 반환한다.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return _parse_block(start, data, transform)
+
+
+def _parse_block(start, data, transform=None):
+    """
+    워커: start 오프셋에서 시작하는 바이트 블록의 라인들을 파싱한다.
+    transform이 있으면 레코드마다 적용하고, 그 결과 목록을 이어 붙여 레코드 대신 반환한다.
+    """
+    records = []
+    malformed = 0
+    first_error = None
+    line_start = start
+    for line in data.split(b"\n"):
+        offset = line_start
+        line_start += len(line) + 1
+        if not line.strip():
+            continue
+        try:
+            records.append(_loads(line))
+        except ValueError as e:  # json.JSONDecodeError, orjson.JSONDecodeError 모두 ValueError의 하위 클래스
+            malformed += 1
+            if first_error is None:
+                first_error = f"byte offset {offset}: {e}"
+    parsed = len(records)
+    if transform is not None:
+        records = [out for record in records for out in transform(record)]
+    return records, parsed, malformed, first_error
+
+
+class JsonlReader:
+    """
+    JSONL 파일을 개행 기준 바이트 범위로 나누어 워커 프로세스에서 병렬로 파싱하는 공용 리더.
+    레코드 배치는 파일 순서대로 나오며, 파싱할 수 없는 라인은 건너뛰고 malformed_count에 센다.
+    .gz / .zst 파일은 메인 프로세스가 순차적으로 압축을 풀고, 블록 파싱만 워커에 맡긴다.
+    transform(record) -> list를 주면 워커가 파싱 직후 레코드마다 적용하고, 레코드 대신 그 결과들을 내보낸다.
+    (워커 프로세스로 넘어가야 하므로 transform은 모듈 최상위 함수여야 한다)
+
+    사용 예:
+        reader = JsonlReader("data.jsonl", num_workers=8)
+        for obj in reader:
+            ...
+        reader.report()
+    """
+    def __init__(self, path, num_workers=None, chunk_bytes=DEFAULT_CHUNK_BYTES, transform=None):
+        self.path = str(path)
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.chunk_bytes = chunk_bytes
+        self.transform = transform
+        self.record_count = 0
+        self.malformed_count = 0
+        self.first_error = None
+
+    def _collect(self, result):
+        records, parsed, malformed, first_error = result
+        self.record_count += parsed
+        self.malformed_count += malformed
+        if self.first_error is None:
+            self.first_error = first_error
+        return records
+
+    def _tasks(self):
+        """(워커 함수, 인자) 목록. 일반 파일은 워커가 직접 범위를 읽고, 압축 파일은 블록을 넘겨준다."""
+        if is_compressed(self.path):
+            return ((_parse_block, (*block, self.transform)) for block in iter_newline_aligned_blocks(self.path, self.chunk_bytes))
+        ranges = split_newline_aligned_ranges(self.path, self.chunk_bytes)
+        return [(_parse_range, (self.path, start, end, self.transform)) for start, end in ranges]
+
+    def iter_batches(self):
+        """파일 순서대로 레코드 배치(list)를 내보낸다. 동시에 처리 중인 범위는 워커 수의 2배로 제한된다."""
+        tasks = self._tasks()
+        num_workers = self.num_workers
+        if isinstance(tasks, list):
+            num_workers = min(num_workers, len(tasks))
+
+        if num_workers <= 1:
+            for func, args in tasks:
+                yield self._collect(func(*args))
+            return
+
+        with multiprocessing.Pool(num_workers) as pool:
+            pending = deque()
+            for func, args in tasks:
+                pending.append(pool.apply_async(func, args))
+                if len(pending) >= num_workers * 2:
+                    yield self._collect(pending.popleft().get())
+            while pending:
+                yield self._collect(pending.popleft().get())
+
+    def __iter__(self):
+        for batch in self.iter_batches():
+            yield from batch
+
+    def report(self):
+        if self.malformed_count:
+            print(f"[!] Skipped {self.malformed_count} malformed lines in {self.path} (first: {self.first_error})")
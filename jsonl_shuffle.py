@@ -0,0 +1,85 @@
+import os
+import random
+import tempfile
+from tqdm import tqdm
+
+from jsonl_io import compression_of, is_compressed, open_jsonl
+
+DEFAULT_SHUFFLE_MEMORY_BYTES = 1024 ** 3  # 1GB
+# 버킷 하나를 메모리에 올릴 때 파이썬 객체 오버헤드를 감안한 배수
+MEMORY_OVERHEAD_FACTOR = 2
+# 압축된 입력의 해제 후 크기 추정 배수 (추정이 작더라도 큰 버킷은 다시 나뉘므로 결과에는 영향 없음)
+COMPRESSION_RATIO_ESTIMATE = 5
+
+def _shuffle_in_memory(input_path, output_file, rng):
+    with open_jsonl(input_path, "rb") as f:
+        lines = [line if line.endswith(b"\n") else line + b"\n" for line in f if line.strip()]
+    rng.shuffle(lines)
+    output_file.writelines(lines)
+    return len(lines)
+
+def _shuffle_into(input_path, output_file, rng, max_memory_bytes, temp_dir):
+    """
+    input_path를 셔플하여 이미 열린 output_file에 이어 쓴다.
+    파일이 메모리 예산 안에 들어오면 메모리에서 셔플하고, 아니면 무작위 버킷으로 흩뿌린 뒤
+    버킷마다 재귀적으로 셔플한다. 기록한 라인 수를 반환한다.
+    """
+    total_bytes = os.path.getsize(input_path)
+    if is_compressed(input_path):
+        total_bytes *= COMPRESSION_RATIO_ESTIMATE
+    if total_bytes * MEMORY_OVERHEAD_FACTOR <= max_memory_bytes:
+        return _shuffle_in_memory(input_path, output_file, rng)
+
+    num_buckets = (total_bytes * MEMORY_OVERHEAD_FACTOR) // max_memory_bytes + 1
+    # 버킷별 쓰기 버퍼 합계가 메모리 예산의 절반을 넘지 않도록 제한
+    bucket_buffer = max(64 * 1024, min(1024 * 1024, max_memory_bytes // (2 * num_buckets)))
+
+    written = 0
+    with tempfile.TemporaryDirectory(prefix="shuffle_", dir=temp_dir) as tmp:
+        bucket_paths = [os.path.join(tmp, f"bucket_{i:05d}.jsonl") for i in range(num_buckets)]
+        bucket_files = [open(p, "wb", buffering=bucket_buffer) for p in bucket_paths]
+        bucket_counts = [0] * num_buckets
+        try:
+            with open_jsonl(input_path, "rb") as fin:
+                for line in tqdm(fin, desc=f"Scattering {input_path} into {num_buckets} buckets"):
+                    if not line.strip():
+                        continue
+                    if not line.endswith(b"\n"):
+                        line += b"\n"
+                    bucket = rng.randrange(num_buckets)
+                    bucket_files[bucket].write(line)
+                    bucket_counts[bucket] += 1
+        finally:
+            for f in bucket_files:
+                f.close()
+
+        total_lines = sum(bucket_counts)
+        for bucket_path, bucket_count in zip(bucket_paths, bucket_counts):
+            if bucket_count == total_lines:
+                # 모든 라인이 한 버킷에 몰린 경우(예: 예산보다 큰 단일 라인) 더 나눌 수 없으므로 메모리에서 셔플
+                written += _shuffle_in_memory(bucket_path, output_file, rng)
+            else:
+                written += _shuffle_into(bucket_path, output_file, rng, max_memory_bytes, temp_dir)
+            os.remove(bucket_path)
+    return written
+
+def external_shuffle_jsonl(input_file, output_file, seed=None, max_memory_bytes=DEFAULT_SHUFFLE_MEMORY_BYTES, temp_dir=None):
+    """
+    메모리에 다 올라가지 않는 JSONL 파일을 셔플한다.
+    한 번의 버퍼링된 패스로 라인을 무작위 디스크 버킷에 흩뿌린 뒤, 각 버킷을 메모리에서 셔플하여 이어 쓴다.
+    같은 seed와 입력이면 항상 같은 결과가 나오며, input_file과 output_file이 같아도 된다.
+    temp_dir은 버킷 파일에만 쓰인다. 완성된 출력은 os.replace로 옮길 수 있도록 항상 출력 파일과 같은 디렉터리에서 만든다.
+    """
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory(prefix="shuffle_out_", dir=os.path.dirname(os.path.abspath(output_file))) as tmp:
+        # 출력 확장자(.gz / .zst)를 유지해 open_jsonl이 같은 형식으로 압축하도록 한다
+        tmp_output = os.path.join(tmp, "shuffled" + {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}.get(compression_of(output_file), ".jsonl"))
+        with open_jsonl(tmp_output, "wb") as fout:
+            written = _shuffle_into(input_file, fout, rng, max_memory_bytes, temp_dir)
+        os.replace(tmp_output, output_file)
+
+    print(f"[*] Shuffled {written} records (seed={seed}) into {output_file}")
+    return written
+
+if __name__ == "__main__":
+    external_shuffle_jsonl("merged_unique6.jsonl", "merged_unique6_shuffled.jsonl", seed=42)
@@ -0,0 +1,119 @@
+import json
+import time
+from tqdm import tqdm
+
+from jsonl_io import open_jsonl
+
+from completion_processing.move_import import adjust_imports_in_prefix
+from completion_processing.reformat_fim_data_for_training import convert_record_to_training_format
+from data_processing.extractcode import extract_content_record
+from prompt_processing.enter_remove import normalize_assistant_message
+from prompt_processing.jsonl_code_extractor import extract_code_records
+
+# 레코드 단위 변환 함수 레지스트리 (이름 -> 함수)
+# 변환 함수는 dict 하나를 받아 dict(그대로 전달), list(여러 레코드로 분할) 또는 None(드롭)을 반환한다.
+TRANSFORMS = {}
+
+def register_transform(name):
+    def decorator(func):
+        TRANSFORMS[name] = func
+        return func
+    return decorator
+
+@register_transform("extract_content")
+def _extract_content(record):
+    return extract_content_record(record)
+
+@register_transform("adjust_imports")
+def _adjust_imports(record):
+    return adjust_imports_in_prefix(record)
+
+@register_transform("fim_training_format")
+def _fim_training_format(record):
+    return convert_record_to_training_format(record)
+
+@register_transform("normalize_spacing")
+def _normalize_spacing(record):
+    normalize_assistant_message(record)
+    return record
+
+@register_transform("extract_code_blocks")
+def _extract_code_blocks(record):
+    return extract_code_records(record)
+
+def _new_stats(transform_names):
+    return {name: {"in": 0, "out": 0, "dropped": 0, "errors": 0, "seconds": 0.0} for name in transform_names}
+
+def apply_transforms(record, transform_names, stats):
+    """
+    레코드 하나에 변환 체인을 순서대로 적용하고, 최종 레코드 목록을 반환한다.
+    """
+    records = [record]
+    for name in transform_names:
+        transform = TRANSFORMS[name]
+        stat = stats[name]
+        next_records = []
+        start = time.perf_counter()
+        for rec in records:
+            stat["in"] += 1
+            try:
+                result = transform(rec)
+            except Exception as e:
+                stat["errors"] += 1
+                print(f"[!] Transform '{name}' failed: {e}")
+                continue
+            if result is None:
+                stat["dropped"] += 1
+            elif isinstance(result, list):
+                if not result:
+                    stat["dropped"] += 1
+                next_records.extend(result)
+            else:
+                next_records.append(result)
+        stat["seconds"] += time.perf_counter() - start
+        stat["out"] += len(next_records)
+        records = next_records
+        if not records:
+            break
+    return records
+
+def run_transform_chain(input_file, output_file, transform_names):
+    """
+    입력 JSONL을 한 번만 파싱하고, 등록된 변환들을 체인으로 적용한 뒤 한 번만 직렬화해 저장한다.
+    변환별 처리 시간과 드롭 수를 담은 통계를 반환한다.
+    """
+    unknown = [name for name in transform_names if name not in TRANSFORMS]
+    if unknown:
+        raise ValueError(f"Unknown transforms: {unknown}. Available: {sorted(TRANSFORMS)}")
+
+    stats = _new_stats(transform_names)
+    read_count = 0
+    written_count = 0
+
+    with open_jsonl(input_file, "r") as fin, open_jsonl(output_file, "w") as fout:
+        for line_num, line in enumerate(tqdm(fin, desc=f"Transforming {input_file}"), 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"[!] Failed to parse JSON at line {line_num}: {e}")
+                continue
+            read_count += 1
+            for out_record in apply_transforms(record, transform_names, stats):
+                fout.write(json.dumps(out_record, ensure_ascii=False) + "\n")
+                written_count += 1
+
+    print(f"[*] {read_count} records in, {written_count} records out -> {output_file}")
+    for name in transform_names:
+        s = stats[name]
+        print(f"    - {name}: in={s['in']} out={s['out']} dropped={s['dropped']} errors={s['errors']} time={s['seconds']:.2f}s")
+    return stats
+
+if __name__ == "__main__":
+    # 예: move_import -> reformat_fim_data_for_training 을 한 번의 읽기/쓰기로 처리
+    run_transform_chain(
+        "output_fim_sentence.jsonl",
+        "short_train.jsonl",
+        ["adjust_imports", "fim_training_format"],
+    )
@@ -0,0 +1,193 @@
+import logging
+import time
+from itertools import islice
+
+from prompt_processing.anthropic_engine import BATCH_PRICE_FACTOR, BudgetExceeded, estimate_tokens, message_text, usage_tokens
+from prompt_processing.llm_cache import cache_key
+
+logger = logging.getLogger(__name__)
+
+# Message Batches API 한 배치당 최대 요청 수는 100,000개이지만, 결과를 빨리 받기 위해 더 작게 나눈다.
+DEFAULT_MAX_BATCH_REQUESTS = 10000
+DEFAULT_POLL_INTERVAL = 30.0
+# 다시 보내도 결과가 같을 오류 유형은 재시도하지 않는다.
+NON_RETRYABLE_ERRORS = {"invalid_request_error", "authentication_error", "permission_error", "not_found_error"}
+
+
+def _result_error_type(result):
+    """errored 결과의 오류 유형 (예: "overloaded_error"). 알 수 없으면 None."""
+    error = getattr(result, "error", None)
+    inner = getattr(error, "error", error)
+    return getattr(inner, "type", None)
+
+
+class AnthropicBatchRunner:
+    """
+    Message Batches API로 프롬프트를 모아 제출하고, 완료될 때까지 폴링한 뒤 custom_id로 결과를 돌려주는 실행기.
+    errored / expired / canceled 결과는 새 배치로 다시 제출하며, max_attempts번 안에 성공하지 못하면 빈 문자열을 돌려준다.
+    클라이언트의 base_url(ANTHROPIC_BASE_URL)을 바꾸면 로컬 스텁 서버로도 그대로 동작한다.
+    cache(LLMResponseCache)가 주어지면 캐시에 있는 요청은 제출하지 않고, 받은 응답은 캐시에 저장한다.
+    budget(TokenBudget)이 주어지면 제출 전에 배치 가격으로 예산을 예약하고, 모자라면 제출하지 않고 BudgetExceeded를 던진다.
+    telemetry(LLMTelemetry)가 주어지면 배치별 완료 시간과 요청별 토큰/재시도를 기록한다.
+    """
+    def __init__(self, client, model, max_tokens, temperature=0.0, poll_interval=DEFAULT_POLL_INTERVAL,
+                 max_batch_requests=DEFAULT_MAX_BATCH_REQUESTS, max_attempts=3, cache=None, budget=None, telemetry=None):
+        self.client = client
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.poll_interval = poll_interval
+        self.max_batch_requests = max_batch_requests
+        self.max_attempts = max_attempts
+        self.cache = cache
+        self.budget = budget
+        self.telemetry = telemetry
+
+    def _cache_key(self, prompt, system_prompt):
+        return cache_key(self.model, system_prompt, prompt, {"max_tokens": self.max_tokens, "temperature": self.temperature})
+
+    def _submit(self, prompts):
+        """prompts(custom_id -> (prompt, system_prompt))를 배치 하나로 제출하고 배치 ID를 반환한다."""
+        batch = self.client.messages.batches.create(requests=[
+            {
+                "custom_id": custom_id,
+                "params": {
+                    "model": self.model,
+                    "max_tokens": self.max_tokens,
+                    "temperature": self.temperature,
+                    "system": system_prompt,
+                    "messages": [{"role": "user", "content": prompt}],
+                },
+            }
+            for custom_id, (prompt, system_prompt) in prompts.items()
+        ])
+        logger.info(f"Submitted message batch {batch.id} with {len(prompts)} requests.")
+        return batch.id
+
+    def _wait(self, batch_id):
+        while True:
+            batch = self.client.messages.batches.retrieve(batch_id)
+            if batch.processing_status == "ended":
+                return batch
+            counts = getattr(batch, "request_counts", None)
+            logger.info(f"Batch {batch_id} is {batch.processing_status} "
+                        f"(processing: {getattr(counts, 'processing', '?')}, succeeded: {getattr(counts, 'succeeded', '?')}). "
+                        f"Polling again in {self.poll_interval:.0f} seconds...")
+            time.sleep(self.poll_interval)
+
+    def _collect(self, batch_id, texts, retry_ids, usages, attempt=0):
+        """끝난 배치의 결과를 texts에 채우고, 다시 보낼 custom_id를 retry_ids에, 토큰 사용량을 usages에 모은다."""
+        for entry in self.client.messages.batches.results(batch_id):
+            result = entry.result
+            if result.type == "succeeded":
+                texts[entry.custom_id] = message_text(result.message)
+                usages[entry.custom_id] = usage_tokens(result.message)
+                if self.telemetry is not None:
+                    self.telemetry.record_call(input_tokens=usages[entry.custom_id][0], output_tokens=usages[entry.custom_id][1],
+                                               retries=attempt, price_factor=BATCH_PRICE_FACTOR)
+                continue
+            error_type = _result_error_type(result) if result.type == "errored" else result.type
+            if error_type in NON_RETRYABLE_ERRORS:
+                logger.error(f"Batch request {entry.custom_id} failed with {error_type}. Not retrying.")
+                texts[entry.custom_id] = ""
+                if self.telemetry is not None:
+                    self.telemetry.record_call(retries=attempt, failed=True)
+            else:
+                retry_ids.append(entry.custom_id)
+
+    def _reserve(self, prompts):
+        """제출할 요청 전체의 예산을 예약한다. 하나라도 모자라면 모두 풀고 BudgetExceeded를 던진다."""
+        reservations = {}
+        if self.budget is None:
+            return reservations
+        try:
+            for custom_id, (prompt, system_prompt) in prompts.items():
+                reservations[custom_id] = self.budget.reserve(
+                    estimate_tokens(system_prompt) + estimate_tokens(prompt), self.max_tokens, BATCH_PRICE_FACTOR)
+        except BudgetExceeded:
+            for reservation in reservations.values():
+                self.budget.settle(reservation)
+            raise
+        return reservations
+
+    def run(self, prompts):
+        """
+        prompts(custom_id -> (prompt, system_prompt))를 배치로 처리하여 custom_id -> 완성 텍스트 dict를 반환한다.
+        max_batch_requests보다 많으면 여러 배치로 나누어 한꺼번에 제출한 뒤 함께 기다린다.
+        """
+        texts = {}
+        remaining = dict(prompts)
+        if self.cache is not None:
+            for custom_id, (prompt, system_prompt) in prompts.items():
+                cached = self.cache.get(self._cache_key(prompt, system_prompt))
+                if cached is not None:
+                    if self.telemetry is not None:
+                        self.telemetry.record_cache_hit()
+                    texts[custom_id] = cached
+                    del remaining[custom_id]
+        reservations = self._reserve(remaining)
+        usages = {}
+        try:
+            for attempt in range(self.max_attempts):
+                if not remaining:
+                    break
+                items = iter(remaining.items())
+                batch_ids = []
+                submitted_at = time.perf_counter()
+                while True:
+                    part = dict(islice(items, self.max_batch_requests))
+                    if not part:
+                        break
+                    batch_ids.append((self._submit(part), len(part)))
+
+                retry_ids = []
+                for batch_id, size in batch_ids:
+                    self._wait(batch_id)
+                    if self.telemetry is not None:
+                        self.telemetry.record_batch(time.perf_counter() - submitted_at, size)
+                    self._collect(batch_id, texts, retry_ids, usages, attempt)
+                if self.cache is not None:
+                    for custom_id in remaining:
+                        if texts.get(custom_id):
+                            self.cache.put(self._cache_key(*remaining[custom_id]), texts[custom_id])
+                # 결과에 아예 나오지 않은 요청도 실패로 보고 다시 보낸다
+                seen = set(retry_ids)
+                retry_ids.extend(custom_id for custom_id in remaining if custom_id not in texts and custom_id not in seen)
+
+                remaining = {custom_id: remaining[custom_id] for custom_id in retry_ids}
+                if remaining:
+                    logger.warning(f"{len(remaining)} batch requests failed. (Attempt {attempt + 1}/{self.max_attempts})")
+        finally:
+            for custom_id, reservation in reservations.items():
+                self.budget.settle(reservation, *usages.get(custom_id, (0, 0)))
+
+        if remaining:
+            logger.error(f"Failed to get {len(remaining)} batch completions after {self.max_attempts} attempts.")
+            for custom_id in remaining:
+                texts[custom_id] = ""
+                if self.telemetry is not None:
+                    self.telemetry.record_call(retries=self.max_attempts - 1, failed=True)
+        return texts
+
+    def map_documents(self, docs, build_requests, system_prompt, docs_per_batch=500):
+        """
+        docs를 docs_per_batch개씩 묶어 배치로 처리하고, 입력 순서대로 (doc, requests, responses)를 내보낸다.
+
+        build_requests(doc)는 (custom_id, prompt, ...) 튜플 목록을 반환한다 (처리할 내용이 없으면 None).
+        custom_id가 None인 항목은 제출하지 않고 그대로 돌려준다 (예: 중복 제거로 응답을 재사용하는 청크).
+        responses는 그 문서의 custom_id -> 완성 텍스트 dict이며, requests가 None이면 responses도 None이다.
+        """
+        docs = iter(docs)
+        while True:
+            group = list(islice(docs, docs_per_batch))
+            if not group:
+                return
+            per_doc = [build_requests(doc) for doc in group]
+            prompts = {request[0]: (request[1], system_prompt)
+                       for requests in per_doc if requests for request in requests if request[0] is not None}
+            texts = self.run(prompts) if prompts else {}
+            for doc, requests in zip(group, per_doc):
+                if requests is None:
+                    yield doc, None, None
+                else:
+                    yield doc, requests, {request[0]: texts.get(request[0], "") for request in requests if request[0] is not None}
@@ -0,0 +1,368 @@
+import datetime
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import anthropic
+
+from prompt_processing.llm_cache import cache_key
+
+logger = logging.getLogger(__name__)
+
+
+# 모델별 가격 (USD / 100만 토큰, 입력, 출력). 없는 모델은 비용 예산을 적용하지 않는다.
+MODEL_PRICES = {
+    "claude-3-haiku-20240307": (0.25, 1.25),
+    "claude-3-5-haiku-20241022": (0.80, 4.00),
+    "claude-3-5-sonnet-20241022": (3.00, 15.00),
+    "claude-3-opus-20240229": (15.00, 75.00),
+}
+BATCH_PRICE_FACTOR = 0.5  # Message Batches API는 50% 할인
+
+# BPE 토크나이저가 대체로 하나의 토큰으로 묶는 조각: 앞 공백을 포함한 단어/숫자, 공백·들여쓰기 묶음, 그 외 문자 하나
+_TOKEN_PIECE = re.compile(r" ?[A-Za-z]+| ?[0-9]{1,3}|\s+|[^\sA-Za-z0-9]")
+_LONG_WORD_CHARS = 8  # 긴 식별자는 이 길이마다 토큰 하나가 더 든다고 본다
+
+
+def _piece_tokens(piece):
+    if piece[-1].isascii() and piece[-1].isalpha():
+        return (len(piece) + _LONG_WORD_CHARS - 1) // _LONG_WORD_CHARS
+    return 1
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    API 호출 없이 계산하는 대략적인 토큰 수. 코드/영문 기준으로 실제보다 약간 많게 잡히도록 조각 단위로 센다.
+    레이트 리미터 예약, 요청 전 크기 검사, 예산 예약에 사용한다.
+    """
+    return max(1, sum(_piece_tokens(m.group()) for m in _TOKEN_PIECE.finditer(text)))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """estimate_tokens 기준으로 max_tokens를 넘지 않도록 text의 앞부분만 남긴다."""
+    total = 0
+    for m in _TOKEN_PIECE.finditer(text):
+        total += _piece_tokens(m.group())
+        if total > max_tokens:
+            return text[:m.start()]
+    return text
+
+
+def cost_of(model, input_tokens, output_tokens, price_factor=1.0):
+    """MODEL_PRICES 기준 요청 비용(USD). 가격을 모르는 모델은 0."""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return 0.0
+    input_price, output_price = prices
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000 * price_factor
+
+
+class BudgetExceeded(Exception):
+    """실행 단위 토큰/비용 예산을 다 써서 더 이상 요청을 보낼 수 없음."""
+
+
+class TokenBudget:
+    """
+    한 번의 실행에서 쓸 수 있는 토큰 수와 비용(USD)의 상한. 0 또는 None이면 제한하지 않는다.
+    요청 전에 (추정 입력 + max_tokens 출력)만큼 예약하고, 응답을 받으면 실제 usage로 정산하므로
+    동시에 여러 요청이 진행 중이어도 예산을 넘겨 보내지 않는다. 넘게 되면 BudgetExceeded를 던진다.
+    """
+    def __init__(self, model, max_tokens=None, max_cost_usd=None):
+        self.max_tokens = max_tokens or None
+        self.max_cost_usd = max_cost_usd or None
+        self.model = model
+        self.prices = MODEL_PRICES.get(model)
+        if self.max_cost_usd and self.prices is None:
+            logger.warning(f"No price known for model '{model}'. The cost budget will not be enforced.")
+        self.reserved_tokens = 0
+        self.reserved_cost = 0.0
+        self.used_input_tokens = 0
+        self.used_output_tokens = 0
+        self.used_cost = 0.0
+        self._lock = threading.Lock()
+
+    def cost_of(self, input_tokens, output_tokens, price_factor=1.0):
+        return cost_of(self.model, input_tokens, output_tokens, price_factor)
+
+    def reserve(self, input_tokens, output_tokens, price_factor=1.0):
+        """예약 정보를 반환한다. 예산을 넘으면 BudgetExceeded."""
+        tokens = input_tokens + output_tokens
+        cost = self.cost_of(input_tokens, output_tokens, price_factor)
+        with self._lock:
+            used_tokens = self.used_input_tokens + self.used_output_tokens + self.reserved_tokens
+            if self.max_tokens and used_tokens + tokens > self.max_tokens:
+                raise BudgetExceeded(f"token budget of {self.max_tokens} reached ({used_tokens} used or reserved)")
+            if self.max_cost_usd and self.prices and self.used_cost + self.reserved_cost + cost > self.max_cost_usd:
+                raise BudgetExceeded(f"cost budget of ${self.max_cost_usd:.2f} reached (${self.used_cost + self.reserved_cost:.4f} used or reserved)")
+            self.reserved_tokens += tokens
+            self.reserved_cost += cost
+        return tokens, cost, price_factor
+
+    def settle(self, reservation, input_tokens=0, output_tokens=0):
+        """예약을 풀고 실제 사용량을 더한다. 실패한 요청은 사용량 0으로 정산한다."""
+        tokens, cost, price_factor = reservation
+        with self._lock:
+            self.reserved_tokens -= tokens
+            self.reserved_cost -= cost
+            self.used_input_tokens += input_tokens
+            self.used_output_tokens += output_tokens
+            self.used_cost += self.cost_of(input_tokens, output_tokens, price_factor)
+
+    def report(self):
+        logger.info(f"Run budget: {self.used_input_tokens} input + {self.used_output_tokens} output tokens used "
+                    f"(limit {self.max_tokens or 'none'}), ${self.used_cost:.4f} spent (limit {self.max_cost_usd or 'none'}).")
+
+
+def until_budget_exhausted(results):
+    """results를 그대로 내보내다가 BudgetExceeded가 나면 경고를 남기고 깔끔하게 멈춘다."""
+    try:
+        yield from results
+    except BudgetExceeded as e:
+        logger.warning(f"Run budget exhausted: {e}. Stopping; remaining documents will be processed in the next run.")
+
+
+def usage_tokens(message):
+    """응답의 usage에서 (입력 토큰, 출력 토큰)을 읽는다. 없으면 (0, 0)."""
+    usage = getattr(message, "usage", None)
+    return getattr(usage, "input_tokens", 0) or 0, getattr(usage, "output_tokens", 0) or 0
+
+
+def message_text(message) -> str:
+    """Messages API 응답의 content 블록들을 하나의 문자열로 합친다."""
+    if isinstance(message.content, list):
+        return "".join(getattr(block, "text", str(block)) for block in message.content)
+    return str(message.content)
+
+
+def _parse_reset(value):
+    """anthropic-ratelimit-*-reset 헤더(RFC 3339)를 남은 초로 변환한다."""
+    if not value:
+        return None
+    try:
+        reset_at = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return max(0.0, (reset_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    """
+    분당 capacity만큼 일정하게 채워지는 토큰 버킷.
+    서버가 알려준 잔여량/리셋 시각으로 현재 잔량을 보정할 수 있다.
+    """
+    def __init__(self, capacity_per_minute):
+        self.capacity = float(capacity_per_minute)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        if now <= self.updated_at:
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.capacity / 60.0)
+        self.updated_at = now
+
+    def wait_time(self, amount, now):
+        """amount를 꺼내기까지 기다려야 하는 초. 0이면 바로 꺼낼 수 있다."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60.0 / self.capacity
+
+    def take(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+    def observe(self, limit, remaining, reset_seconds, now):
+        if limit:
+            self.capacity = float(limit)
+        if remaining is not None:
+            self._refill(now)
+            self.tokens = min(self.tokens, float(remaining))
+            if remaining == 0 and reset_seconds:
+                # 서버 기준으로 소진되었으면 리셋 시각까지 다시 채워지지 않도록 한다
+                self.updated_at = now + reset_seconds
+
+
+class AdaptiveRateLimiter:
+    """
+    분당 요청 수(RPM)와 분당 입력 토큰 수(ITPM)를 함께 제한하는 레이트 리미터.
+    응답의 anthropic-ratelimit-* 헤더로 버킷을 보정하고, 429 응답의 retry-after 동안 전체 요청을 멈춘다.
+    """
+    def __init__(self, requests_per_minute=50, tokens_per_minute=50000):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, estimated_tokens):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = max(self.paused_until - now,
+                           self.requests.wait_time(1, now),
+                           self.tokens.wait_time(estimated_tokens, now))
+                if wait <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(estimated_tokens)
+                    return
+            time.sleep(min(wait, 5.0))
+
+    def observe_headers(self, headers):
+        if not headers:
+            return
+
+        def header_int(name):
+            value = headers.get(name)
+            try:
+                return int(value) if value is not None else None
+            except ValueError:
+                return None
+
+        with self._lock:
+            now = time.monotonic()
+            self.requests.observe(header_int("anthropic-ratelimit-requests-limit"),
+                                  header_int("anthropic-ratelimit-requests-remaining"),
+                                  _parse_reset(headers.get("anthropic-ratelimit-requests-reset")), now)
+            self.tokens.observe(header_int("anthropic-ratelimit-input-tokens-limit"),
+                                header_int("anthropic-ratelimit-input-tokens-remaining"),
+                                _parse_reset(headers.get("anthropic-ratelimit-input-tokens-reset")), now)
+
+    def pause(self, seconds):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def _is_retryable(error):
+    """
+    429(rate limit)와 5xx(500, 503, 529 overloaded 등) 응답, 연결 오류와 타임아웃(APIConnectionError)은 재시도한다.
+    SDK 버전마다 예외 클래스가 달라 상태 코드로 판단한다.
+    """
+    if isinstance(error, anthropic.APIConnectionError):
+        return True
+    status = getattr(error, "status_code", None)
+    return isinstance(error, anthropic.APIStatusError) and status is not None and (status == 429 or status >= 500)
+
+
+def _retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class AnthropicRequestEngine:
+    """
+    동시에 최대 max_in_flight개의 Messages API 요청을 보내는 스레드 안전한 요청 엔진.
+    모든 요청은 공유 AdaptiveRateLimiter를 거치며, 429/5xx 응답과 연결 오류·타임아웃은 retry-after(없으면 지수 백오프)만큼
+    전체 요청을 멈춘 뒤 재시도한다. cache(LLMResponseCache)가 주어지면 같은 요청은 API를 호출하지 않는다.
+    budget(TokenBudget)이 주어지면 요청 전에 예산을 예약하고, 다 쓰면 BudgetExceeded를 던진다.
+    telemetry(LLMTelemetry)가 주어지면 요청마다 지연 시간, 토큰, 재시도, 백오프 시간을 기록한다.
+    """
+    def __init__(self, client, model, max_tokens, max_in_flight=8, limiter=None, max_retries=5, temperature=0.0, cache=None,
+                 budget=None, telemetry=None):
+        self.client = client
+        self.model = model
+        self.max_tokens = max_tokens
+        self.max_in_flight = max_in_flight
+        self.limiter = limiter or AdaptiveRateLimiter()
+        self.max_retries = max_retries
+        self.temperature = temperature
+        self.cache = cache
+        self.budget = budget
+        self.telemetry = telemetry
+        self._slots = threading.Semaphore(max_in_flight)
+
+    def _create(self, prompt, system_prompt, max_tokens):
+        raw = self.client.messages.with_raw_response.create(
+            model=self.model,
+            max_tokens=max_tokens,
+            temperature=self.temperature,
+            system=system_prompt,
+            messages=[{"role": "user", "content": prompt}],
+        )
+        self.limiter.observe_headers(raw.headers)
+        return raw.parse()
+
+    def complete(self, prompt: str, system_prompt: str = "", max_tokens: int = None) -> str:
+        """
+        완성 텍스트를 반환한다. 재시도 횟수를 넘기거나 다른 오류가 나면 빈 문자열을 반환한다.
+        max_tokens를 주면 이 요청에만 엔진 기본값 대신 사용한다 (여러 스크립트가 엔진 하나를 같이 쓸 때).
+        """
+        max_tokens = max_tokens or self.max_tokens
+        key = None
+        if self.cache is not None:
+            key = cache_key(self.model, system_prompt, prompt, {"max_tokens": max_tokens, "temperature": self.temperature})
+            cached = self.cache.get(key)
+            if cached is not None:
+                if self.telemetry is not None:
+                    self.telemetry.record_cache_hit()
+                return cached
+
+        estimated = estimate_tokens(system_prompt) + estimate_tokens(prompt)
+        reservation = self.budget.reserve(estimated, max_tokens) if self.budget is not None else None
+        # 성공한 응답의 (입력 토큰, 출력 토큰), 재시도 횟수, 백오프 대기 시간, 마지막 API 호출 지연 시간
+        stats = {"usage": None, "retries": 0, "backoff": 0.0, "api_seconds": None}
+        start = time.perf_counter()
+        try:
+            return self._complete_with_retries(prompt, system_prompt, max_tokens, estimated, key, stats)
+        finally:
+            input_tokens, output_tokens = stats["usage"] or (0, 0)
+            if reservation is not None:
+                self.budget.settle(reservation, input_tokens, output_tokens)
+            if self.telemetry is not None:
+                self.telemetry.record_call(stats["api_seconds"], time.perf_counter() - start, input_tokens, output_tokens,
+                                           stats["retries"], stats["backoff"], failed=stats["usage"] is None)
+
+    def _complete_with_retries(self, prompt, system_prompt, max_tokens, estimated, key, stats):
+        for attempt in range(self.max_retries):
+            self.limiter.acquire(estimated)
+            try:
+                with self._slots:
+                    call_start = time.perf_counter()
+                    message = self._create(prompt, system_prompt, max_tokens)
+                    stats["api_seconds"] = time.perf_counter() - call_start
+                stats["usage"] = usage_tokens(message)
+                text = message_text(message)
+                if key is not None:
+                    self.cache.put(key, text)
+                return text
+            except (anthropic.APIStatusError, anthropic.APIConnectionError) as e:
+                if not _is_retryable(e):
+                    logger.error(f"Anthropic API call failed: {e}")
+                    return ""
+                delay = _retry_after_seconds(e) or (2 ** attempt + random.uniform(0, 1))
+                self.limiter.observe_headers(getattr(getattr(e, "response", None), "headers", None))
+                self.limiter.pause(delay)
+                stats["retries"] += 1
+                stats["backoff"] += delay
+                logger.warning(f"{type(e).__name__} from Anthropic API. Pausing requests for {delay:.2f} seconds... (Attempt {attempt + 1}/{self.max_retries})")
+            except Exception as e:
+                logger.error(f"Anthropic API call failed: {e}")
+                return ""
+
+        logger.error(f"Failed to get completion after {self.max_retries} retries due to rate limits, overload or connection errors.")
+        return ""
+
+    def map_ordered(self, func, items, window=None):
+        """
+        items 각각에 func를 스레드 풀에서 동시에 적용하고, (item, 결과)를 입력 순서대로 내보낸다.
+        동시에 처리 중인 항목 수는 window(기본값 max_in_flight)로 제한되므로 입력을 미리 다 읽지 않는다.
+        """
+        window = window or self.max_in_flight
+        with ThreadPoolExecutor(max_workers=window) as executor:
+            pending = deque()
+            for item in items:
+                pending.append((item, executor.submit(func, item)))
+                if len(pending) >= window:
+                    done_item, future = pending.popleft()
+                    yield done_item, future.result()
+            while pending:
+                done_item, future = pending.popleft()
+                yield done_item, future.result()
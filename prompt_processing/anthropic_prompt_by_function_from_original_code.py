@@ -1,15 +1,23 @@
 from pymongo import MongoClient
-import time
-import random
 import os
 from dotenv import load_dotenv
 import json
 import re
-import anthropic
 import ast
 import logging
-from bson.objectid import ObjectId
 import datetime # datetime 모듈 임포트
+from functools import partial
+
+from prompt_processing.anthropic_engine import estimate_tokens, until_budget_exhausted
+from prompt_processing.anthropic_runtime import (
+    ANTHROPIC_API_KEY, ANTHROPIC_BATCH_DOCS, ANTHROPIC_BATCH_POLL_SECONDS, ANTHROPIC_MAX_IN_FLIGHT, ANTHROPIC_USE_BATCH_API,
+    MODEL_NAME, anthropic_batch_client, anthropic_engine, llm_response_cache, llm_telemetry, run_budget,
+)
+from prompt_processing.anthropic_batch import AnthropicBatchRunner
+from prompt_processing.resume_watermark import ResumeWatermark
+from prompt_processing.processed_id_journal import ProcessedIdJournal
+from prompt_processing.chunk_dedup import ChunkDedupIndex, chunk_key, NEW
+from prompt_processing.staged_pipeline import DurableBatchWriter, run_staged
 
 # Set up a basic logger
 logger = logging.getLogger(__name__)
@@ -27,11 +35,19 @@ DEFAULT_OUTPUT_JSONL_FILEPATH = os.path.join(SCRIPT_DIR, "instructions_data.json
 # processed_ids는 계속 누적하여 사용
 PROCESSED_IDS_FILEPATH = os.path.join(SCRIPT_DIR, "processed_ids.txt")
 
+# 처리된 ID 바이너리 저널 (processed_ids.sorted + processed_ids.log). 기존 processed_ids.txt는 처음 한 번 가져옵니다.
+PROCESSED_IDS_JOURNAL_PATH = os.path.join(SCRIPT_DIR, "processed_ids")
+
+# _id 워터마크 기반 재시작 상태 (처리된 _id 구간 + 다시 처리할 예외 ID)
+RESUME_STATE_FILEPATH = os.path.join(SCRIPT_DIR, "resume_state.json")
+
 # --- MongoDB Document Retrieval (역순 + 스킵 기능) ---
-def get_docs_sequentially(mongo_uri, db_name, collection_name, batch_fetch_size=500, processed_ids: set = None):
+def get_docs_sequentially(mongo_uri, db_name, collection_name, batch_fetch_size=500, processed_ids: set = None,
+                          resume: ResumeWatermark = None):
     """
     Retrieves documents sequentially from a MongoDB collection, in reverse _id order,
-    skipping documents whose IDs are in the processed_ids set.
+    skipping documents already covered by the resume watermark (processed _id ranges plus a small pending set).
+    On the first run with a watermark, the legacy processed_ids set is migrated into it once.
     Uses a generator to yield documents one by one.
     """
     if processed_ids is None:
@@ -42,17 +58,12 @@ def get_docs_sequentially(mongo_uri, db_name, collection_name, batch_fetch_size=
     collection = db[collection_name]
 
     query = {}
-    if processed_ids:
-        obj_ids_to_exclude = []
-        for doc_id_str in processed_ids:
-            if ObjectId.is_valid(doc_id_str):
-                obj_ids_to_exclude.append(ObjectId(doc_id_str))
-            else:
-                logger.warning(f"Invalid ObjectId string found in processed_ids: {doc_id_str}. Skipping this ID for exclusion.")
-        
-        if obj_ids_to_exclude:
-            query = {'_id': {'$nin': obj_ids_to_exclude}}
-            logger.info(f"MongoDB 쿼리에서 {len(obj_ids_to_exclude)}개의 이전에 처리된 ID를 제외합니다.")
+    if resume is not None:
+        if not resume.exists and processed_ids:
+            resume.migrate_from_processed_ids(collection, processed_ids)
+        query = resume.query()
+        if query:
+            logger.info(f"MongoDB 쿼리에서 처리된 _id 구간 {len(resume.ranges)}개를 제외합니다. (다시 처리할 ID: {len(resume.pending)}개)")
     
     total_remaining = collection.count_documents(query)
     if total_remaining == 0:
@@ -70,44 +81,31 @@ def get_docs_sequentially(mongo_uri, db_name, collection_name, batch_fetch_size=
 
 
 # --- Anthropic API Setup ---
-ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
-if not ANTHROPIC_API_KEY:
-    raise ValueError("Anthropic API key is missing. Please set ANTHROPIC_API_KEY in your environment or .env file.")
+# 클라이언트, 요청 엔진(레이트 리미터), 캐시, 예산, 호출 지표는 anthropic_runtime에서 프로세스 전체가 공유합니다.
+MAX_OUTPUT_TOKENS = 1500 # 이 스크립트의 요청당 최대 출력 토큰
+
+anthropic_batch_runner = AnthropicBatchRunner(
+    anthropic_batch_client,
+    MODEL_NAME,
+    max_tokens=MAX_OUTPUT_TOKENS,
+    poll_interval=ANTHROPIC_BATCH_POLL_SECONDS,
+    cache=llm_response_cache,
+    budget=run_budget,
+    telemetry=llm_telemetry,
+)
 
-MODEL_NAME = "claude-3-haiku-20240307"
-anthropic_client = anthropic.Client(api_key=ANTHROPIC_API_KEY)
+# 코퍼스 전체 청크 중복 제거: 정규화한 청크가 같으면 처음 한 번만 LLM에 보냅니다.
+# reuse = 중복 청크에 같은 명령을 재사용, drop = 중복 청크는 버림, off = 사용하지 않음
+CHUNK_DEDUP_MODE = os.getenv("CHUNK_DEDUP_MODE", "reuse")
+CHUNK_DEDUP_PATH = os.getenv("CHUNK_DEDUP_PATH", os.path.join(SCRIPT_DIR, "chunk_dedup.sqlite"))
+chunk_dedup_index = ChunkDedupIndex(CHUNK_DEDUP_PATH) if CHUNK_DEDUP_MODE in ("reuse", "drop") else None
 
 def get_completion_from_anthropic(prompt: str, system_prompt: str = "") -> str:
     """
-    Gets a completion from the Anthropic Claude model with exponential backoff for rate limiting.
-    """
-    max_retries = 5  # 최대 재시도 횟수
-    base_delay = 1   # 초기 대기 시간 (초)
-
-    for i in range(max_retries):
-        try:
-            message = anthropic_client.messages.create(
-                model=MODEL_NAME,
-                max_tokens=1500,
-                temperature=0.0,
-                system=system_prompt,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            if isinstance(message.content, list):
-                return "".join(getattr(block, "text", str(block)) for block in message.content)
-            return str(message.content)
-        except anthropic.RateLimitError as e: # Anthropic API의 RateLimitError를 명시적으로 처리
-            delay = base_delay * (2 ** i) + random.uniform(0, 1) # 지수적으로 증가하는 대기 시간 + 랜덤 백오프
-            logger.warning(f"Rate limit exceeded. Retrying in {delay:.2f} seconds... (Attempt {i + 1}/{max_retries})")
-            time.sleep(delay)
-        except Exception as e:
-            logger.error(f"Anthropic API call failed: {e}")
-            return "" # 다른 오류 시 빈 문자열 반환
-
-    logger.error(f"Failed to get completion after {max_retries} retries due to rate limit.")
-    return "" # 최대 재시도 횟수 초과 시 빈 문자열 반환
+    Gets a completion from the Anthropic Claude model through the shared concurrent request engine.
+    Rate limiting is handled by a token bucket that adapts to rate-limit headers and 429 responses.
+    """
+    return anthropic_engine.complete(prompt, system_prompt, max_tokens=MAX_OUTPUT_TOKENS)
 
 # --- System Prompt for Instruction Generation by LLM ---
 SYSTEM_PROMPT_FOR_INSTRUCTION_GENERATION = (
@@ -117,6 +115,28 @@ SYSTEM_PROMPT_FOR_INSTRUCTION_GENERATION = (
     "Your output must be ONLY the natural user request, without any introductory phrases, explanations, or meta-comments like 'Based on the code...', 'A suitable user request could be:', or similar."
 )
 
+# 여러 청크를 한 요청으로 보낼 때의 시스템 프롬프트 (JSON 배열로 답하도록 요청)
+SYSTEM_PROMPT_FOR_PACKED_INSTRUCTION_GENERATION = (
+    "You are an AI model training data generator. You will receive several numbered Python code snippets ([CODE 1], [CODE 2], ...), each being an 'output'. "
+    "For each snippet, formulate a natural language 'user request' (the 'input') that describes the functionality or purpose of that code, in a way a user might ask for a solution, either as a question or an imperative statement/command. "
+    "Focus on the desired outcome rather than specific implementation details. All generated requests must be in English. "
+    "Your output must be ONLY a JSON array of strings with exactly one request per snippet, in snippet order, without any introductory phrases, explanations, or meta-comments."
+)
+
+# 요청 전 크기 검사 (estimate_tokens 기준). 청크가 MAX_CHUNK_TOKENS를 넘으면 API를 호출하지 않고 건너뜁니다.
+# 생성된 명령 + 코드가 MAX_SAMPLE_TOKENS를 넘는 샘플도 버립니다.
+MAX_SAMPLE_TOKENS = 1500
+MAX_CHUNK_TOKENS = int(os.getenv("MAX_CHUNK_TOKENS", "1400"))
+
+# 단계별 파이프라인: 읽기/청크 분할 스레드가 최대 PIPELINE_PREFETCH_DOCS개 문서를 앞서 준비하고,
+# ANTHROPIC_MAX_IN_FLIGHT개의 작업 스레드가 LLM을 호출하며, 메인 스레드가 결과를 모아 씁니다.
+PIPELINE_PREFETCH_DOCS = int(os.getenv("PIPELINE_PREFETCH_DOCS", "64"))
+# 결과가 JSONL에 기록(fsync)된 뒤에만 처리된 ID로 남기므로, 결과가 적게 나와도 이 간격마다 한 번은 기록합니다.
+WRITER_FLUSH_SECONDS = float(os.getenv("WRITER_FLUSH_SECONDS", "10"))
+
+# 한 요청에 묶어 보낼 같은 문서의 청크 수 (1이면 청크마다 개별 요청). Batch API 모드에서는 항상 청크마다 개별 요청입니다.
+CHUNKS_PER_REQUEST = max(1, int(os.getenv("CHUNKS_PER_REQUEST", "1")))
+
 # --- Code Processing Logic for JSONL Output ---
 
 def get_node_source(node: ast.AST, source_lines: list[str]) -> str:
@@ -288,15 +308,12 @@ def clean_llm_response(response: str) -> str:
     return cleaned_response.strip()
 
 
-def process_code_to_jsonl_entries(raw_code_content: str):
+def iter_chunk_prompts(raw_code_content: str):
     """
-    Splits the code, matches it with English command text (generated by LLM), and returns a list of entries.
-    Each entry follows the {"messages": [{"role": "user", "content": "instruction"}, {"role": "assistant", "content": "code"}]} format.
+    Splits the code into chunks and yields (chunk_index, chunk_stripped, user_prompt) for each chunk worth sending to the LLM.
     """
     code_chunks = split_code_into_chunks(raw_code_content)
-    
-    processed_entries = []
-    
+
     for i, chunk in enumerate(code_chunks):
         chunk_stripped = chunk.strip()
         if not chunk_stripped:
@@ -306,63 +323,227 @@ def process_code_to_jsonl_entries(raw_code_content: str):
              logger.info(f"Skipping potentially irrelevant large comment chunk {i+1} from current document.")
              continue
 
+        chunk_tokens = estimate_tokens(chunk_stripped)
+        if chunk_tokens > MAX_CHUNK_TOKENS:
+            logger.warning(f"Skipping chunk {i+1} before the API call: ~{chunk_tokens} tokens exceeds MAX_CHUNK_TOKENS ({MAX_CHUNK_TOKENS}). Chunk starts with: {chunk_stripped[:50]}...")
+            continue
+
         user_prompt_to_llm = (
             f"Given the following Python code snippet as output, "
             f"please generate a natural user request (input) in English that describes its functionality and purpose:\n\n"
             f"[CODE]\n{chunk_stripped}\n[/CODE]"
         )
+        yield i, chunk_stripped, user_prompt_to_llm
+
+
+def build_chunk_entry(i: int, chunk_stripped: str, input_command_raw: str):
+    """
+    Cleans the LLM response for one chunk and returns a {"messages": [...]} entry, or None if the chunk should be skipped.
+    """
+    input_command = clean_llm_response(input_command_raw)
+
+    if not input_command:
+        logger.warning(f"Skipping chunk {i+1} due to empty or unparseable instruction after cleaning: {chunk_stripped[:50]}...")
+        return None
+    
+    if estimate_tokens(input_command) + estimate_tokens(chunk_stripped) > MAX_SAMPLE_TOKENS:
+        logger.warning(f"Skipping chunk {i+1} due to potential max_tokens overflow. Chunk starts with: {chunk_stripped[:50]}...")
+        return None
         
-        input_command_raw = get_completion_from_anthropic(
-            prompt=user_prompt_to_llm,
-            system_prompt=SYSTEM_PROMPT_FOR_INSTRUCTION_GENERATION
+    return {
+        "messages": [
+            {"role": "user", "content": input_command},
+            {"role": "assistant", "content": chunk_stripped}
+        ]
+    }
+
+
+def build_packed_prompt(chunk_prompts) -> str:
+    """
+    Packs several chunks into one user prompt with numbered [CODE i] sections.
+    """
+    sections = "\n\n".join(f"[CODE {n}]\n{chunk_stripped}\n[/CODE {n}]"
+                             for n, (_, chunk_stripped, _) in enumerate(chunk_prompts, 1))
+    return (
+        f"Given the following {len(chunk_prompts)} Python code snippets as outputs, "
+        f"please generate one natural user request (input) in English for each snippet that describes its functionality and purpose. "
+        f"Reply with a JSON array of exactly {len(chunk_prompts)} strings, where element i is the request for [CODE i]:\n\n"
+        f"{sections}"
+    )
+
+
+def parse_packed_response(response: str, expected_count: int):
+    """
+    Extracts the JSON array of instructions from a packed reply.
+    Returns None unless it is a list of exactly expected_count non-empty strings.
+    """
+    start, end = response.find("["), response.rfind("]")
+    if start == -1 or end <= start:
+        return None
+    try:
+        instructions = json.loads(response[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    if (not isinstance(instructions, list) or len(instructions) != expected_count
+            or not all(isinstance(item, str) and item.strip() for item in instructions)):
+        return None
+    return instructions
+
+
+def complete_chunk_group(chunk_prompts):
+    """
+    Gets one raw instruction per chunk. Several chunks are sent as one packed request;
+    if the reply cannot be parsed into exactly one instruction per chunk, each chunk is retried individually.
+    """
+    if len(chunk_prompts) > 1:
+        response = get_completion_from_anthropic(
+            prompt=build_packed_prompt(chunk_prompts),
+            system_prompt=SYSTEM_PROMPT_FOR_PACKED_INSTRUCTION_GENERATION
         )
+        instructions = parse_packed_response(response, len(chunk_prompts))
+        if instructions is not None:
+            return instructions
+        logger.warning(f"Packed reply for {len(chunk_prompts)} chunks could not be parsed. Retrying chunks individually.")
+    return [get_completion_from_anthropic(prompt=user_prompt_to_llm, system_prompt=SYSTEM_PROMPT_FOR_INSTRUCTION_GENERATION)
+            for _, _, user_prompt_to_llm in chunk_prompts]
 
-        input_command = clean_llm_response(input_command_raw)
 
-        if not input_command:
-            logger.warning(f"Skipping chunk {i+1} due to empty or unparseable instruction after cleaning: {chunk_stripped[:50]}...")
+def process_code_to_jsonl_entries(raw_code_content: str, chunk_prompts=None):
+    """
+    Splits the code, matches it with English command text (generated by LLM), and returns a list of entries.
+    Each entry follows the {"messages": [{"role": "user", "content": "instruction"}, {"role": "assistant", "content": "code"}]} format.
+    Chunks are sent CHUNKS_PER_REQUEST at a time; duplicates of already generated chunks are not sent again.
+    chunk_prompts may be passed in when the code has already been split (see prepare_document).
+    """
+    if chunk_prompts is None:
+        chunk_prompts = list(iter_chunk_prompts(raw_code_content))
+    keys = [chunk_key(chunk_stripped) if chunk_dedup_index is not None else None
+            for _, chunk_stripped, _ in chunk_prompts]
+
+    # 처음 보는 청크만 이 문서에서 생성을 맡고, 나머지는 중복으로 처리합니다.
+    claimed, duplicates = [], []
+    for n, key in enumerate(keys):
+        if key is None or chunk_dedup_index.lookup_or_claim(key)[0] == NEW:
+            claimed.append(n)
+        else:
+            duplicates.append(n)
+
+    responses = {}
+    try:
+        for start in range(0, len(claimed), CHUNKS_PER_REQUEST):
+            group = claimed[start:start + CHUNKS_PER_REQUEST]
+            for n, input_command_raw in zip(group, complete_chunk_group([chunk_prompts[n] for n in group])):
+                responses[n] = input_command_raw
+    finally:
+        # 같은 청크를 기다리는 다른 스레드가 멈추지 않도록, 실패해도 맡은 청크는 모두 resolve합니다.
+        for n in claimed:
+            if keys[n] is not None:
+                chunk_dedup_index.resolve(keys[n], responses.get(n, ""))
+
+    for n in duplicates:
+        i, chunk_stripped, user_prompt_to_llm = chunk_prompts[n]
+        saved_tokens = estimate_tokens(SYSTEM_PROMPT_FOR_INSTRUCTION_GENERATION) + estimate_tokens(user_prompt_to_llm)
+        if CHUNK_DEDUP_MODE == "drop":
+            chunk_dedup_index.record_duplicate(saved_tokens)
+            logger.debug(f"Dropping duplicate chunk {i+1}: {chunk_stripped[:50]}...")
             continue
-        
-        if (len(input_command) + len(chunk_stripped)) > 1500 * 4: 
-            logger.warning(f"Skipping chunk {i+1} due to potential max_tokens overflow. Chunk starts with: {chunk_stripped[:50]}...")
+        generate = partial(get_completion_from_anthropic, prompt=user_prompt_to_llm,
+                           system_prompt=SYSTEM_PROMPT_FOR_INSTRUCTION_GENERATION)
+        responses[n], _ = chunk_dedup_index.generate_once(keys[n], generate, saved_tokens=saved_tokens)
+
+    processed_entries = []
+    for n, (i, chunk_stripped, _) in enumerate(chunk_prompts):
+        if n not in responses:
             continue
-            
-        processed_entries.append({
-            "messages": [
-                {"role": "user", "content": input_command},
-                {"role": "assistant", "content": chunk_stripped}
-            ]
-        })
+        entry = build_chunk_entry(i, chunk_stripped, responses[n])
+        if entry:
+            processed_entries.append(entry)
     
     return processed_entries
 
 
-def save_processed_id(doc_id: str, filepath: str = PROCESSED_IDS_FILEPATH):
+def prepare_document(doc):
     """
-    Saves a single processed document ID to the separate processed_ids file.
+    읽기 단계: 문서를 청크 프롬프트 목록으로 나눈다. content가 없으면 None.
     """
-    with open(filepath, 'a', encoding='utf-8') as f:
-        f.write(str(doc_id) + '\n')
-        f.flush()
-        os.fsync(f.fileno())
-    logger.debug(f"Saved processed ID: {doc_id} to {filepath}")
+    content = doc.get('content', '')
+    if not content:
+        return None
+    return list(iter_chunk_prompts(content))
 
 
-def load_processed_ids(filepath: str = PROCESSED_IDS_FILEPATH) -> set:
+def generate_document_entries(doc, chunk_prompts):
     """
-    Loads all processed document IDs from the separate file into a set.
+    작업 단계(워커 스레드): 미리 나눈 청크들에 대해 LLM을 호출해 entries를 만든다. content가 없던 문서는 None.
     """
-    processed_ids = set()
-    if os.path.exists(filepath):
-        with open(filepath, 'r', encoding='utf-8') as f:
-            for line in f:
-                doc_id = line.strip()
-                if doc_id:
-                    processed_ids.add(doc_id)
-        logger.info(f"Loaded {len(processed_ids)} processed IDs from '{filepath}'.")
-    else:
-        logger.info(f"'{filepath}' not found. Starting with no processed IDs.")
-    return processed_ids
+    if chunk_prompts is None:
+        return None
+    content = doc.get('content', '')
+    logger.info(f"\n--- Processing Document {doc.get('_id')} (First 100 chars) ---")
+    logger.info(content[:100] + "..." if len(content) > 100 else content)
+    return process_code_to_jsonl_entries(content, chunk_prompts)
+
+
+def build_document_batch_requests(doc):
+    """
+    Batch 모드: 문서 하나의 청크들을 (custom_id, prompt, chunk_index, chunk, dedup_key) 요청 목록으로 만든다. content가 없으면 None.
+    custom_id는 "<문서 ID>-<청크 번호>"이므로 결과를 문서/청크에 다시 연결할 수 있다.
+    중복 제거를 쓰면 이미 생성했거나 앞선 요청이 맡은 청크는 custom_id가 None이 되어 제출되지 않는다.
+    """
+    content = doc.get('content', '')
+    if not content:
+        return None
+    doc_id = str(doc.get('_id'))
+    requests = []
+    for i, chunk_stripped, user_prompt_to_llm in iter_chunk_prompts(content):
+        custom_id, key = f"{doc_id}-{i}", None
+        if chunk_dedup_index is not None:
+            key = chunk_key(chunk_stripped)
+            status, _ = chunk_dedup_index.lookup_or_claim(key)
+            if status != NEW:
+                custom_id = None
+                chunk_dedup_index.record_duplicate(
+                    estimate_tokens(SYSTEM_PROMPT_FOR_INSTRUCTION_GENERATION) + estimate_tokens(user_prompt_to_llm))
+        requests.append((custom_id, user_prompt_to_llm, i, chunk_stripped, key))
+    return requests
+
+
+def process_documents_with_batches(docs):
+    """
+    Batch 모드: 문서들을 Message Batches API로 처리하고 (doc, entries)를 문서 순서대로 내보낸다.
+    content가 없는 문서는 entries가 None이다.
+    """
+    for doc, requests, responses in anthropic_batch_runner.map_documents(
+            docs, build_document_batch_requests, SYSTEM_PROMPT_FOR_INSTRUCTION_GENERATION, ANTHROPIC_BATCH_DOCS):
+        if requests is None:
+            yield doc, None
+            continue
+        entries = []
+        for custom_id, _, i, chunk_stripped, key in requests:
+            if custom_id is not None:
+                input_command_raw = responses[custom_id]
+                if key is not None:
+                    chunk_dedup_index.resolve(key, input_command_raw)
+            elif CHUNK_DEDUP_MODE == "drop":
+                continue
+            else:
+                # 같은 청크를 맡은 요청은 문서 순서상 앞에 있으므로 이미 resolve되어 있다 (실패했으면 None)
+                input_command_raw = chunk_dedup_index.get(key)
+                if input_command_raw is None:
+                    logger.warning(f"Skipping duplicate chunk {i+1} because its first occurrence failed: {chunk_stripped[:50]}...")
+                    continue
+            entry = build_chunk_entry(i, chunk_stripped, input_command_raw)
+            if entry:
+                entries.append(entry)
+        yield doc, entries
+
+
+def load_processed_ids(journal_path: str = PROCESSED_IDS_JOURNAL_PATH, on_commit=None) -> ProcessedIdJournal:
+    """
+    Opens the binary processed-ID journal. The legacy processed_ids.txt is imported once if the journal does not exist yet.
+    IDs added to the journal are written in batches (group commit); on_commit runs after each batch is on disk.
+    """
+    return ProcessedIdJournal(journal_path, legacy_txt_path=PROCESSED_IDS_FILEPATH, on_commit=on_commit)
 
 
 if __name__ == "__main__":
@@ -390,54 +571,52 @@ if __name__ == "__main__":
     logger.info(f"이번 실행의 JSONL 출력 파일 경로: {output_jsonl_filename}")
 
     # 기존 처리된 ID 목록을 로드합니다.
-    current_processed_ids = load_processed_ids(PROCESSED_IDS_FILEPATH)
-    
-    overall_jsonl_buffer = [] # JSONL에 쓸 데이터를 임시로 저장할 버퍼
-    
-    # Iterate through documents, skipping processed ones and processing in reverse order
-    for doc_index, doc in enumerate(get_docs_sequentially(mongo_uri, db_name, collection_name, batch_fetch_size=100, processed_ids=current_processed_ids)):
+    # 워터마크는 처리된 ID가 디스크에 기록될 때마다 함께 저장됩니다 (group commit).
+    resume_watermark = ResumeWatermark(RESUME_STATE_FILEPATH)
+    current_processed_ids = load_processed_ids(on_commit=resume_watermark.save)
+
+    def mark_document_done(token):
+        """쓰기 단계: 문서의 결과가 JSONL에 기록된 뒤에만 워터마크와 처리된 ID에 남깁니다."""
+        doc_id, processed = token
+        # 커서 순서대로 워터마크에 기록합니다. 항목이 하나도 나오지 않은 문서는 다음 실행에서 다시 가져옵니다.
+        resume_watermark.record(doc_id, processed=processed)
+        if processed:
+            current_processed_ids.add(doc_id)
+
+    # JSONL에 쓸 데이터를 batch_save_jsonl_size개씩 모아 'a' (append) 모드로 이어씁니다.
+    jsonl_writer = DurableBatchWriter(output_jsonl_filename, batch_size=batch_save_jsonl_size,
+                                      flush_interval=WRITER_FLUSH_SECONDS, on_durable=mark_document_done)
+
+    pending_docs = (
+        doc for doc in get_docs_sequentially(mongo_uri, db_name, collection_name, batch_fetch_size=100, processed_ids=current_processed_ids, resume=resume_watermark)
+        if str(doc.get('_id')) not in current_processed_ids
+    )
+
+    # 읽기/청크 분할, LLM 호출, 쓰기를 단계별 스레드로 나눠 처리하되, 결과는 문서 순서대로 메인 스레드에서 기록합니다.
+    if ANTHROPIC_USE_BATCH_API:
+        logger.info(f"Message Batches API 모드: 문서 {ANTHROPIC_BATCH_DOCS}개씩 배치로 제출합니다.")
+        doc_results = process_documents_with_batches(pending_docs)
+    else:
+        doc_results = run_staged(pending_docs, prepare_document, generate_document_entries,
+                                 workers=ANTHROPIC_MAX_IN_FLIGHT, prefetch=PIPELINE_PREFETCH_DOCS)
+
+    for doc, newly_processed_entries in until_budget_exhausted(doc_results):
         doc_id = str(doc.get('_id'))
 
-        if doc_id in current_processed_ids:
-            logger.debug(f"Document {doc_id} (index {doc_index + 1}) was already processed. Skipping LLM call.")
-            continue
-            
-        test_code_content = doc.get('content', '')
-        
-        if not test_code_content:
+        if newly_processed_entries is None:
             logger.warning(f"Document {doc_id} has no 'content' field. Skipping.")
-            save_processed_id(doc_id, PROCESSED_IDS_FILEPATH)
-            current_processed_ids.add(doc_id)
-            continue
-            
-        logger.info(f"\n--- Processing Document {doc_id} (First 100 chars) ---")
-        logger.info(test_code_content[:100] + "..." if len(test_code_content) > 100 else test_code_content)
-        
-        newly_processed_entries = process_code_to_jsonl_entries(test_code_content)
-        
-        if newly_processed_entries:
-            overall_jsonl_buffer.extend(newly_processed_entries)
-            save_processed_id(doc_id, PROCESSED_IDS_FILEPATH)
-            current_processed_ids.add(doc_id)
-
-        # 전체 버퍼가 batch_save_jsonl_size에 도달하면 JSONL에 저장
-        # 새 파일이든 기존 파일이든 'a' (append) 모드로 열어 이어씁니다.
-        if len(overall_jsonl_buffer) >= batch_save_jsonl_size:
-            with open(output_jsonl_filename, 'a', encoding='utf-8') as f:
-                for entry in overall_jsonl_buffer[:batch_save_jsonl_size]:
-                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
-                f.flush()
-                os.fsync(f.fileno())
-            logger.info(f"{batch_save_jsonl_size} documents appended to '{output_jsonl_filename}' from overall buffer.")
-            overall_jsonl_buffer = overall_jsonl_buffer[batch_save_jsonl_size:]
-
-    # 모든 문서 처리 후 전체 버퍼에 남은 데이터 JSONL에 저장
-    if overall_jsonl_buffer:
-        with open(output_jsonl_filename, 'a', encoding='utf-8') as f:
-            for entry in overall_jsonl_buffer:
-                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
-            f.flush()
-            os.fsync(f.fileno())
-        logger.info(f"Remaining {len(overall_jsonl_buffer)} documents appended to '{output_jsonl_filename}' from overall buffer.")
-    
+        elif newly_processed_entries:
+            llm_telemetry.record_samples(len(newly_processed_entries))
+
+        jsonl_writer.add(newly_processed_entries or [], (doc_id, newly_processed_entries is None or bool(newly_processed_entries)))
+
+    # 모든 문서 처리 후 남은 데이터를 JSONL에 저장하고 처리된 ID를 기록
+    jsonl_writer.close()
+    current_processed_ids.close()
+    if chunk_dedup_index is not None:
+        chunk_dedup_index.report(CHUNK_DEDUP_MODE)
+    run_budget.report()
+    if llm_response_cache is not None:
+        llm_response_cache.report()
+    llm_telemetry.write_report(os.path.splitext(output_jsonl_filename)[0] + ".telemetry.json")
     logger.info("Data generation process completed.")
\ No newline at end of file
@@ -1,15 +1,20 @@
-import json
 import os
 import re
-import time
-import random
-import anthropic
 import logging
 from dotenv import load_dotenv
 from pymongo import MongoClient
-from bson.objectid import ObjectId
 import datetime
 
+from jsonl_io import append_jsonl_records
+from prompt_processing.anthropic_engine import estimate_tokens, truncate_to_tokens, until_budget_exhausted
+from prompt_processing.anthropic_runtime import (
+    ANTHROPIC_API_KEY, ANTHROPIC_BATCH_DOCS, ANTHROPIC_BATCH_POLL_SECONDS, ANTHROPIC_MAX_IN_FLIGHT, ANTHROPIC_USE_BATCH_API,
+    MODEL_NAME, anthropic_batch_client, anthropic_engine, llm_response_cache, llm_telemetry, run_budget,
+)
+from prompt_processing.anthropic_batch import AnthropicBatchRunner
+from prompt_processing.resume_watermark import ResumeWatermark
+from prompt_processing.processed_id_journal import ProcessedIdJournal
+
 # Set up a basic logger
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
@@ -23,11 +28,20 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 # processed_ids 저장 파일 경로 다시 활성화
 PROCESSED_IDS_FILEPATH = os.path.join(SCRIPT_DIR, "processed_ids.txt")
 
+# 처리된 ID 바이너리 저널 (processed_ids_whole.sorted + processed_ids_whole.log). 기존 processed_ids.txt는 처음 한 번 가져옵니다.
+# 함수 단위 스크립트와 진행 상태가 섞이지 않도록 파일 전체 입도 전용 경로를 씁니다.
+PROCESSED_IDS_JOURNAL_PATH = os.path.join(SCRIPT_DIR, "processed_ids_whole")
+
+# _id 워터마크 기반 재시작 상태 (처리된 _id 구간 + 다시 처리할 예외 ID)
+RESUME_STATE_FILEPATH = os.path.join(SCRIPT_DIR, "resume_state_whole.json")
+
 # --- MongoDB Document Retrieval (역순 + 스킵 기능) ---
-def get_docs_sequentially(mongo_uri, db_name, collection_name, batch_fetch_size=500, processed_ids: set = None):
+def get_docs_sequentially(mongo_uri, db_name, collection_name, batch_fetch_size=500, processed_ids: set = None,
+                          resume: ResumeWatermark = None):
     """
     Retrieves documents sequentially from a MongoDB collection, in reverse _id order,
-    skipping documents whose IDs are in the processed_ids set.
+    skipping documents already covered by the resume watermark (processed _id ranges plus a small pending set).
+    On the first run with a watermark, the legacy processed_ids set is migrated into it once.
     Uses a generator to yield documents one by one.
     """
     if processed_ids is None:
@@ -38,17 +52,12 @@ def get_docs_sequentially(mongo_uri, db_name, collection_name, batch_fetch_size=
     collection = db[collection_name]
 
     query = {}
-    if processed_ids: # processed_ids가 있다면 쿼리에 추가
-        obj_ids_to_exclude = []
-        for doc_id_str in processed_ids:
-            if ObjectId.is_valid(doc_id_str):
-                obj_ids_to_exclude.append(ObjectId(doc_id_str))
-            else:
-                logger.warning(f"Invalid ObjectId string found in processed_ids: {doc_id_str}. Skipping this ID for exclusion.")
-        
-        if obj_ids_to_exclude:
-            query = {'_id': {'$nin': obj_ids_to_exclude}}
-            logger.info(f"MongoDB 쿼리에서 {len(obj_ids_to_exclude)}개의 이전에 처리된 ID를 제외합니다.")
+    if resume is not None:
+        if not resume.exists and processed_ids:
+            resume.migrate_from_processed_ids(collection, processed_ids)
+        query = resume.query()
+        if query:
+            logger.info(f"MongoDB 쿼리에서 처리된 _id 구간 {len(resume.ranges)}개를 제외합니다. (다시 처리할 ID: {len(resume.pending)}개)")
     
     total_remaining = collection.count_documents(query) # 남은 문서 수 계산
     
@@ -71,44 +80,25 @@ def get_docs_sequentially(mongo_uri, db_name, collection_name, batch_fetch_size=
 
 
 # --- Anthropic API Setup ---
-ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
-if not ANTHROPIC_API_KEY:
-    raise ValueError("Anthropic API key is missing. Please set ANTHROPIC_API_KEY in your environment or .env file.")
-
-MODEL_NAME = "claude-3-haiku-20240307"
-anthropic_client = anthropic.Client(api_key=ANTHROPIC_API_KEY)
+# 클라이언트, 요청 엔진(레이트 리미터), 캐시, 예산, 호출 지표는 anthropic_runtime에서 프로세스 전체가 공유합니다.
+MAX_OUTPUT_TOKENS = 2000 # 이 스크립트의 요청당 최대 출력 토큰
+
+anthropic_batch_runner = AnthropicBatchRunner(
+    anthropic_batch_client,
+    MODEL_NAME,
+    max_tokens=MAX_OUTPUT_TOKENS,
+    poll_interval=ANTHROPIC_BATCH_POLL_SECONDS,
+    cache=llm_response_cache,
+    budget=run_budget,
+    telemetry=llm_telemetry,
+)
 
 def get_completion_from_anthropic(prompt: str, system_prompt: str = "") -> str:
     """
-    Gets a completion from the Anthropic Claude model with exponential backoff for rate limiting.
+    Gets a completion from the Anthropic Claude model through the shared concurrent request engine.
+    Rate limiting is handled by a token bucket that adapts to rate-limit headers and 429 responses.
     """
-    max_retries = 5  # 최대 재시도 횟수
-    base_delay = 1   # 초기 대기 시간 (초)
-
-    for i in range(max_retries):
-        try:
-            message = anthropic_client.messages.create(
-                model=MODEL_NAME,
-                max_tokens=2000, 
-                temperature=0.0,
-                system=system_prompt,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            if isinstance(message.content, list):
-                return "".join(getattr(block, "text", str(block)) for block in message.content)
-            return str(message.content)
-        except anthropic.RateLimitError as e: # Anthropic API의 RateLimitError를 명시적으로 처리
-            delay = base_delay * (2 ** i) + random.uniform(0, 1) # 지수적으로 증가하는 대기 시간 + 랜덤 백오프
-            logger.warning(f"Rate limit exceeded. Retrying in {delay:.2f} seconds... (Attempt {i + 1}/{max_retries})")
-            time.sleep(delay)
-        except Exception as e:
-            logger.error(f"Anthropic API call failed: {e}")
-            return "" # 다른 오류 시 빈 문자열 반환
-
-    logger.error(f"Failed to get completion after {max_retries} retries due to rate limit.")
-    return "" # 최대 재시도 횟수 초과 시 빈 문자열 반환
+    return anthropic_engine.complete(prompt, system_prompt, max_tokens=MAX_OUTPUT_TOKENS)
 
 # --- System Prompt for Instruction Generation by LLM ---
 SYSTEM_PROMPT_FOR_INSTRUCTION_GENERATION = (
@@ -119,6 +109,11 @@ SYSTEM_PROMPT_FOR_INSTRUCTION_GENERATION = (
     "Your output must be ONLY the natural user request, without any introductory phrases, explanations, or meta-comments like 'Based on the code...', 'A suitable user request could be:', or similar."
 )
 
+# 요청 전 크기 검사 (estimate_tokens 기준). 코드가 MAX_WHOLE_CODE_TOKENS를 넘으면
+# skip = API를 호출하지 않고 건너뜀, truncate = 프롬프트에는 앞부분만 넣고 샘플에는 전체 코드를 저장
+MAX_WHOLE_CODE_TOKENS = int(os.getenv("MAX_WHOLE_CODE_TOKENS", "15000"))
+WHOLE_CODE_OVERSIZE = os.getenv("WHOLE_CODE_OVERSIZE", "skip")
+
 # --- Code Processing Logic for JSONL Output (통째로 처리) ---
 
 def clean_llm_response(response: str) -> str:
@@ -153,32 +148,36 @@ def clean_llm_response(response: str) -> str:
     return cleaned_response.strip()
 
 
-def process_whole_code_to_jsonl_entry(raw_code_content: str):
+def build_whole_code_prompt(raw_code_content: str):
     """
-    Processes the entire code content to generate a single instruction-response pair.
-    Returns a list containing one entry, or an empty list if processing fails.
+    Returns (code_stripped, user_prompt) for the whole code, or None if the content is empty or too large.
     """
     code_stripped = raw_code_content.strip()
     if not code_stripped:
-        return []
-
-    # Claude-3 Haiku의 입력 토큰 제한은 200k이므로, 여기서는 임시로 6만 자 이상이면 너무 길다고 판단하여 스킵
-    # 실제 모델의 최대 컨텍스트 토큰 수에 맞춰 이 값을 조정하세요.
-    if len(code_stripped) > 1500 * 40: # 약 60,000자 (UTF-8 기준)
-        logger.warning(f"Skipping document due to extremely large content (over 60k chars). Content starts with: {code_stripped[:100]}...")
-        return []
+        return None
+
+    # API 예산을 쓰기 전에 로컬 토큰 추정으로 크기를 검사합니다. 모델의 최대 컨텍스트에 맞춰 MAX_WHOLE_CODE_TOKENS를 조정하세요.
+    prompt_code = code_stripped
+    code_tokens = estimate_tokens(code_stripped)
+    if code_tokens > MAX_WHOLE_CODE_TOKENS:
+        if WHOLE_CODE_OVERSIZE != "truncate":
+            logger.warning(f"Skipping document before the API call: ~{code_tokens} tokens exceeds MAX_WHOLE_CODE_TOKENS ({MAX_WHOLE_CODE_TOKENS}). Content starts with: {code_stripped[:100]}...")
+            return None
+        prompt_code = truncate_to_tokens(code_stripped, MAX_WHOLE_CODE_TOKENS) + "\n# ... (truncated)"
+        logger.info(f"Truncated ~{code_tokens}-token document to {MAX_WHOLE_CODE_TOKENS} tokens for the prompt.")
 
     user_prompt_to_llm = (
         f"Given the following complete Python code, "
         f"please generate a natural user request (input) in English that describes its overall functionality, purpose, and what the entire script or module does at a high level:\n\n"
-        f"[CODE]\n{code_stripped}\n[/CODE]"
-    )
-    
-    input_command_raw = get_completion_from_anthropic(
-        prompt=user_prompt_to_llm,
-        system_prompt=SYSTEM_PROMPT_FOR_INSTRUCTION_GENERATION
+        f"[CODE]\n{prompt_code}\n[/CODE]"
     )
+    return code_stripped, user_prompt_to_llm
+
 
+def build_whole_code_entries(code_stripped: str, input_command_raw: str):
+    """
+    Cleans the LLM response and returns a list containing one entry, or an empty list if the response is unusable.
+    """
     input_command = clean_llm_response(input_command_raw)
 
     if not input_command:
@@ -193,32 +192,62 @@ def process_whole_code_to_jsonl_entry(raw_code_content: str):
     }]
 
 
-def save_processed_id(doc_id: str, filepath: str = PROCESSED_IDS_FILEPATH):
+def process_whole_code_to_jsonl_entry(raw_code_content: str, prompt_info=None):
+    """
+    Processes the entire code content to generate a single instruction-response pair.
+    Returns a list containing one entry, or an empty list if processing fails.
+    prompt_info may be passed in when build_whole_code_prompt has already run.
+    """
+    if prompt_info is None:
+        prompt_info = build_whole_code_prompt(raw_code_content)
+    if prompt_info is None:
+        return []
+    code_stripped, user_prompt_to_llm = prompt_info
+    
+    input_command_raw = get_completion_from_anthropic(
+        prompt=user_prompt_to_llm,
+        system_prompt=SYSTEM_PROMPT_FOR_INSTRUCTION_GENERATION
+    )
+    return build_whole_code_entries(code_stripped, input_command_raw)
+
+
+def build_document_batch_requests(doc):
+    """
+    Batch 모드: 문서 하나를 [(custom_id, prompt, code)] 요청 목록으로 만든다.
+    내용이 비어 있으면 None, 너무 길면 빈 목록을 반환한다. custom_id는 문서 ID이다.
+    """
+    content = doc.get('content', '')
+    if not content or not content.strip():
+        return None
+    prompt_info = build_whole_code_prompt(content)
+    if prompt_info is None:
+        return []
+    code_stripped, user_prompt_to_llm = prompt_info
+    return [(str(doc.get('_id')), user_prompt_to_llm, code_stripped)]
+
+
+def process_documents_with_batches(docs):
     """
-    Saves a single processed document ID to the separate processed_ids file.
+    Batch 모드: 문서들을 Message Batches API로 처리하고 (doc, entries)를 문서 순서대로 내보낸다.
+    내용이 비어 있는 문서는 entries가 None이다.
     """
-    with open(filepath, 'a', encoding='utf-8') as f:
-        f.write(str(doc_id) + '\n')
-        f.flush() # 버퍼 비우기
-        os.fsync(f.fileno()) # 디스크에 동기화
-    logger.debug(f"Saved processed ID: {doc_id} to {filepath}")
+    for doc, requests, responses in anthropic_batch_runner.map_documents(
+            docs, build_document_batch_requests, SYSTEM_PROMPT_FOR_INSTRUCTION_GENERATION, ANTHROPIC_BATCH_DOCS):
+        if requests is None:
+            yield doc, None
+            continue
+        entries = []
+        for custom_id, _, code_stripped in requests:
+            entries.extend(build_whole_code_entries(code_stripped, responses[custom_id]))
+        yield doc, entries
 
 
-def load_processed_ids(filepath: str = PROCESSED_IDS_FILEPATH) -> set:
+def load_processed_ids(journal_path: str = PROCESSED_IDS_JOURNAL_PATH, on_commit=None) -> ProcessedIdJournal:
     """
-    Loads all processed document IDs from the separate file into a set.
+    Opens the binary processed-ID journal. The legacy processed_ids.txt is imported once if the journal does not exist yet.
+    IDs added to the journal are written in batches (group commit); on_commit runs after each batch is on disk.
     """
-    processed_ids = set()
-    if os.path.exists(filepath):
-        with open(filepath, 'r', encoding='utf-8') as f:
-            for line in f:
-                doc_id = line.strip()
-                if doc_id:
-                    processed_ids.add(doc_id)
-        logger.info(f"Loaded {len(processed_ids)} processed IDs from '{filepath}'.")
-    else:
-        logger.info(f"'{filepath}' not found. Starting with no processed IDs.")
-    return processed_ids
+    return ProcessedIdJournal(journal_path, legacy_txt_path=PROCESSED_IDS_FILEPATH, on_commit=on_commit)
 
 
 if __name__ == "__main__":
@@ -245,63 +274,71 @@ if __name__ == "__main__":
     logger.info(f"이번 실행의 JSONL 출력 파일 경로: {output_jsonl_filename}")
 
     # 기존 처리된 ID 목록을 로드합니다.
-    current_processed_ids = load_processed_ids(PROCESSED_IDS_FILEPATH)
+    # 워터마크는 처리된 ID가 디스크에 기록될 때마다 함께 저장됩니다 (group commit).
+    resume_watermark = ResumeWatermark(RESUME_STATE_FILEPATH)
+    current_processed_ids = load_processed_ids(on_commit=resume_watermark.save)
     
     overall_jsonl_buffer = [] # JSONL에 쓸 데이터를 임시로 저장할 버퍼
     
-    # get_docs_sequentially 함수 호출 시 processed_ids 인자 다시 전달
-    for doc_index, doc in enumerate(get_docs_sequentially(mongo_uri, db_name, collection_name, batch_fetch_size=100, processed_ids=current_processed_ids)):
+    def process_document(doc):
+        """워커 스레드에서 실행: 문서 전체 코드에 대해 LLM 호출. 내용이 비어 있으면 None."""
+        test_code_content = doc.get('content', '')
+        if not test_code_content or not test_code_content.strip():
+            return None
+        logger.info(f"\n--- Processing Document {doc.get('_id')} (First 100 chars) ---")
+        logger.info(test_code_content[:100] + "..." if len(test_code_content) > 100 else test_code_content)
+        return process_whole_code_to_jsonl_entry(test_code_content)
+
+    # 쿼리에서 이미 걸러지지만, 안전을 위해 처리된 ID는 한 번 더 제외합니다.
+    pending_docs = (
+        doc for doc in get_docs_sequentially(mongo_uri, db_name, collection_name, batch_fetch_size=100, processed_ids=current_processed_ids, resume=resume_watermark)
+        if str(doc.get('_id')) not in current_processed_ids
+    )
+
+    # 여러 문서를 동시에(또는 배치 작업으로) 처리하되, 결과 기록과 처리된 ID 저장은 문서 순서대로 메인 스레드에서 합니다.
+    if ANTHROPIC_USE_BATCH_API:
+        logger.info(f"Message Batches API 모드: 문서 {ANTHROPIC_BATCH_DOCS}개씩 배치로 제출합니다.")
+        doc_results = process_documents_with_batches(pending_docs)
+    else:
+        doc_results = anthropic_engine.map_ordered(process_document, pending_docs, window=ANTHROPIC_MAX_IN_FLIGHT)
+
+    for doc, newly_processed_entries in until_budget_exhausted(doc_results):
         doc_id = str(doc.get('_id'))
 
-        # 이 로깅은 get_docs_sequentially 내부에서 이미 처리되므로, 여기서는 불필요할 수 있습니다.
-        # 하지만 안전을 위해 남겨둘 수도 있습니다.
-        if doc_id in current_processed_ids:
-            logger.debug(f"Document {doc_id} (index {doc_index + 1}) was already processed (bypassed by query).") 
-            continue # 실제로 쿼리에서 걸러지므로 이 부분까지 오는 경우는 드뭅니다.
-            
-        test_code_content = doc.get('content', '')
-        
-        if not test_code_content or not test_code_content.strip(): # 내용이 비어있거나 공백만 있는 경우 스킵
+        # 커서 순서대로 워터마크에 기록합니다. (이 스크립트는 실패한 문서도 처리된 것으로 봅니다)
+        resume_watermark.record(doc_id, processed=True)
+
+        if newly_processed_entries is None: # 내용이 비어있거나 공백만 있는 경우 스킵
             logger.warning(f"Document {doc_id} has no 'content' or only whitespace. Skipping and marking as processed.")
-            save_processed_id(doc_id, PROCESSED_IDS_FILEPATH) # 빈 문서도 처리된 것으로 저장
             current_processed_ids.add(doc_id)
             continue
-            
-        logger.info(f"\n--- Processing Document {doc_id} (First 100 chars) ---")
-        logger.info(test_code_content[:100] + "..." if len(test_code_content) > 100 else test_code_content)
-        
-        newly_processed_entries = process_whole_code_to_jsonl_entry(test_code_content)
-        
+
         if newly_processed_entries:
             overall_jsonl_buffer.extend(newly_processed_entries)
+            llm_telemetry.record_samples(len(newly_processed_entries))
             # LLM 호출이 성공적으로 처리된 문서 ID를 저장하는 로직 다시 활성화
-            save_processed_id(doc_id, PROCESSED_IDS_FILEPATH)
-            current_processed_ids.add(doc_id) # Set에도 추가하여 메모리상에서 빠르게 확인
+            current_processed_ids.add(doc_id)
         else:
             # LLM 처리 실패 시에도 ID를 저장하여 다음 실행 시 다시 시도하지 않도록 할지 결정
             # (이번에는 실패한 ID도 저장하는 것으로 설정)
             logger.warning(f"Document {doc_id} processing failed (empty/unparseable LLM response or too long). Marking as processed.")
-            save_processed_id(doc_id, PROCESSED_IDS_FILEPATH)
             current_processed_ids.add(doc_id)
 
 
         # 전체 버퍼가 batch_save_jsonl_size에 도달하면 JSONL에 저장
         if len(overall_jsonl_buffer) >= batch_save_jsonl_size:
-            with open(output_jsonl_filename, 'a', encoding='utf-8') as f:
-                for entry in overall_jsonl_buffer[:batch_save_jsonl_size]:
-                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
-                f.flush()
-                os.fsync(f.fileno())
+            append_jsonl_records(output_jsonl_filename, overall_jsonl_buffer[:batch_save_jsonl_size])
             logger.info(f"{batch_save_jsonl_size} documents appended to '{output_jsonl_filename}' from overall buffer.")
             overall_jsonl_buffer = overall_jsonl_buffer[batch_save_jsonl_size:]
 
     # 모든 문서 처리 후 전체 버퍼에 남은 데이터 JSONL에 저장
     if overall_jsonl_buffer:
-        with open(output_jsonl_filename, 'a', encoding='utf-8') as f:
-            for entry in overall_jsonl_buffer:
-                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
-            f.flush()
-            os.fsync(f.fileno())
+        append_jsonl_records(output_jsonl_filename, overall_jsonl_buffer)
         logger.info(f"Remaining {len(overall_jsonl_buffer)} documents appended to '{output_jsonl_filename}' from overall buffer.")
     
+    current_processed_ids.close()
+    run_budget.report()
+    if llm_response_cache is not None:
+        llm_response_cache.report()
+    llm_telemetry.write_report(os.path.splitext(output_jsonl_filename)[0] + ".telemetry.json")
     logger.info("Data generation process completed.")
\ No newline at end of file
@@ -0,0 +1,216 @@
+"""
+함수 단위 명령(anthropic_prompt_by_function_from_original_code)과 파일 전체 명령(anthropic_prompt_by_whole_code)을
+컬렉션을 한 번만 훑으면서 함께 생성한다. 문서는 한 번 읽고 한 번 파싱(청크 분할)한 뒤, 선택한 입도마다 요청을 보낸다.
+
+    PROMPT_GRANULARITIES=function,whole python -m prompt_processing.anthropic_prompt_generator
+
+진행 상태(처리된 ID 저널, 재시작 워터마크)와 출력 파일은 입도별로 따로 두며, 단독 스크립트와 같은 파일을 쓰므로
+어느 쪽으로 실행해도 이어서 처리한다. 한 입도에서 이미 처리한 문서는 그 입도로는 다시 요청하지 않는다.
+"""
+import datetime
+import logging
+import os
+
+from pymongo import MongoClient
+
+from prompt_processing import anthropic_prompt_by_function_from_original_code as function_level
+from prompt_processing import anthropic_prompt_by_whole_code as whole_file
+from prompt_processing.anthropic_engine import until_budget_exhausted
+from prompt_processing.anthropic_runtime import (
+    ANTHROPIC_API_KEY, ANTHROPIC_MAX_IN_FLIGHT, ANTHROPIC_USE_BATCH_API, llm_response_cache, llm_telemetry, run_budget,
+)
+from prompt_processing.processed_id_journal import ProcessedIdJournal
+from prompt_processing.resume_watermark import ResumeWatermark
+from prompt_processing.staged_pipeline import DurableBatchWriter, run_staged
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 생성할 입도 (쉼표로 구분): function = 함수/클래스 청크 단위, whole = 파일 전체
+PROMPT_GRANULARITIES = [name.strip() for name in os.getenv("PROMPT_GRANULARITIES", "function,whole").split(",") if name.strip()]
+PIPELINE_PREFETCH_DOCS = int(os.getenv("PIPELINE_PREFETCH_DOCS", "64"))
+WRITER_FLUSH_SECONDS = float(os.getenv("WRITER_FLUSH_SECONDS", "10"))
+PROGRESS_LOG_EVERY = int(os.getenv("PROGRESS_LOG_EVERY", "100")) # 이 문서 수마다 입도별 진행 상황을 로그로 남김
+
+
+class Granularity:
+    """
+    입도 하나의 생성 방법과 진행 상태.
+
+      - prepare(content) : 읽기 단계에서 한 번 실행 (청크 분할 / 프롬프트 구성)
+      - generate(content, prepared) : 워커 스레드에서 LLM을 호출해 entries를 만든다
+      - retry_empty : 항목이 하나도 나오지 않은 문서를 다음 실행에서 다시 처리할지
+    """
+    def __init__(self, name, module, prepare, generate, output_name, retry_empty):
+        self.name = name
+        self.module = module
+        self.prepare = prepare
+        self.generate = generate
+        self.output_name = output_name
+        self.retry_empty = retry_empty
+        self.documents = 0
+        self.entries = 0
+        self.already_done = 0
+        self.empty = 0
+        self.resume = None
+        self.processed_ids = None
+        self.writer = None
+
+    def open(self, timestamp, batch_size):
+        """워터마크, 처리된 ID 저널, 출력 파일 writer를 연다. 워터마크는 ID가 디스크에 기록될 때마다 함께 저장된다."""
+        self.resume = ResumeWatermark(self.module.RESUME_STATE_FILEPATH)
+        self.processed_ids = ProcessedIdJournal(self.module.PROCESSED_IDS_JOURNAL_PATH,
+                                                legacy_txt_path=self.module.PROCESSED_IDS_FILEPATH, on_commit=self.resume.save)
+        self.output_path = os.path.join(SCRIPT_DIR, f"{self.output_name}_{timestamp}.jsonl")
+        self.writer = DurableBatchWriter(self.output_path, batch_size=batch_size, flush_interval=WRITER_FLUSH_SECONDS,
+                                         on_durable=self._mark_done)
+        logger.info(f"[{self.name}] 출력 파일: {self.output_path}")
+
+    def is_done(self, doc_id):
+        return doc_id in self.processed_ids or self.resume.covers(doc_id)
+
+    def add(self, doc_id, entries, already_done=False):
+        """문서 하나의 결과를 문서 순서대로 넘긴다. entries가 None이면 내용이 없는 문서이다."""
+        self.documents += 1
+        if already_done:
+            self.already_done += 1
+            processed = True
+        elif entries is None:
+            processed = True
+        else:
+            self.entries += len(entries)
+            if not entries:
+                self.empty += 1
+            processed = bool(entries) or not self.retry_empty
+            llm_telemetry.record_samples(len(entries))
+        self.writer.add(entries or [], (doc_id, processed, already_done))
+
+    def _mark_done(self, token):
+        """쓰기 단계: 결과가 JSONL에 기록된 뒤에만 워터마크와 처리된 ID에 남긴다."""
+        doc_id, processed, already_done = token
+        self.resume.record(doc_id, processed=processed)
+        if processed and not already_done:
+            self.processed_ids.add(doc_id)
+
+    def log_progress(self):
+        logger.info(f"[{self.name}] {self.documents} documents read, {self.entries} entries, "
+                    f"{self.already_done} already done, {self.empty} without entries.")
+
+    def close(self):
+        self.writer.close()
+        self.processed_ids.close()
+        self.log_progress()
+
+
+GRANULARITIES = {
+    "function": Granularity(
+        "function", function_level,
+        prepare=lambda content: list(function_level.iter_chunk_prompts(content)),
+        generate=function_level.process_code_to_jsonl_entries,
+        output_name="instructions_data_run",
+        retry_empty=True,
+    ),
+    "whole": Granularity(
+        "whole", whole_file,
+        prepare=whole_file.build_whole_code_prompt,
+        # 너무 크거나 비어 있어 프롬프트가 없으면 (None) 호출하지 않고 빈 결과로 둔다
+        generate=lambda content, prompt_info: whole_file.process_whole_code_to_jsonl_entry(content, prompt_info) if prompt_info else [],
+        output_name="full_code_instructions_data_run",
+        retry_empty=False,
+    ),
+}
+
+
+def get_docs_once(mongo_uri, db_name, collection_name, granularities, batch_fetch_size=100):
+    """
+    선택한 입도 중 하나라도 아직 처리하지 않은 문서를 _id 역순으로 한 번씩 가져온다.
+    쿼리는 입도별 워터마크 쿼리의 합집합이다. 워터마크가 처음이면 기존 처리된 ID를 한 번 옮겨 온다.
+    """
+    client = MongoClient(mongo_uri)
+    collection = client[db_name][collection_name]
+
+    queries = []
+    for granularity in granularities:
+        resume = granularity.resume
+        if not resume.exists and len(granularity.processed_ids):
+            resume.migrate_from_processed_ids(collection, granularity.processed_ids)
+        queries.append(resume.query())
+    query = {} if any(not q for q in queries) else {"$or": queries}
+
+    total_remaining = collection.count_documents(query)
+    if total_remaining == 0:
+        logger.info("모든 문서가 선택한 입도로 이미 처리되었거나, 처리할 문서가 남아있지 않습니다.")
+        client.close()
+        return
+    logger.info(f"처리할 남은 문서 수: {total_remaining} (입도: {', '.join(g.name for g in granularities)})")
+
+    cursor = collection.find(query, no_cursor_timeout=False).sort('_id', -1).batch_size(batch_fetch_size)
+    for doc in cursor:
+        yield doc
+    client.close()
+
+
+if __name__ == "__main__":
+    mongo_uri = os.getenv("MONGO_URI_SAVE")
+    db_name = os.getenv("MONGO_DB_SAVE")
+    collection_name = os.getenv("MONGO_COLLECTION_LOAD")
+
+    unknown = [name for name in PROMPT_GRANULARITIES if name not in GRANULARITIES]
+    if unknown or not PROMPT_GRANULARITIES:
+        raise ValueError(f"Unknown PROMPT_GRANULARITIES {unknown}. Choose from: {', '.join(GRANULARITIES)}")
+    if not mongo_uri or not db_name or not collection_name or not ANTHROPIC_API_KEY:
+        logger.error("One or more critical environment variables (MongoDB URI, DB Name, Collection Name, or Anthropic API Key) are not loaded. Please check your 'mongo.env' file.")
+        exit()
+    if ANTHROPIC_USE_BATCH_API:
+        logger.warning("The unified generator uses the concurrent request engine. Run the per-granularity scripts for Message Batches API mode.")
+
+    granularities = [GRANULARITIES[name] for name in PROMPT_GRANULARITIES]
+    current_timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    for granularity in granularities:
+        granularity.open(current_timestamp, batch_size=30)
+
+    def prepare_document(doc):
+        """읽기 단계: 아직 처리하지 않은 입도마다 요청을 준비한다. 내용이 없으면 None."""
+        content = doc.get('content', '')
+        if not content or not content.strip():
+            return None
+        doc_id = str(doc.get('_id'))
+        return {g.name: g.prepare(content) for g in granularities if not g.is_done(doc_id)}
+
+    def generate_document(doc, prepared):
+        """작업 단계: 한 번 준비한 요청으로 입도별 entries를 만든다."""
+        if prepared is None:
+            return None
+        content = doc.get('content', '')
+        logger.info(f"\n--- Processing Document {doc.get('_id')} ({', '.join(prepared) or 'nothing to do'}) ---")
+        return {g.name: g.generate(content, prepared[g.name]) for g in granularities if g.name in prepared}
+
+    doc_results = run_staged(get_docs_once(mongo_uri, db_name, collection_name, granularities),
+                             prepare_document, generate_document,
+                             workers=ANTHROPIC_MAX_IN_FLIGHT, prefetch=PIPELINE_PREFETCH_DOCS)
+
+    for n, (doc, results) in enumerate(until_budget_exhausted(doc_results), 1):
+        doc_id = str(doc.get('_id'))
+        if results is None:
+            logger.warning(f"Document {doc_id} has no 'content' or only whitespace. Skipping.")
+        for granularity in granularities:
+            if results is None:
+                granularity.add(doc_id, None)
+            elif granularity.name in results:
+                granularity.add(doc_id, results[granularity.name])
+            else:
+                granularity.add(doc_id, None, already_done=True)
+        if n % PROGRESS_LOG_EVERY == 0:
+            for granularity in granularities:
+                granularity.log_progress()
+
+    for granularity in granularities:
+        granularity.close()
+    if function_level.chunk_dedup_index is not None and "function" in PROMPT_GRANULARITIES:
+        function_level.chunk_dedup_index.report(function_level.CHUNK_DEDUP_MODE)
+    run_budget.report()
+    if llm_response_cache is not None:
+        llm_response_cache.report()
+    llm_telemetry.write_report(os.path.join(SCRIPT_DIR, f"prompt_generator_run_{current_timestamp}.telemetry.json"))
+    logger.info("Data generation process completed.")
@@ -0,0 +1,65 @@
+"""
+anthropic_prompt_* 스크립트가 한 프로세스 안에서 함께 쓰는 Anthropic 클라이언트, 요청 엔진(레이트 리미터),
+응답 캐시, 실행 예산, 호출 지표. 여러 입도(함수 단위 / 파일 전체)를 한 번에 생성해도 한도와 예산은 하나로 묶인다.
+"""
+import os
+from functools import partial
+
+import anthropic
+from dotenv import load_dotenv
+
+from prompt_processing.anthropic_engine import AnthropicRequestEngine, AdaptiveRateLimiter, TokenBudget, cost_of
+from prompt_processing.llm_cache import LLMResponseCache
+from prompt_processing.llm_telemetry import LLMTelemetry
+
+# 환경 변수 로드 (스크립트보다 먼저 import될 수 있으므로 여기서도 호출)
+load_dotenv(dotenv_path="mongo.env")
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# --- Anthropic API Setup ---
+ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
+if not ANTHROPIC_API_KEY:
+    raise ValueError("Anthropic API key is missing. Please set ANTHROPIC_API_KEY in your environment or .env file.")
+
+MODEL_NAME = "claude-3-haiku-20240307"
+# base_url을 바꾸면 로컬 스텁 서버로 테스트 가능.
+# SDK 자체 재시도(고정 백오프)는 끄고, 429/5xx는 요청 엔진의 적응형 리미터가 직접 보고 멈춘 뒤 재시도합니다.
+anthropic_client = anthropic.Client(api_key=ANTHROPIC_API_KEY, base_url=os.getenv("ANTHROPIC_BASE_URL"), max_retries=0)
+# Message Batches API의 제출/폴링은 엔진을 거치지 않으므로 SDK 재시도를 그대로 둡니다.
+anthropic_batch_client = anthropic_client.with_options(max_retries=int(os.getenv("ANTHROPIC_BATCH_CLIENT_RETRIES", "2")))
+
+# 동시 요청 수와 분당 요청/입력 토큰 한도 (계정의 rate limit에 맞게 조정, 응답 헤더로 자동 보정됨)
+ANTHROPIC_MAX_IN_FLIGHT = int(os.getenv("ANTHROPIC_MAX_IN_FLIGHT", "8"))
+ANTHROPIC_REQUESTS_PER_MINUTE = int(os.getenv("ANTHROPIC_REQUESTS_PER_MINUTE", "50"))
+ANTHROPIC_INPUT_TOKENS_PER_MINUTE = int(os.getenv("ANTHROPIC_INPUT_TOKENS_PER_MINUTE", "50000"))
+
+# 디스크 응답 캐시: 재실행이나 중복 청크는 API를 다시 호출하지 않습니다. 경로를 빈 문자열로 두면 비활성화됩니다.
+ANTHROPIC_CACHE_PATH = os.getenv("ANTHROPIC_CACHE_PATH", os.path.join(SCRIPT_DIR, "llm_response_cache.sqlite"))
+ANTHROPIC_CACHE_MAX_MB = int(os.getenv("ANTHROPIC_CACHE_MAX_MB", "1024"))
+llm_response_cache = LLMResponseCache(ANTHROPIC_CACHE_PATH, ANTHROPIC_CACHE_MAX_MB * 1024 * 1024) if ANTHROPIC_CACHE_PATH else None
+
+# 실행 단위 예산: 토큰 수(입력+출력)와 비용(USD). 0이면 제한하지 않습니다. 다 쓰면 현재까지 결과를 저장하고 멈춥니다.
+RUN_TOKEN_BUDGET = int(os.getenv("RUN_TOKEN_BUDGET", "0"))
+RUN_COST_BUDGET_USD = float(os.getenv("RUN_COST_BUDGET_USD", "0"))
+run_budget = TokenBudget(MODEL_NAME, max_tokens=RUN_TOKEN_BUDGET, max_cost_usd=RUN_COST_BUDGET_USD)
+
+# 호출 지표(지연 시간 분포, 토큰, 재시도, 백오프, 샘플당 비용): LLM_TELEMETRY_INTERVAL초마다 로그로 요약하고 끝나면 JSON 보고서로 저장합니다.
+llm_telemetry = LLMTelemetry(price_of=partial(cost_of, MODEL_NAME), summary_interval=float(os.getenv("LLM_TELEMETRY_INTERVAL", "60")))
+
+# 모든 스크립트가 공유하는 요청 엔진. 스크립트마다 다른 출력 길이는 complete(..., max_tokens=...)로 넘깁니다.
+anthropic_engine = AnthropicRequestEngine(
+    anthropic_client,
+    MODEL_NAME,
+    max_tokens=1500,
+    max_in_flight=ANTHROPIC_MAX_IN_FLIGHT,
+    limiter=AdaptiveRateLimiter(ANTHROPIC_REQUESTS_PER_MINUTE, ANTHROPIC_INPUT_TOKENS_PER_MINUTE),
+    cache=llm_response_cache,
+    budget=run_budget,
+    telemetry=llm_telemetry,
+)
+
+# Message Batches API 모드 (비용이 낮고 처리량이 높지만 결과가 늦게 나옴). 1이면 사용합니다.
+ANTHROPIC_USE_BATCH_API = os.getenv("ANTHROPIC_USE_BATCH_API", "0") == "1"
+ANTHROPIC_BATCH_DOCS = int(os.getenv("ANTHROPIC_BATCH_DOCS", "500")) # 배치 작업 하나로 묶을 문서 수
+ANTHROPIC_BATCH_POLL_SECONDS = float(os.getenv("ANTHROPIC_BATCH_POLL_SECONDS", "30"))
@@ -0,0 +1,372 @@
+"""
+Messages API(/v1/messages)와 Message Batches API를 흉내 내는 로컬 스텁 서버.
+실제 비용과 rate limit 없이 프롬프트 생성 스크립트를 부하/내구 테스트할 때 사용한다.
+
+    python -m prompt_processing.anthropic_stub_server
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8787 python -m prompt_processing.anthropic_prompt_by_whole_code
+
+동작은 ANTHROPIC_STUB_* 환경 변수로 조정한다 (StubBehavior.from_env 참고).
+"""
+import datetime
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STUB_PORT = 8787
+_PACKED_COUNT = re.compile(r"JSON array of exactly (\d+) strings")
+_CODE_BLOCK = re.compile(r"\[CODE(?: \d+)?\]\n(.*?)\n\[/CODE(?: \d+)?\]", re.DOTALL)
+_DEF_NAME = re.compile(r"^\s*(?:async\s+)?(?:def|class)\s+(\w+)", re.MULTILINE)
+
+
+def stub_tokens(text):
+    """스텁 응답의 usage에 넣을 대략적인 토큰 수 (문자 3.5개당 1토큰)."""
+    return max(1, round(len(text) / 3.5))
+
+
+def _utc_iso(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class StubBehavior:
+    """
+    스텁 서버의 응답 방식.
+
+      - latency_ms / latency_sigma : 요청 지연 시간의 로그정규분포 중앙값(ms)과 sigma
+      - ms_per_output_token        : 출력 토큰마다 더해지는 생성 시간
+      - rate_limit_rate / overload_rate / server_error_rate : 429 / 529 / 500을 무작위로 돌려줄 확률
+      - requests_per_minute / input_tokens_per_minute      : 넘으면 429를 돌려주는 분당 한도 (0이면 없음)
+      - response_mode : "instruction"(스크립트가 파싱할 수 있는 요청문, 묶음 프롬프트면 JSON 배열),
+                        "echo"(프롬프트 앞부분), "canned"(canned_path 파일의 줄을 차례로)
+      - batch_seconds : 배치 작업이 제출 후 끝난 것으로 보이기까지의 시간
+    """
+    def __init__(self, latency_ms=300.0, latency_sigma=0.5, ms_per_output_token=0.0, rate_limit_rate=0.0,
+                 overload_rate=0.0, server_error_rate=0.0, requests_per_minute=0, input_tokens_per_minute=0,
+                 response_mode="instruction", canned_path=None, batch_seconds=5.0, seed=None):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.ms_per_output_token = ms_per_output_token
+        self.rate_limit_rate = rate_limit_rate
+        self.overload_rate = overload_rate
+        self.server_error_rate = server_error_rate
+        self.requests_per_minute = requests_per_minute
+        self.input_tokens_per_minute = input_tokens_per_minute
+        self.response_mode = response_mode
+        self.batch_seconds = batch_seconds
+        self.random = random.Random(seed)
+        self._canned = None
+        if response_mode == "canned":
+            with open(canned_path, "r", encoding="utf-8") as f:
+                lines = [line.rstrip("\n") for line in f if line.strip()]
+            if not lines:
+                raise ValueError(f"Canned response file '{canned_path}' is empty.")
+            self._canned = itertools.cycle(lines)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            latency_ms=float(os.getenv("ANTHROPIC_STUB_LATENCY_MS", "300")),
+            latency_sigma=float(os.getenv("ANTHROPIC_STUB_LATENCY_SIGMA", "0.5")),
+            ms_per_output_token=float(os.getenv("ANTHROPIC_STUB_MS_PER_OUTPUT_TOKEN", "0")),
+            rate_limit_rate=float(os.getenv("ANTHROPIC_STUB_429_RATE", "0")),
+            overload_rate=float(os.getenv("ANTHROPIC_STUB_529_RATE", "0")),
+            server_error_rate=float(os.getenv("ANTHROPIC_STUB_500_RATE", "0")),
+            requests_per_minute=int(os.getenv("ANTHROPIC_STUB_REQUESTS_PER_MINUTE", "0")),
+            input_tokens_per_minute=int(os.getenv("ANTHROPIC_STUB_INPUT_TOKENS_PER_MINUTE", "0")),
+            response_mode=os.getenv("ANTHROPIC_STUB_RESPONSE_MODE", "instruction"),
+            canned_path=os.getenv("ANTHROPIC_STUB_CANNED_PATH"),
+            batch_seconds=float(os.getenv("ANTHROPIC_STUB_BATCH_SECONDS", "5")),
+            seed=int(os.environ["ANTHROPIC_STUB_SEED"]) if os.getenv("ANTHROPIC_STUB_SEED") else None,
+        )
+
+    def latency(self, output_tokens):
+        with self._lock:
+            base = self.latency_ms * self.random.lognormvariate(0.0, self.latency_sigma) if self.latency_ms > 0 else 0.0
+        return (base + output_tokens * self.ms_per_output_token) / 1000
+
+    def injected_error(self):
+        """무작위로 주입할 오류 (status, error type) 또는 None."""
+        with self._lock:
+            roll = self.random.random()
+        for rate, status, error_type in ((self.rate_limit_rate, 429, "rate_limit_error"),
+                                         (self.overload_rate, 529, "overloaded_error"),
+                                         (self.server_error_rate, 500, "api_error")):
+            if roll < rate:
+                return status, error_type
+            roll -= rate
+        return None
+
+    def respond(self, prompt, max_tokens):
+        if self.response_mode == "echo":
+            text = prompt
+        elif self.response_mode == "canned":
+            with self._lock:
+                text = next(self._canned)
+        else:
+            text = self._instruction(prompt)
+        # max_tokens를 넘는 응답은 잘라서 stop_reason을 max_tokens로 보고한다
+        limit = int(max_tokens * 3.5)
+        if len(text) > limit:
+            return text[:limit], "max_tokens"
+        return text, "end_turn"
+
+    @staticmethod
+    def _instruction(prompt):
+        codes = _CODE_BLOCK.findall(prompt) or [prompt]
+        requests = []
+        for code in codes:
+            names = _DEF_NAME.findall(code)
+            subject = f"`{names[0]}`" if names else "this snippet"
+            requests.append(f"Write Python code for {subject} that performs the same task as the given code "
+                            f"({len(code.splitlines())} lines).")
+        packed = _PACKED_COUNT.search(prompt)
+        if packed:
+            return json.dumps(requests[:int(packed.group(1))], ensure_ascii=False)
+        return requests[0]
+
+
+class _MinuteWindow:
+    """stub의 분당 요청/입력 토큰 한도. 1분 고정 창으로 센다."""
+    def __init__(self, requests_per_minute, input_tokens_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.input_tokens_per_minute = input_tokens_per_minute
+        self.window_start = time.time()
+        self.requests = 0
+        self.tokens = 0
+        self._lock = threading.Lock()
+
+    def admit(self, input_tokens):
+        """(허용 여부, rate limit 헤더)를 반환한다."""
+        with self._lock:
+            now = time.time()
+            if now - self.window_start >= 60:
+                self.window_start, self.requests, self.tokens = now, 0, 0
+            allowed = ((not self.requests_per_minute or self.requests < self.requests_per_minute)
+                       and (not self.input_tokens_per_minute or self.tokens + input_tokens <= self.input_tokens_per_minute))
+            if allowed:
+                self.requests += 1
+                self.tokens += input_tokens
+            reset = _utc_iso(self.window_start + 60)
+            headers = {}
+            if self.requests_per_minute:
+                headers.update({
+                    "anthropic-ratelimit-requests-limit": str(self.requests_per_minute),
+                    "anthropic-ratelimit-requests-remaining": str(max(0, self.requests_per_minute - self.requests)),
+                    "anthropic-ratelimit-requests-reset": reset,
+                })
+            if self.input_tokens_per_minute:
+                headers.update({
+                    "anthropic-ratelimit-input-tokens-limit": str(self.input_tokens_per_minute),
+                    "anthropic-ratelimit-input-tokens-remaining": str(max(0, self.input_tokens_per_minute - self.tokens)),
+                    "anthropic-ratelimit-input-tokens-reset": reset,
+                })
+            if not allowed:
+                headers["retry-after"] = str(max(1, round(self.window_start + 60 - now)))
+            return allowed, headers
+
+
+class AnthropicStubServer(ThreadingHTTPServer):
+    """요청마다 스레드 하나로 처리하는 스텁 서버. 요청/오류 수를 센다."""
+    daemon_threads = True
+
+    def __init__(self, address, behavior=None):
+        super().__init__(address, _StubHandler)
+        self.behavior = behavior or StubBehavior()
+        self.window = _MinuteWindow(self.behavior.requests_per_minute, self.behavior.input_tokens_per_minute)
+        self.batches = {}
+        self.counts = {"messages": 0, "errors": 0, "batches": 0}
+        self._lock = threading.Lock()
+        self._message_ids = itertools.count(1)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counts[name] += n
+
+    def create_message(self, body):
+        """요청 본문으로 Message 객체(dict)와 지연 시간을 만든다."""
+        prompt = "\n".join(_content_text(m.get("content")) for m in body.get("messages", []) if m.get("role") == "user")
+        text, stop_reason = self.behavior.respond(prompt, int(body.get("max_tokens", 1024)))
+        input_tokens = stub_tokens(_content_text(body.get("system")) + prompt)
+        output_tokens = stub_tokens(text)
+        message = {
+            "id": f"msg_stub_{next(self._message_ids):08d}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", "stub"),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": stop_reason,
+            "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+        }
+        return message, self.behavior.latency(output_tokens)
+
+
+def _content_text(content):
+    if content is None:
+        return ""
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content if isinstance(block, dict))
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 클라이언트가 연결을 재사용하도록 keep-alive
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("request-id", f"req_stub_{time.time_ns()}")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, error_type, message, headers=None):
+        self.server.count("errors")
+        self._send_json(status, {"type": "error", "error": {"type": error_type, "message": message}}, headers)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        try:
+            body = self._read_body()
+        except json.JSONDecodeError:
+            self._send_error(400, "invalid_request_error", "Request body is not valid JSON.")
+            return
+        if path == "/v1/messages":
+            self._messages(body)
+        elif path == "/v1/messages/batches":
+            self._create_batch(body)
+        else:
+            self._send_error(404, "not_found_error", f"Unknown endpoint {path}")
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        parts = path.split("/")
+        # /v1/messages/batches/{id} 또는 /v1/messages/batches/{id}/results
+        if len(parts) >= 5 and parts[1:4] == ["v1", "messages", "batches"]:
+            batch = self.server.batches.get(parts[4])
+            if batch is None:
+                self._send_error(404, "not_found_error", f"Unknown batch {parts[4]}")
+            elif len(parts) == 5:
+                self._send_json(200, self._batch_object(batch))
+            elif parts[5:] == ["results"]:
+                self._batch_results(batch)
+            else:
+                self._send_error(404, "not_found_error", f"Unknown endpoint {path}")
+        else:
+            self._send_error(404, "not_found_error", f"Unknown endpoint {path}")
+
+    def _messages(self, body):
+        server = self.server
+        error = server.behavior.injected_error()
+        if error is not None:
+            status, error_type = error
+            time.sleep(server.behavior.latency(0) / 4)
+            self._send_error(status, error_type, "Injected by the stub server.",
+                             {"retry-after": "1"} if status == 429 else None)
+            return
+
+        message, latency = server.create_message(body)
+        allowed, headers = server.window.admit(message["usage"]["input_tokens"])
+        if not allowed:
+            self._send_error(429, "rate_limit_error", "Stub rate limit exceeded.", headers)
+            return
+        time.sleep(latency)
+        server.count("messages")
+        self._send_json(200, message, headers)
+
+    def _create_batch(self, body):
+        server = self.server
+        results = []
+        for request in body.get("requests", []):
+            message, _ = server.create_message(request.get("params", {}))
+            error = server.behavior.injected_error()
+            if error is not None:
+                result = {"type": "errored", "error": {"type": "error", "error": {"type": error[1], "message": "Injected by the stub server."}}}
+            else:
+                result = {"type": "succeeded", "message": message}
+            results.append({"custom_id": request.get("custom_id"), "result": result})
+        now = time.time()
+        batch_id = f"msgbatch_stub_{time.time_ns()}"
+        server.batches[batch_id] = {"id": batch_id, "created_at": now, "ends_at": now + server.behavior.batch_seconds,
+                                    "results": results}
+        server.count("batches")
+        self._send_json(200, self._batch_object(server.batches[batch_id]))
+
+    def _batch_object(self, batch):
+        ended = time.time() >= batch["ends_at"]
+        succeeded = sum(1 for r in batch["results"] if r["result"]["type"] == "succeeded")
+        total = len(batch["results"])
+        return {
+            "id": batch["id"],
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else total,
+                "succeeded": succeeded if ended else 0,
+                "errored": total - succeeded if ended else 0,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": _utc_iso(batch["created_at"]),
+            "expires_at": _utc_iso(batch["created_at"] + 24 * 3600),
+            "ended_at": _utc_iso(batch["ends_at"]) if ended else None,
+            "cancel_initiated_at": None,
+            "archived_at": None,
+            "results_url": f"{self.server.base_url}/v1/messages/batches/{batch['id']}/results" if ended else None,
+        }
+
+    def _batch_results(self, batch):
+        if time.time() < batch["ends_at"]:
+            self._send_error(400, "invalid_request_error", "Batch has not ended yet.")
+            return
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in batch["results"]).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/binary")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_stub_server(host="127.0.0.1", port=0, behavior=None):
+    """스텁 서버를 백그라운드 스레드에서 시작하고 서버 객체를 반환한다. port=0이면 빈 포트를 고른다."""
+    server = AnthropicStubServer((host, port), behavior)
+    threading.Thread(target=server.serve_forever, name="anthropic-stub", daemon=True).start()
+    logger.info(f"Anthropic stub server listening on {server.base_url}")
+    return server
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    stub = AnthropicStubServer((os.getenv("ANTHROPIC_STUB_HOST", "127.0.0.1"), int(os.getenv("ANTHROPIC_STUB_PORT", DEFAULT_STUB_PORT))),
+                               StubBehavior.from_env())
+    logger.info(f"Anthropic stub server listening on {stub.base_url} (set ANTHROPIC_BASE_URL to this address)")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.info(f"Stub server counts: {stub.counts}")
+        stub.server_close()
@@ -0,0 +1,152 @@
+"""
+로컬 스텁 서버(anthropic_stub_server)를 상대로 anthropic_prompt_* 파이프라인의 end-to-end 처리량을 잰다.
+MongoDB 대신 JSONL 파일(content 필드)이나 합성 코드 문서를 입력으로 쓰고, 생성 결과는 저장하지 않는다.
+
+    python -m prompt_processing.benchmark_prompt_pipeline function 2000
+    python -m prompt_processing.benchmark_prompt_pipeline whole 500 code_docs.jsonl
+    ANTHROPIC_USE_BATCH_API=1 python -m prompt_processing.benchmark_prompt_pipeline function 2000
+
+ANTHROPIC_STUB_URL에 따로 띄운 스텁 서버 주소가 있으면 그 서버를 쓰고, 없으면 스텁 서버를 이 프로세스 안에서 띄운다.
+(실수로 실제 API에 요청하지 않도록 ANTHROPIC_BASE_URL은 항상 스텁 주소로 덮어쓴다)
+(같은 프로세스의 스텁은 GIL을 나눠 쓰므로, 높은 동시성을 잴 때는 스텁을 별도 프로세스로 띄우는 편이 정확하다)
+파이프라인 설정(ANTHROPIC_MAX_IN_FLIGHT, CHUNKS_PER_REQUEST 등)과 스텁 설정(ANTHROPIC_STUB_*)은 환경 변수로 준다.
+클라이언트 쪽 레이트 리미터도 그대로 동작하므로, 스텁의 한계를 재려면 ANTHROPIC_REQUESTS_PER_MINUTE 등을 충분히 올린다.
+"""
+import importlib
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+from jsonl_io import open_jsonl
+from prompt_processing.anthropic_stub_server import StubBehavior, start_stub_server
+from prompt_processing.staged_pipeline import run_staged
+
+logger = logging.getLogger(__name__)
+
+PIPELINES = {
+    "function": ("prompt_processing.anthropic_prompt_by_function_from_original_code", "process_code_to_jsonl_entries"),
+    "whole": ("prompt_processing.anthropic_prompt_by_whole_code", "process_whole_code_to_jsonl_entry"),
+}
+
+
+def synthetic_documents(count, functions_per_doc=6, seed=0):
+    """함수 functions_per_doc개짜리 서로 다른 합성 파이썬 문서를 만든다. (청크 중복 제거에 걸리지 않도록 이름과 본문이 모두 다르다)"""
+    rng = random.Random(seed)
+    for n in range(count):
+        parts = ["import json", "import os", ""]
+        for k in range(functions_per_doc):
+            name = f"handle_item_{n}_{k}"
+            lines = [f"def {name}(path, limit={rng.randint(1, 1000)}):",
+                     f'    """Process up to limit records from path (variant {rng.getrandbits(32):08x})."""',
+                     "    results = []"]
+            for step in range(rng.randint(2, 12)):
+                lines.append(f"    value_{step} = len(path) * {rng.randint(1, 99)} + {step}")
+                lines.append(f"    if value_{step} > limit:")
+                lines.append(f"        results.append(os.path.join(path, str(value_{step})))")
+            lines.append("    return json.dumps(results)")
+            parts.append("\n".join(lines))
+            parts.append("")
+        yield {"_id": f"{n:024x}", "content": "\n\n".join(parts)}
+
+
+def load_documents(path, limit):
+    """content 필드가 있는 JSONL 파일에서 문서를 최대 limit개 읽는다."""
+    with open_jsonl(path, "r") as f:
+        for i, line in enumerate(f):
+            if i >= limit:
+                break
+            record = json.loads(line)
+            record.setdefault("_id", f"{i:024x}")
+            yield record
+
+
+def run_benchmark(pipeline, docs):
+    """docs를 파이프라인 하나에 흘려 보내고 처리량 요약(dict)을 반환한다."""
+    module_name, process_name = PIPELINES[pipeline]
+    module = importlib.import_module(module_name)
+    process = getattr(module, process_name)
+
+    def process_document(doc):
+        content = doc.get('content', '')
+        return process(content) if content else None
+
+    if module.ANTHROPIC_USE_BATCH_API:
+        doc_results = module.process_documents_with_batches(docs)
+    elif hasattr(module, "prepare_document"):
+        # 읽기/청크 분할 -> LLM 워커 -> 쓰기 단계로 나뉜 파이프라인
+        doc_results = run_staged(docs, module.prepare_document, module.generate_document_entries,
+                                 workers=module.ANTHROPIC_MAX_IN_FLIGHT, prefetch=module.PIPELINE_PREFETCH_DOCS)
+    else:
+        doc_results = module.anthropic_engine.map_ordered(process_document, docs)
+
+    documents = samples = 0
+    start = time.perf_counter()
+    for _, entries in module.until_budget_exhausted(doc_results):
+        documents += 1
+        if entries:
+            samples += len(entries)
+            module.llm_telemetry.record_samples(len(entries))
+    elapsed = time.perf_counter() - start
+
+    telemetry = module.llm_telemetry.summary()
+    return {
+        "pipeline": pipeline,
+        "mode": "batch" if module.ANTHROPIC_USE_BATCH_API else f"sync x{module.ANTHROPIC_MAX_IN_FLIGHT}",
+        "documents": documents,
+        "samples": samples,
+        "elapsed_seconds": elapsed,
+        "documents_per_second": documents / elapsed if elapsed else 0.0,
+        "samples_per_second": samples / elapsed if elapsed else 0.0,
+        "calls_per_minute": telemetry["calls"] / elapsed * 60 if elapsed else 0.0,
+        "telemetry": telemetry,
+    }
+
+
+def benchmark(pipeline="function", count=200, input_path=None):
+    # 벤치마크는 매번 API를 실제로 호출해야 하므로 캐시와 청크 중복 제거는 기본으로 끈다
+    os.environ.setdefault("ANTHROPIC_API_KEY", "stub")
+    os.environ.setdefault("ANTHROPIC_CACHE_PATH", "")
+    os.environ.setdefault("CHUNK_DEDUP_MODE", "off")
+    os.environ.setdefault("ANTHROPIC_BATCH_POLL_SECONDS", "1")
+    os.environ.setdefault("LLM_TELEMETRY_INTERVAL", "10")
+    stub = None
+    if os.getenv("ANTHROPIC_STUB_URL"):
+        os.environ["ANTHROPIC_BASE_URL"] = os.environ["ANTHROPIC_STUB_URL"]
+    else:
+        stub = start_stub_server(behavior=StubBehavior.from_env())
+        os.environ["ANTHROPIC_BASE_URL"] = stub.base_url
+
+    docs = load_documents(input_path, count) if input_path else synthetic_documents(count)
+    try:
+        result = run_benchmark(pipeline, docs)
+    finally:
+        if stub is not None:
+            stub.shutdown()
+            stub.server_close()
+
+    t = result["telemetry"]
+    print(f"[*] {result['pipeline']} pipeline ({result['mode']}) against {os.environ['ANTHROPIC_BASE_URL']}")
+    print(f"{'documents':<22}{result['documents']:>12}")
+    print(f"{'samples':<22}{result['samples']:>12}")
+    print(f"{'elapsed (s)':<22}{result['elapsed_seconds']:>12.2f}")
+    print(f"{'documents/s':<22}{result['documents_per_second']:>12.2f}")
+    print(f"{'samples/s':<22}{result['samples_per_second']:>12.2f}")
+    print(f"{'API calls/min':<22}{result['calls_per_minute']:>12.1f}")
+    print(f"{'failed calls':<22}{t['failures']:>12}")
+    print(f"{'retries':<22}{t['retries']:>12}")
+    print(f"{'backoff (s)':<22}{t['backoff_seconds']:>12.1f}")
+    print(f"{'latency p50/p99 (s)':<22}{t['api_latency']['p50']:>6.2f}{t['api_latency']['p99']:>6.2f}")
+    if t["batches"]:
+        print(f"{'batch p50/max (s)':<22}{t['batch_latency']['p50']:>6.1f}{t['batch_latency']['max']:>6.1f}")
+    if stub is not None:
+        print(f"{'stub counts':<22}{json.dumps(stub.counts):>12}")
+    return result
+
+
+if __name__ == "__main__":
+    benchmark(sys.argv[1] if len(sys.argv) > 1 else "function",
+              int(sys.argv[2]) if len(sys.argv) > 2 else 200,
+              sys.argv[3] if len(sys.argv) > 3 else None)
@@ -0,0 +1,125 @@
+import ast
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+NEW = "new"          # 처음 본 청크: 호출한 쪽이 생성한 뒤 resolve()해야 한다
+KNOWN = "known"      # 이미 생성된 청크: 저장된 응답을 재사용한다
+PENDING = "pending"  # 다른 스레드/배치가 생성 중인 청크
+
+_COMMENT_LINE = re.compile(r"^\s*#.*$", re.MULTILINE)
+_WHITESPACE = re.compile(r"[ \t]+")
+
+
+def normalize_chunk(code: str) -> str:
+    """
+    포크된 저장소 간의 사소한 차이를 없앤 청크 표현. 파이썬으로 파싱되면 ast.unparse로 주석/서식 차이를 없애고,
+    파싱되지 않으면 주석 줄과 빈 줄을 지우고 공백을 하나로 줄인다.
+    """
+    try:
+        return ast.unparse(ast.parse(code))
+    except (SyntaxError, ValueError, RecursionError):
+        text = _COMMENT_LINE.sub("", code)
+        return "\n".join(_WHITESPACE.sub(" ", line).strip() for line in text.splitlines() if line.strip())
+
+
+def chunk_key(code: str) -> str:
+    return hashlib.blake2b(normalize_chunk(code).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ChunkDedupIndex:
+    """
+    정규화된 청크 해시 -> 처음 나온 청크에 대해 생성한 LLM 응답을 SQLite 파일에 저장하는 코퍼스 전체 중복 제거 인덱스.
+    처음 나온 청크만 API로 보내고, 이후 같은 청크는 저장된 응답을 재사용(또는 버림)한다.
+    여러 스레드가 같은 청크를 동시에 만나면 하나만 생성하고 나머지는 그 결과를 기다린다.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.generated = 0
+        self.duplicates = 0
+        self.saved_tokens = 0
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS chunks (key TEXT PRIMARY KEY, response TEXT NOT NULL)")
+        self._conn.commit()
+
+    def _get(self, key):
+        row = self._conn.execute("SELECT response FROM chunks WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def lookup_or_claim(self, key):
+        """(상태, 응답)을 반환한다. NEW이면 호출한 쪽이 이 청크의 생성을 맡는다."""
+        with self._lock:
+            if key in self._pending:
+                return PENDING, None
+            response = self._get(key)
+            if response is not None:
+                return KNOWN, response
+            self._pending[key] = threading.Event()
+            return NEW, None
+
+    def resolve(self, key, response):
+        """NEW로 맡은 청크의 응답을 저장한다. 응답이 비어 있으면(실패) 저장하지 않아 다음 중복이 다시 생성한다."""
+        with self._lock:
+            event = self._pending.pop(key, None)
+            if response:
+                self._conn.execute("INSERT OR IGNORE INTO chunks (key, response) VALUES (?, ?)", (key, response))
+                self._conn.commit()
+                self.generated += 1
+        if event is not None:
+            event.set()
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def record_duplicate(self, saved_tokens=0):
+        with self._lock:
+            self.duplicates += 1
+            self.saved_tokens += saved_tokens
+
+    def generate_once(self, key, generate, saved_tokens=0):
+        """
+        같은 청크에 대해 generate()가 코퍼스 전체에서 한 번만 호출되도록 한다.
+        (응답, 중복 여부)를 반환한다. 먼저 맡은 쪽이 실패하면 직접 생성한다.
+        """
+        while True:
+            status, response = self.lookup_or_claim(key)
+            if status == NEW:
+                response = ""
+                try:
+                    response = generate()
+                finally:
+                    self.resolve(key, response)
+                return response, False
+            if status == PENDING:
+                self._pending_event(key).wait()
+                response = self.get(key)
+                if response is None:
+                    continue
+            self.record_duplicate(saved_tokens)
+            return response, True
+
+    def _pending_event(self, key):
+        with self._lock:
+            return self._pending.get(key) or _SET_EVENT
+
+    def report(self, mode):
+        total = self.generated + self.duplicates
+        logger.info(f"Chunk dedup ({mode}): {self.generated} chunks generated, {self.duplicates} duplicates "
+                    f"({self.duplicates / total if total else 0:.1%}), saved ~{self.duplicates} API calls and ~{self.saved_tokens} input tokens.")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_SET_EVENT = threading.Event()
+_SET_EVENT.set()
@@ -4,6 +4,9 @@ import re
 import logging
 import datetime
 
+from jsonl_io import open_jsonl
+from jsonl_reader import JsonlReader
+
 # 기본 로거 설정
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
@@ -27,7 +30,19 @@ def normalize_code_spacing(code_content: str) -> str:
     
     return normalized_code
 
-def process_jsonl_file(input_filepath: str, output_filepath: str):
+def normalize_assistant_message(data: dict) -> bool:
+    """
+    레코드의 'messages' 필드에서 assistant role content의 줄바꿈을 정규화합니다.
+    정규화한 content가 있으면 True를 반환합니다.
+    """
+    if 'messages' in data and isinstance(data['messages'], list):
+        for message in data['messages']:
+            if message.get('role') == 'assistant' and 'content' in message:
+                message['content'] = normalize_code_spacing(message['content'])
+                return True # assistant role content는 하나만 있다고 가정
+    return False
+
+def process_jsonl_file(input_filepath: str, output_filepath: str, num_workers: int | None = None):
     """
     입력 JSONL 파일에서 'content' 필드를 읽어 줄바꿈을 정규화하고
     새로운 JSONL 파일에 저장합니다.
@@ -37,30 +52,23 @@ def process_jsonl_file(input_filepath: str, output_filepath: str):
         return
 
     processed_count = 0
-    with open(input_filepath, "r", encoding='utf-8') as infile, \
-         open(output_filepath, 'w', encoding='utf-8') as outfile:
+    reader = JsonlReader(input_filepath, num_workers=num_workers)
+    with open_jsonl(output_filepath, 'w') as outfile:
         
-        for line_num, line in enumerate(infile, 1):
+        for line_num, data in enumerate(reader, 1):
             try:
-                data = json.loads(line)
-                
                 # 'messages' 필드의 'content'를 찾아서 처리
-                if 'messages' in data and isinstance(data['messages'], list):
-                    for message in data['messages']:
-                        if message.get('role') == 'assistant' and 'content' in message:
-                            original_code = message['content']
-                            normalized_code = normalize_code_spacing(original_code)
-                            message['content'] = normalized_code
-                            processed_count += 1
-                            break # assistant role content는 하나만 있다고 가정하고 다음 line으로 이동
+                if normalize_assistant_message(data):
+                    processed_count += 1
                 
                 # 정규화된 데이터 다시 JSONL 형식으로 저장
                 outfile.write(json.dumps(data, ensure_ascii=False) + '\n')
 
-            except json.JSONDecodeError as e:
-                logger.error(f"JSONL 파일 {input_filepath}의 {line_num}번째 줄 파싱 오류: {e}")
             except Exception as e:
-                logger.error(f"JSONL 파일 {input_filepath}의 {line_num}번째 줄 처리 중 알 수 없는 오류: {e}")
+                logger.error(f"JSONL 파일 {input_filepath}의 {line_num}번째 레코드 처리 중 알 수 없는 오류: {e}")
+
+    if reader.malformed_count:
+        logger.error(f"JSONL 파일 {input_filepath}에서 파싱할 수 없는 {reader.malformed_count}개 줄을 건너뛰었습니다. (첫 오류: {reader.first_error})")
                 
     logger.info(f"JSONL 파일 처리 완료: '{input_filepath}' -> '{output_filepath}'")
     logger.info(f"총 {processed_count}개의 코드 블록이 정규화되었습니다.")
@@ -1,39 +1,112 @@
+import hashlib
 import json
 import os
 from pathlib import Path
-import re
+
+from jsonl_io import open_jsonl
+from jsonl_reader import JsonlReader
 
 # ✅ 직접 경로 선언
 input_path = "train.jsonl"  # 여기에 입력 파일 경로
 output_path = "realtrain.jsonl"  # 여기에 출력 파일 경로
+dedup_code_blocks = False  # True면 같은 코드 블록은 처음 한 번만 저장 (16바이트 해시만 메모리에 유지)
+
+_FENCE = "```"
+_CODE_FENCE_LANGUAGES = frozenset(("", "python"))  # ``` 또는 ```python 블록만 추출
+
+
+def iter_fenced_blocks(text):
+    """
+    마크다운 텍스트의 ``` 펜스 블록을 (언어, 본문)으로 순서대로 내보낸다.
+    str.find로 앞에서부터 한 번만 훑으므로 텍스트 길이에 선형이다.
+    같은 줄에서 닫히는 인라인 ```...```는 펜스로 보지 않고 그 줄의 나머지를 건너뛴다.
+
+    >>> list(iter_fenced_blocks("Use ```x``` inline here\\n```python\\nprint(1)\\n```\\n"))
+    [('python', 'print(1)\\n')]
+    """
+    pos = 0
+    while True:
+        start = text.find(_FENCE, pos)
+        if start < 0:
+            return
+        info_end = text.find("\n", start + 3)
+        if info_end < 0:
+            return
+        info = text[start + 3:info_end]
+        if "`" in info:
+            pos = info_end + 1
+            continue
+        close = text.find(_FENCE, info_end + 1)
+        if close < 0:
+            return
+        yield info.strip(), text[info_end + 1:close]
+        pos = close + 3
+
 
 def extract_code_blocks(text):
     """
     Extract Python code blocks from markdown-style content.
     Preferably extracts ```python ... ``` or fallback to full text.
     """
-    code_blocks = re.findall(r"```(?:python)?\n(.*?)```", text, re.DOTALL)
+    code_blocks = [body for language, body in iter_fenced_blocks(text) if language in _CODE_FENCE_LANGUAGES]
     return code_blocks if code_blocks else [text.strip()]
 
-def extract_codes_from_jsonl(input_path, output_path):
-    code_data = []
 
-    with open(input_path, 'r', encoding='utf-8') as infile:
-        for line in infile:
-            obj = json.loads(line)
-            if 'messages' in obj:
-                for msg in obj['messages']:
-                    if msg.get("role") == 'assistant':
-                        code_blocks = extract_code_blocks(msg['content'])
-                        for code in code_blocks:
-                            code_data.append({"code": code})
+def extract_code_records(obj):
+    """
+    대화 레코드 하나에서 assistant 메시지의 코드 블록을 {"code": ...} 레코드 목록으로 추출합니다.
+    """
+    code_records = []
+    messages = obj.get('messages') if isinstance(obj, dict) else None
+    if isinstance(messages, list):
+        for msg in messages:
+            if isinstance(msg, dict) and msg.get("role") == 'assistant' and isinstance(msg.get('content'), str):
+                for code in extract_code_blocks(msg['content']):
+                    code_records.append({"code": code})
+    return code_records
+
+
+def _serialize_code_records(obj):
+    """워커: 레코드 하나의 코드 블록을 직렬화된 라인 목록으로 만든다."""
+    return [json.dumps(code_item, ensure_ascii=False) + "\n" for code_item in extract_code_records(obj)]
+
+
+def _serialize_hashed_code_records(obj):
+    """워커 (dedup용): 레코드 하나의 코드 블록을 (16바이트 해시, 직렬화된 라인) 목록으로 만든다."""
+    return [(hashlib.blake2b(line.encode("utf-8"), digest_size=16).digest(), line) for line in _serialize_code_records(obj)]
+
+
+def extract_codes_from_jsonl(input_path, output_path, num_workers=None, dedup=False):
+    """
+    입력 JSONL을 범위 단위로 워커 프로세스에 나눠 파싱/코드 블록 추출/직렬화하고, 결과를 받는 대로 출력에 이어 쓴다.
+    메모리에는 처리 중인 범위만 남는다 (dedup이면 지금까지 본 블록의 16바이트 해시도 함께 유지하며, 해시는 dedup일 때만 계산한다).
+    파싱할 수 없는 라인은 건너뛰고 마지막에 개수를 보고한다.
+    """
+    seen = set()
+    written = 0
+    duplicates = 0
 
-    with open(output_path, 'w', encoding='utf-8') as outfile:
-        for code_item in code_data:
-            json.dump(code_item, outfile, ensure_ascii=False)
-            outfile.write('\n')
+    transform = _serialize_hashed_code_records if dedup else _serialize_code_records
+    reader = JsonlReader(input_path, num_workers=num_workers, transform=transform)
+    with open_jsonl(output_path, 'w') as outfile:
+        for batch in reader.iter_batches():
+            if not dedup:
+                outfile.writelines(batch)
+                written += len(batch)
+                continue
+            for digest, line in batch:
+                if digest in seen:
+                    duplicates += 1
+                    continue
+                seen.add(digest)
+                outfile.write(line)
+                written += 1
+    reader.report()
 
-    print(f"[✓] Extracted {len(code_data)} code blocks to {output_path}")
+    if dedup:
+        print(f"[*] Skipped {duplicates} duplicate code blocks")
+    print(f"[✓] Extracted {written} code blocks from {reader.record_count} records to {output_path}")
+    return written
 
 if __name__ == "__main__":
-    extract_codes_from_jsonl(input_path, output_path)
+    extract_codes_from_jsonl(input_path, output_path, dedup=dedup_code_blocks)
@@ -1,71 +1,153 @@
+"""
+대화 JSONL을 사람이 읽기 좋은 텍스트로 바꾼다.
+
+  - export : 전체 파일을 텍스트 파일로 저장한다. 콘솔에는 요약만 출력하고, 파일 쓰기는 큰 버퍼로 모아서 한다.
+  - view   : 라인 오프셋 인덱스(jsonl_index)로 요청한 범위의 대화만 읽어 콘솔에 보여 준다 (Enter로 다음 페이지).
+  - sample : 인덱스로 무작위 대화 몇 개만 골라 보여 준다.
+
+    python -m prompt_processing.jsonl_pretty_dialogue_formatter export moretrain.jsonl prettified_dialogues.txt
+    python -m prompt_processing.jsonl_pretty_dialogue_formatter view moretrain.jsonl 1000 5
+    python -m prompt_processing.jsonl_pretty_dialogue_formatter sample moretrain.jsonl 10 42
+"""
 import json
+import sys
 from pathlib import Path
 
-def display_and_save_dialogues_prettily(input_jsonl_path, output_prettified_path):
+from jsonl_index import JsonlIndex
+from jsonl_io import is_compressed, open_jsonl
+
+EXPORT_BUFFER_BYTES = 1024 * 1024
+VIEW_PAGE_SIZE = 5
+SEPARATOR = "-" * 30 + "\n\n" # 각 대화 끝에 구분선 추가 (두 줄 띄움)
+
+
+def format_dialogue(dialogue_data, number):
     """
-    JSONL 파일에서 대화를 읽어 user와 assistant 턴을 구분하여 보기 좋게 출력하고 새 파일에 저장합니다.
-    이때, dialogue_id는 출력하지 않습니다.
+    대화 하나를 user와 assistant 턴을 구분한 텍스트로 만든다. dialogue_id는 넣지 않고 순번(number)으로 대신한다.
+    """
+    parts = [f"--- Dialogue {number} ---\n"]
+    for message in dialogue_data.get("messages", []):
+        role = message.get("role", "unknown_role")
+        content = message.get("content", "")
+
+        if role == "user":
+            parts.append(f"User:\n{content}\n\n")
+        elif role == "assistant":
+            parts.append(f"Assistant:\n{content}\n\n")
+        else:
+            parts.append(f"{role.capitalize()}:\n{content}\n\n")
+    parts.append(SEPARATOR)
+    return "".join(parts)
+
+
+def save_dialogues_prettily(input_jsonl_path, output_prettified_path):
+    """
+    JSONL 파일의 모든 대화를 보기 좋은 텍스트로 새 파일에 저장합니다. (콘솔에는 진행 요약만 출력)
+    파싱하지 못한 줄은 기존처럼 오류 메시지를 파일에 남기고, 개수와 첫 오류만 콘솔에 알립니다.
     """
     processed_count = 0
+    error_count = 0
+    first_error = None
     try:
         # 출력 파일을 쓰기 모드로 엽니다. 파일이 이미 존재하면 덮어씁니다.
-        with open(output_prettified_path, "w", encoding='utf-8') as outfile:
-            with open(input_jsonl_path, 'r', encoding='utf-8') as infile:
+        with open(output_prettified_path, "w", encoding='utf-8', buffering=EXPORT_BUFFER_BYTES) as outfile:
+            with open_jsonl(input_jsonl_path, 'r') as infile:
                 for line_num, line in enumerate(infile):
                     try:
-                        dialogue_data = json.loads(line)
-                        # dialogue_id를 가져오지 않거나 사용하지 않습니다.
-                        messages = dialogue_data.get("messages", [])
-
-                        # 콘솔 출력 및 파일 저장 시 dialogue_id 제거
-                        # 각 대화 시작을 알리는 구분자만 출력합니다.
-                        output_line = f"--- Dialogue {processed_count+1} ---\n" # 순번으로 대체
-                        print(output_line, end='')
-                        outfile.write(output_line)
-
-                        for message in messages:
-                            role = message.get("role", "unknown_role")
-                            content = message.get("content", "")
-
-                            if role == "user":
-                                formatted_content = f"User:\n{content}\n\n"
-                            elif role == "assistant":
-                                formatted_content = f"Assistant:\n{content}\n\n"
-                            else:
-                                formatted_content = f"{role.capitalize()}:\n{content}\n\n"
-                            
-                            print(formatted_content, end='') # 콘솔 출력
-                            outfile.write(formatted_content)  # 파일 저장
-
-                        separator = "-" * 30 + "\n\n" # 각 대화 끝에 구분선 추가 (두 줄 띄움)
-                        print(separator, end='')
-                        outfile.write(separator)
-                        processed_count += 1
-
+                        text = format_dialogue(json.loads(line), processed_count + 1)
                     except json.JSONDecodeError as e:
-                        error_msg = f"오류: '{input_jsonl_path}' 파일의 {line_num+1}번째 줄 파싱 중 오류 발생: {e}\n"
-                        print(error_msg, end='')
-                        outfile.write(error_msg)
+                        text = f"오류: '{input_jsonl_path}' 파일의 {line_num+1}번째 줄 파싱 중 오류 발생: {e}\n"
                     except Exception as e:
-                        error_msg = f"오류: '{input_jsonl_path}' 파일의 {line_num+1}번째 줄 처리 중 알 수 없는 오류 발생: {e}\n"
-                        print(error_msg, end='')
-                        outfile.write(error_msg)
+                        text = f"오류: '{input_jsonl_path}' 파일의 {line_num+1}번째 줄 처리 중 알 수 없는 오류 발생: {e}\n"
+                    else:
+                        outfile.write(text)
+                        processed_count += 1
+                        continue
+                    outfile.write(text)
+                    error_count += 1
+                    if first_error is None:
+                        first_error = text.strip()
 
-        print(f"\n[*] 총 {processed_count}개의 대화가 성공적으로 처리되어 '{output_prettified_path}'에 저장되었습니다.")
+        if error_count:
+            print(f"[!] {error_count}개의 줄을 처리하지 못했습니다. (첫 오류: {first_error})")
+        print(f"[*] 총 {processed_count}개의 대화가 성공적으로 처리되어 '{output_prettified_path}'에 저장되었습니다.")
 
     except FileNotFoundError:
         print(f"오류: '{input_jsonl_path}' 파일을 찾을 수 없습니다.")
     except Exception as e:
         print(f"파일을 읽거나 쓰는 중 오류 발생: {e}")
+    return processed_count
+
+
+def display_and_save_dialogues_prettily(input_jsonl_path, output_prettified_path):
+    """이전 이름. 이제 전체 대화를 콘솔에 출력하지 않고 파일로만 저장합니다 (특정 대화는 view_dialogues로 확인)."""
+    return save_dialogues_prettily(input_jsonl_path, output_prettified_path)
+
+
+def _render(index, numbers, out=sys.stdout):
+    """인덱스에서 numbers(0부터)번째 대화만 읽어 출력한다. 번호는 파일 안의 순번(1부터)으로 표시한다."""
+    for n in numbers:
+        try:
+            text = format_dialogue(index[n], n + 1)
+        except Exception as e:
+            text = f"오류: {n+1}번째 대화를 처리하지 못했습니다: {e}\n\n"
+        out.write(text)
+    out.flush()
+
+
+def _open_index(input_jsonl_path):
+    if is_compressed(input_jsonl_path):
+        raise ValueError(f"'{input_jsonl_path}'는 압축 파일이라 오프셋 인덱스를 만들 수 없습니다. 압축을 풀거나 export를 사용하세요.")
+    return JsonlIndex(input_jsonl_path)
+
+
+def view_dialogues(input_jsonl_path, start=1, count=VIEW_PAGE_SIZE, interactive=None):
+    """
+    start번째(1부터) 대화부터 count개씩 보여 준다. 파일 전체를 읽지 않고 인덱스로 필요한 줄만 읽는다.
+    interactive(기본: 터미널일 때)이면 페이지마다 Enter = 다음, 숫자 = 그 번호로 이동, q = 종료를 입력받는다.
+    """
+    if interactive is None:
+        interactive = sys.stdin.isatty() and sys.stdout.isatty()
+    with _open_index(input_jsonl_path) as index:
+        total = len(index)
+        first = max(start, 1) - 1
+        while first < total:
+            last = min(first + count, total)
+            _render(index, range(first, last))
+            print(f"[*] {first+1}-{last} / {total}")
+            if not interactive or last >= total:
+                break
+            answer = input("Enter = 다음, 번호 = 이동, q = 종료 > ").strip()
+            if answer.lower() == "q":
+                break
+            first = int(answer) - 1 if answer.isdigit() and int(answer) >= 1 else last
+
+
+def sample_dialogues(input_jsonl_path, k=VIEW_PAGE_SIZE, seed=None):
+    """전체를 파싱하지 않고 무작위 대화 k개를 파일 순서대로 보여 준다."""
+    with _open_index(input_jsonl_path) as index:
+        numbers = index.sample_indices(k, seed=seed)
+        _render(index, numbers)
+        print(f"[*] {len(numbers)} / {len(index)} dialogues sampled (seed={seed})")
+
 
 if __name__ == "__main__":
-    # --- 여기에 실제 파일 경로를 입력하세요 ---
+    # --- 인자 없이 실행하면 아래 경로로 export 합니다 ---
     # 예시:
     # input_jsonl_file = "C:/Users/YourUser/Desktop/my_data/original_dialogues.jsonl"
     # output_prettified_file = "C:/Users/YourUser/Desktop/my_data/prettified_dialogues.txt"
-    
+
     # 현재 스크립트와 같은 디렉토리에 있는 파일이라면 파일 이름만으로 충분합니다.
     input_jsonl_file = "moretrain.jsonl"  # 읽어올 원본 JSONL 파일
     output_prettified_file = "prettified_dialogues.txt" # 보기 좋게 저장될 새로운 텍스트 파일
 
-    display_and_save_dialogues_prettily(input_jsonl_file, output_prettified_file)
\ No newline at end of file
+    mode = sys.argv[1] if len(sys.argv) > 1 else "export"
+    path = sys.argv[2] if len(sys.argv) > 2 else input_jsonl_file
+    if mode == "view":
+        view_dialogues(path, int(sys.argv[3]) if len(sys.argv) > 3 else 1, int(sys.argv[4]) if len(sys.argv) > 4 else VIEW_PAGE_SIZE)
+    elif mode == "sample":
+        sample_dialogues(path, int(sys.argv[3]) if len(sys.argv) > 3 else VIEW_PAGE_SIZE, int(sys.argv[4]) if len(sys.argv) > 4 else None)
+    elif mode == "export":
+        save_dialogues_prettily(path, sys.argv[3] if len(sys.argv) > 3 else output_prettified_file)
+    else:
+        raise ValueError(f"Unknown mode '{mode}'. Choose from: export, view, sample")
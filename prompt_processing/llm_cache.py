@@ -0,0 +1,127 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+# 한도를 넘으면 이 비율까지 줄여 매 저장마다 정리하지 않도록 한다
+EVICT_TARGET_RATIO = 0.9
+# 오래된 항목부터 이만큼씩 읽어 지운다 (전체 행을 한 번에 읽지 않도록)
+EVICT_BATCH_ROWS = 1000
+# 캐시 적중 시 last_access 갱신을 모아 두었다가 이만큼 쌓이면 한 번의 트랜잭션으로 기록한다
+TOUCH_BATCH_SIZE = 256
+
+
+def cache_key(model, system_prompt, prompt, params):
+    """(모델, 시스템 프롬프트, 사용자 프롬프트, 생성 파라미터)의 해시. 하나라도 바뀌면 다른 키가 된다."""
+    payload = json.dumps([model, system_prompt, prompt, params], ensure_ascii=False, sort_keys=True)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    SQLite 파일에 저장되는 LLM 응답 캐시. 스크립트가 중간에 죽거나 설정을 바꿔 다시 실행해도
+    이미 받은 응답은 다시 요청하지 않는다. 전체 응답 크기가 max_bytes를 넘으면 가장 오래 사용되지 않은 항목부터 지운다.
+    적중 시각(last_access)은 메모리에 모았다가 TOUCH_BATCH_SIZE개마다, 정리 직전, close 때 한꺼번에 기록한다.
+    여러 스레드에서 동시에 사용할 수 있다.
+    """
+    def __init__(self, path, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._touched = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        """저장된 응답을 반환한다. 없으면 None."""
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= TOUCH_BATCH_SIZE:
+                self._flush_touches()
+                self._conn.commit()
+            return row[0]
+
+    def put(self, key, response):
+        """응답을 저장한다. 빈 응답(실패)은 저장하지 않는다."""
+        if not response:
+            return
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute("INSERT OR REPLACE INTO responses (key, response, size, last_access) VALUES (?, ?, ?, ?)",
+                               (key, response, size, time.time()))
+            self._total_bytes += size - (old[0] if old else 0)
+            self.writes += 1
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _flush_touches(self):
+        """모아 둔 last_access 갱신을 한 번의 executemany로 기록한다. 커밋은 호출한 쪽에서 한다."""
+        if self._touched:
+            self._conn.executemany("UPDATE responses SET last_access = ? WHERE key = ?",
+                                   [(accessed, key) for key, accessed in self._touched.items()])
+            self._touched.clear()
+
+    def _evict(self):
+        # 최근 적중이 반영된 순서로 지워야 하므로 먼저 기록한다
+        self._flush_touches()
+        target = self.max_bytes * EVICT_TARGET_RATIO
+        while self._total_bytes > target:
+            rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_access LIMIT ?",
+                                      (EVICT_BATCH_ROWS,)).fetchall()
+            if not rows:
+                break
+            doomed = []
+            for key, size in rows:
+                if self._total_bytes <= target:
+                    break
+                doomed.append((key,))
+                self._total_bytes -= size
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+            self.evictions += len(doomed)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "size_bytes": self._total_bytes,
+        }
+
+    def report(self):
+        s = self.stats()
+        logger.info(f"LLM response cache '{self.path}': hits={s['hits']} misses={s['misses']} "
+                    f"(hit rate {s['hit_rate']:.1%}), writes={s['writes']}, evictions={s['evictions']}, "
+                    f"size={s['size_bytes'] / (1024 * 1024):.1f} MB")
+
+    def close(self):
+        with self._lock:
+            self._flush_touches()
+            self._conn.commit()
+            self._conn.close()
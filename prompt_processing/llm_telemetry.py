@@ -0,0 +1,169 @@
+import bisect
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 지연 시간 히스토그램 버킷 상한 (초): 50ms부터 √2배씩 약 2분까지
+LATENCY_BUCKETS = [0.05 * 2 ** (k / 2) for k in range(23)]
+DEFAULT_SUMMARY_INTERVAL = 60.0
+
+
+class LatencyHistogram:
+    """고정 로그 버킷 히스토그램. 백분위수는 해당 버킷의 상한으로 근사한다."""
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # 마지막 칸은 최대 버킷 초과
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p):
+        """p 백분위수가 속한 버킷의 상한. 관측된 최댓값보다 크게 보고하지 않는다."""
+        if not self.count:
+            return 0.0
+        threshold = p * self.count
+        cumulative = 0
+        for i, c in enumerate(self.counts):
+            cumulative += c
+            if cumulative >= threshold:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.50),
+            "p90": self.percentile(0.90),
+            "p99": self.percentile(0.99),
+            "max": self.max,
+        }
+
+    def buckets(self):
+        labels = [f"<={b:.3g}s" for b in self.bounds] + [f">{self.bounds[-1]:.3g}s"]
+        return {label: c for label, c in zip(labels, self.counts) if c}
+
+
+class LLMTelemetry:
+    """
+    요청 단위 LLM 호출 지표(지연 시간, 입력/출력 토큰, 재시도, 백오프 대기 시간, 캐시 적중, 실패)를 모으는 수집기.
+    summary_interval초마다 요약을 로그로 남기고, 실행이 끝나면 write_report()로 JSON 보고서를 저장한다.
+    여러 스레드에서 동시에 사용할 수 있다.
+    """
+    def __init__(self, price_of=None, summary_interval=DEFAULT_SUMMARY_INTERVAL):
+        self.price_of = price_of  # (입력 토큰, 출력 토큰, price_factor) -> USD
+        self.summary_interval = summary_interval
+        self.started_at = time.time()
+        self.api_latency = LatencyHistogram()
+        self.request_latency = LatencyHistogram()
+        self.batch_latency = LatencyHistogram()
+        self.calls = 0
+        self.failures = 0
+        self.cache_hits = 0
+        self.retries = 0
+        self.backoff_seconds = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost_usd = 0.0
+        self.samples = 0
+        self.batches = 0
+        self.batch_requests = 0
+        self._lock = threading.Lock()
+        self._last_summary = time.monotonic()
+
+    def record_call(self, api_seconds=None, total_seconds=None, input_tokens=0, output_tokens=0,
+                    retries=0, backoff_seconds=0.0, failed=False, price_factor=1.0):
+        """API 요청 하나의 결과를 기록한다. api_seconds는 성공한 마지막 호출의 지연 시간, total_seconds는 재시도 포함 전체 시간."""
+        with self._lock:
+            self.calls += 1
+            self.failures += int(failed)
+            self.retries += retries
+            self.backoff_seconds += backoff_seconds
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            if self.price_of is not None:
+                self.cost_usd += self.price_of(input_tokens, output_tokens, price_factor)
+            if api_seconds is not None:
+                self.api_latency.add(api_seconds)
+            if total_seconds is not None:
+                self.request_latency.add(total_seconds)
+        self._maybe_log_summary()
+
+    def record_cache_hit(self):
+        with self._lock:
+            self.cache_hits += 1
+
+    def record_batch(self, seconds, requests):
+        """Message Batches API 배치 하나의 제출~완료 시간을 기록한다."""
+        with self._lock:
+            self.batches += 1
+            self.batch_requests += requests
+            self.batch_latency.add(seconds)
+
+    def record_samples(self, count):
+        with self._lock:
+            self.samples += count
+
+    def summary(self):
+        with self._lock:
+            elapsed = time.time() - self.started_at
+            return {
+                "elapsed_seconds": elapsed,
+                "calls": self.calls,
+                "failures": self.failures,
+                "cache_hits": self.cache_hits,
+                "retries": self.retries,
+                "backoff_seconds": self.backoff_seconds,
+                "calls_per_minute": self.calls / elapsed * 60 if elapsed else 0.0,
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "avg_input_tokens": self.input_tokens / self.calls if self.calls else 0.0,
+                "avg_output_tokens": self.output_tokens / self.calls if self.calls else 0.0,
+                "cost_usd": self.cost_usd,
+                "samples": self.samples,
+                "cost_per_sample_usd": self.cost_usd / self.samples if self.samples else None,
+                "api_latency": self.api_latency.summary(),
+                "request_latency": self.request_latency.summary(),
+                "batches": self.batches,
+                "batch_requests": self.batch_requests,
+                "batch_latency": self.batch_latency.summary(),
+            }
+
+    def _maybe_log_summary(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_summary < self.summary_interval:
+                return
+            self._last_summary = now
+        self.log_summary()
+
+    def log_summary(self):
+        s = self.summary()
+        api = s["api_latency"]
+        logger.info(f"[LLM] {s['calls']} calls ({s['calls_per_minute']:.1f}/min), {s['failures']} failed, {s['cache_hits']} cache hits, "
+                    f"{s['retries']} retries ({s['backoff_seconds']:.1f}s backoff) | latency p50={api['p50']:.2f}s p99={api['p99']:.2f}s | "
+                    f"tokens in={s['input_tokens']} out={s['output_tokens']} | ${s['cost_usd']:.4f}, {s['samples']} samples")
+
+    def write_report(self, path):
+        """최종 요약과 지연 시간 히스토그램을 JSON 파일로 저장한다."""
+        report = self.summary()
+        with self._lock:
+            report["histograms"] = {
+                "api_latency": self.api_latency.buckets(),
+                "request_latency": self.request_latency.buckets(),
+                "batch_latency": self.batch_latency.buckets(),
+            }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        self.log_summary()
+        logger.info(f"LLM telemetry report saved to '{path}'.")
+        return report
@@ -3,10 +3,93 @@ import os
 import sys
 import datetime
 
-def merge_jsonl_files(input_filepaths: list[str], output_filepath: str):
+from jsonl_io import open_jsonl
+from jsonl_shuffle import DEFAULT_SHUFFLE_MEMORY_BYTES, external_shuffle_jsonl
+
+# raw / fast 모드에서 한 번에 읽고 쓰는 블록 크기
+COPY_BLOCK_SIZE = 16 * 1024 * 1024
+
+MERGE_MODES = ("strict", "fast", "raw")
+FSYNC_POLICIES = ("end", "per_file", "never")
+
+def _fsync_path(path):
+    """닫힌 파일을 다시 열어 fsync 합니다. 압축 출력은 압축기가 닫히며 마지막 프레임/트레일러를 쓰므로 그 뒤에 호출해야 합니다."""
+    with open(path, 'rb+') as f:
+        os.fsync(f.fileno())
+
+def _merge_strict(infile, outfile, input_file):
+    """각 라인을 json.loads 후 다시 json.dumps 하여 기록합니다 (기존 방식)."""
+    merged_count = 0
+    for line_num, line in enumerate(infile):
+        try:
+            json_obj = json.loads(line)
+            outfile.write((json.dumps(json_obj, ensure_ascii=False) + '\n').encode('utf-8'))
+            merged_count += 1
+        except json.JSONDecodeError as e:
+            print(f"경고: 파일 '{input_file}'의 {line_num + 1}번째 라인이 유효한 JSON이 아닙니다. 건너뜁니다: {e}", file=sys.stderr)
+        except Exception as e:
+            print(f"경고: 파일 '{input_file}'의 {line_num + 1}번째 라인 처리 중 예상치 못한 오류 발생: {e}", file=sys.stderr)
+    return merged_count
+
+def _merge_fast(infile, outfile, input_file):
+    """
+    파싱 없이 각 라인이 '{'로 시작하고 '}'로 끝나는지만 확인한 뒤 원본 바이트를 그대로 기록합니다.
+    """
+    merged_count = 0
+    for line_num, line in enumerate(infile):
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if not (stripped.startswith(b'{') and stripped.endswith(b'}')):
+            print(f"경고: 파일 '{input_file}'의 {line_num + 1}번째 라인이 JSON 객체 형태가 아닙니다. 건너뜁니다.", file=sys.stderr)
+            continue
+        outfile.write(line if line.endswith(b'\n') else line + b'\n')
+        merged_count += 1
+    return merged_count
+
+def _merge_raw(infile, outfile, input_file):
+    """
+    검증 없이 큰 블록 단위로 바이트를 그대로 복사합니다. 개행 수를 세어 라인 수로 반환합니다.
+    """
+    merged_count = 0
+    last_byte = b'\n'
+    while True:
+        block = infile.read(COPY_BLOCK_SIZE)
+        if not block:
+            break
+        outfile.write(block)
+        merged_count += block.count(b'\n')
+        last_byte = block[-1:]
+    # 마지막 줄에 개행이 없으면 다음 파일과 붙지 않도록 개행을 추가
+    if last_byte != b'\n':
+        outfile.write(b'\n')
+        merged_count += 1
+    return merged_count
+
+def merge_jsonl_files(input_filepaths: list[str], output_filepath: str, mode: str = "strict", fsync_policy: str = "end",
+                      shuffle: bool = False, seed: int | None = None, shuffle_memory_bytes: int = DEFAULT_SHUFFLE_MEMORY_BYTES):
     """
     두 개 이상의 JSONL 파일을 읽어 하나의 새로운 JSONL 파일로 병합합니다.
+
+    Args:
+        mode (str): "strict" - 각 라인을 파싱 후 재직렬화, 깨진 JSON은 건너뜀 (기본값),
+                    "fast" - 라인이 '{'로 시작하고 '}'로 끝나는지만 검사하고 원본 바이트를 그대로 복사.
+                             파싱하지 않으므로 형태만 맞는 깨진 JSON(예: '{"a": }')은 그대로 출력에 들어갑니다.
+                             입력이 이미 검증된 JSONL일 때만 사용하세요.
+                    "raw" - 검증 없이 큰 블록 단위로 복사 (빈 줄도 그대로 복사됨).
+        fsync_policy (str): "end" - 출력 파일을 닫은 뒤 한 번만 fsync (기본값, 압축 출력의 트레일러까지 포함),
+                            "per_file" - 입력 파일마다 fsync (압축 출력은 그 시점까지 flush된 블록만 보장),
+                            "never" - fsync 하지 않음.
+        shuffle (bool): True이면 병합 결과를 외부 셔플로 섞습니다 (파일별로 묶여 있는 순서를 해소).
+        seed (int | None): 셔플 시드. 같은 시드와 입력이면 같은 결과가 나옵니다.
+        shuffle_memory_bytes (int): 셔플 시 메모리 예산 (바이트).
     """
+    if mode not in MERGE_MODES:
+        raise ValueError(f"mode는 {MERGE_MODES} 중 하나여야 합니다: {mode}")
+    if fsync_policy not in FSYNC_POLICIES:
+        raise ValueError(f"fsync_policy는 {FSYNC_POLICIES} 중 하나여야 합니다: {fsync_policy}")
+
+    merge_one_file = {"strict": _merge_strict, "fast": _merge_fast, "raw": _merge_raw}[mode]
     merged_count = 0
     
     # 출력 파일이 이미 존재하면 경고 메시지 출력
@@ -15,31 +98,31 @@ def merge_jsonl_files(input_filepaths: list[str], output_filepath: str):
         # 사용자에게 덮어쓸지 새 파일로 만들지 물어볼 수도 있습니다.
         # 여기서는 기본적으로 덮어쓰는 것으로 가정합니다.
 
-    with open(output_filepath, 'w', encoding='utf-8') as outfile:
+    # 모든 모드에서 바이트 단위로 읽고 쓰며, 큰 버퍼로 시스템 콜 횟수를 줄입니다.
+    # .gz / .zst 확장자면 open_jsonl이 투명하게 압축/해제합니다.
+    with open_jsonl(output_filepath, 'wb') as outfile:
         for input_file in input_filepaths:
             if not os.path.exists(input_file):
                 print(f"오류: 입력 파일 '{input_file}'을(를) 찾을 수 없습니다. 건너뜁니다.", file=sys.stderr)
                 continue
             
-            print(f"파일 '{input_file}' 병합 중...")
-            with open(input_file, 'r', encoding='utf-8') as infile:
-                for line_num, line in enumerate(infile):
-                    try:
-                        # 각 라인이 유효한 JSON인지 확인 (선택 사항)
-                        json_obj = json.loads(line)
-                        outfile.write(json.dumps(json_obj, ensure_ascii=False) + '\n')
-                        merged_count += 1
-                    except json.JSONDecodeError as e:
-                        print(f"경고: 파일 '{input_file}'의 {line_num + 1}번째 라인이 유효한 JSON이 아닙니다. 건너뜁니다: {e}", file=sys.stderr)
-                    except Exception as e:
-                        print(f"경고: 파일 '{input_file}'의 {line_num + 1}번째 라인 처리 중 예상치 못한 오류 발생: {e}", file=sys.stderr)
+            print(f"파일 '{input_file}' 병합 중... (mode={mode})")
+            with open_jsonl(input_file, 'rb') as infile:
+                merged_count += merge_one_file(infile, outfile, input_file)
             
-            # 각 파일 처리 후 버퍼 비우고 디스크에 동기화
-            outfile.flush()
-            os.fsync(outfile.fileno())
+            if fsync_policy == "per_file":
+                outfile.flush()
+                os.fsync(outfile.fileno())
+
+    # with 블록을 빠져나와 압축기까지 닫힌 뒤에 fsync 해야 .gz / .zst의 마지막 블록과 트레일러가 디스크에 남는다
+    if fsync_policy in ("end", "per_file"):
+        _fsync_path(output_filepath)
 
     print(f"\n병합 완료! 총 {merged_count}개의 JSON 객체가 '{output_filepath}'에 저장되었습니다.")
 
+    if shuffle:
+        external_shuffle_jsonl(output_filepath, output_filepath, seed=seed, max_memory_bytes=shuffle_memory_bytes)
+
 if __name__ == '__main__':
     # 병합할 입력 JSONL 파일 목록
     # 여기에 병합하고 싶은 JSONL 파일 경로를 추가하세요.
@@ -0,0 +1,163 @@
+import logging
+import os
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ID_BYTES = 12  # ObjectId 하나의 바이너리 크기
+ID_DTYPE = np.dtype(f"S{ID_BYTES}")
+DEFAULT_COMMIT_EVERY = 64
+DEFAULT_COMMIT_INTERVAL = 5.0
+DEFAULT_COMPACT_THRESHOLD = 100000
+
+
+def _id_bytes_list(ids):
+    """ID 배열을 12바이트 bytes 목록으로 변환한다. (numpy의 S 타입은 끝의 NUL 바이트를 잘라내므로 다시 채운다)"""
+    return [raw.ljust(ID_BYTES, b"\0") for raw in ids.tolist()]
+
+
+def _fsync_replace(tmp_path, path):
+    with open(tmp_path, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class ProcessedIdJournal:
+    """
+    처리된 문서 ID(ObjectId)를 12바이트 바이너리로 기록하는 저널.
+
+      - <path>.sorted : 정렬·중복 제거된 ID 배열 (np.fromfile로 바로 읽음, 멤버십은 이진 탐색)
+      - <path>.log    : 마지막 압축 이후 추가된 ID (추가 전용)
+
+    add()는 메모리에 모았다가 commit_every개 또는 commit_interval초마다 한 번에 쓰고 fsync한다 (group commit).
+    .log가 compact_threshold개를 넘으면 .sorted로 합쳐 다시 쓴다.
+    legacy_txt_path가 주어지고 저널이 없으면 기존 processed_ids.txt를 한 번 가져온다.
+    """
+    def __init__(self, path, legacy_txt_path=None, commit_every=DEFAULT_COMMIT_EVERY,
+                 commit_interval=DEFAULT_COMMIT_INTERVAL, compact_threshold=DEFAULT_COMPACT_THRESHOLD, on_commit=None):
+        self.sorted_path = path + ".sorted"
+        self.log_path = path + ".log"
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.compact_threshold = compact_threshold
+        self.on_commit = on_commit
+        self._buffer = []
+        self._last_commit = time.monotonic()
+
+        start = time.perf_counter()
+        fresh = not os.path.exists(self.sorted_path) and not os.path.exists(self.log_path)
+        self._sorted = self._read_ids(self.sorted_path)
+        log_ids = self._read_ids(self.log_path)
+        # 압축 도중 중단되면 .log에 .sorted와 겹치는 ID가 남을 수 있다
+        if len(log_ids) and len(self._sorted):
+            log_ids = log_ids[~self._in_sorted(log_ids)]
+        self._recent = set(_id_bytes_list(log_ids))
+        if fresh and legacy_txt_path and os.path.exists(legacy_txt_path):
+            self._import_legacy(legacy_txt_path)
+        elif len(self._recent) >= self.compact_threshold:
+            self.compact()
+        logger.info(f"Loaded {len(self)} processed IDs from '{path}' in {(time.perf_counter() - start) * 1000:.1f} ms.")
+
+    @staticmethod
+    def _read_ids(path):
+        if not os.path.exists(path):
+            return np.empty(0, dtype=ID_DTYPE)
+        data = np.fromfile(path, dtype=np.uint8)
+        # 마지막 기록이 도중에 끊겼으면 온전한 12바이트 단위까지만 사용
+        usable = len(data) - len(data) % ID_BYTES
+        return data[:usable].view(ID_DTYPE)
+
+    def _in_sorted(self, ids):
+        """ids 각각이 .sorted 배열에 있는지 이진 탐색으로 확인한다 (이미 정렬된 배열을 다시 정렬하지 않음)."""
+        pos = np.searchsorted(self._sorted, ids)
+        found = np.zeros(len(ids), dtype=bool)
+        inside = pos < len(self._sorted)
+        found[inside] = self._sorted[pos[inside]] == ids[inside]
+        return found
+
+    @staticmethod
+    def _to_bytes(doc_id):
+        doc_id = str(doc_id)
+        if len(doc_id) != ID_BYTES * 2:
+            return None
+        try:
+            return bytes.fromhex(doc_id)
+        except ValueError:
+            return None
+
+    def _import_legacy(self, legacy_txt_path):
+        ids = []
+        with open(legacy_txt_path, "r", encoding="utf-8") as f:
+            for line in f:
+                raw = self._to_bytes(line.strip())
+                if raw is not None:
+                    ids.append(raw)
+        self._recent.update(ids)
+        self.compact()
+        logger.info(f"Imported {len(ids)} IDs from legacy '{legacy_txt_path}'.")
+
+    def __contains__(self, doc_id):
+        raw = self._to_bytes(doc_id)
+        if raw is None:
+            return False
+        if raw in self._recent:
+            return True
+        pos = np.searchsorted(self._sorted, raw)
+        return pos < len(self._sorted) and self._sorted[pos] == raw.rstrip(b"\0")
+
+    def __len__(self):
+        return len(self._sorted) + len(self._recent)
+
+    def __iter__(self):
+        """모든 ID를 16진수 문자열로 내보낸다."""
+        for raw in _id_bytes_list(self._sorted):
+            yield raw.hex()
+        for raw in self._recent:
+            yield raw.hex()
+
+    def add(self, doc_id):
+        """ID를 추가한다. 실제 디스크 기록은 group commit 시점에 일어난다. ObjectId가 아니면 무시한다."""
+        raw = self._to_bytes(doc_id)
+        if raw is None:
+            logger.warning(f"Processed ID {doc_id} is not an ObjectId and cannot be journaled.")
+            return
+        if raw in self:
+            return
+        self._recent.add(raw)
+        self._buffer.append(raw)
+        if len(self._buffer) >= self.commit_every or time.monotonic() - self._last_commit >= self.commit_interval:
+            self.commit()
+
+    def commit(self):
+        """버퍼의 ID들을 한 번의 쓰기와 fsync로 .log에 기록하고, 필요하면 압축한다."""
+        if self._buffer:
+            with open(self.log_path, "ab") as f:
+                f.write(b"".join(self._buffer))
+                f.flush()
+                os.fsync(f.fileno())
+            logger.debug(f"Committed {len(self._buffer)} processed IDs to '{self.log_path}'.")
+            self._buffer = []
+        self._last_commit = time.monotonic()
+        if self.on_commit is not None:
+            self.on_commit()
+        if len(self._recent) >= self.compact_threshold:
+            self.compact()
+
+    def compact(self):
+        """.sorted와 .log를 정렬된 하나의 배열로 합쳐 .sorted에 원자적으로 저장하고 .log를 비운다."""
+        recent = np.array(sorted(self._recent), dtype=ID_DTYPE)
+        merged = np.union1d(self._sorted, recent) if len(self._sorted) else recent
+        tmp_path = self.sorted_path + ".tmp"
+        merged.tofile(tmp_path)
+        _fsync_replace(tmp_path, self.sorted_path)
+        # .sorted가 먼저 바뀐 뒤 .log를 비우므로, 도중에 죽어도 같은 ID가 두 곳에 남을 뿐 잃지 않는다
+        open(self.log_path, "wb").close()
+        self._sorted = merged
+        self._recent = set()
+        self._buffer = []
+        logger.info(f"Compacted processed ID journal: {len(merged)} IDs in '{self.sorted_path}'.")
+
+    def close(self):
+        self.commit()
@@ -0,0 +1,123 @@
+import json
+import logging
+import os
+
+from bson.objectid import ObjectId
+
+logger = logging.getLogger(__name__)
+
+# 결과 없이 끝난 문서를 다시 시도할 최대 실행 횟수. 넘으면 포기하고 구간에 포함시켜 pending이 계속 커지지 않게 한다.
+DEFAULT_MAX_ATTEMPTS = int(os.getenv("RESUME_MAX_ATTEMPTS", "3"))
+
+
+def _merge_ranges(ranges):
+    """겹치는 [lo, hi] 구간들을 합친다. 16진수 ObjectId 문자열은 길이가 같으므로 문자열 비교가 곧 _id 순서이다."""
+    merged = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], hi)
+        else:
+            merged.append([lo, hi])
+    return merged
+
+
+class ResumeWatermark:
+    """
+    _id 내림차순으로 처리한 구간(워터마크)과 그 안에서 아직 처리되지 않은 소수의 예외 ID로 재시작 지점을 기록한다.
+    처리된 ID 전체를 $nin으로 넘기는 대신 몇 개의 구간과 예외 ID만 쿼리에 넣으므로,
+    처리된 문서가 아무리 많아도 쿼리 크기와 시작 시간이 일정하다.
+
+    상태 파일 형식: {"ranges": [[lo, hi], ...], "pending": {id: 시도 횟수, ...}}
+      - ranges: 이미 한 번 전달되어 기록된 _id 구간 (양 끝 포함)
+      - pending: 구간 안에 있지만 처리되지 않아 다음 실행에서 다시 가져올 ID와 지금까지 시도한 횟수
+    max_attempts번 시도해도 처리되지 않은 ID(파싱되지 않는 파일 등)는 pending에서 빼 구간에 포함시킨다.
+    """
+    def __init__(self, path, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.ranges = []
+        self.pending = {}
+        self.abandoned = 0
+        self._run_range = None
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self.ranges = _merge_ranges(state.get("ranges", []))
+            pending = state.get("pending", {})
+            # 이전 형식(ID 목록)은 한 번 시도한 것으로 본다
+            self.pending = dict(pending) if isinstance(pending, dict) else dict.fromkeys(pending, 1)
+            logger.info(f"Loaded resume watermark from '{path}': {len(self.ranges)} ranges, {len(self.pending)} pending IDs.")
+
+    @property
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def query(self):
+        """아직 처리하지 않은 문서를 찾는 MongoDB 쿼리: 기록된 구간 밖이거나 pending에 있는 _id."""
+        if not self.ranges:
+            return {}
+        outside_ranges = {"$nor": [{"_id": {"$gte": ObjectId(lo), "$lte": ObjectId(hi)}} for lo, hi in self.ranges]}
+        if not self.pending:
+            return outside_ranges
+        return {"$or": [outside_ranges, {"_id": {"$in": [ObjectId(doc_id) for doc_id in self.pending]}}]}
+
+    def covers(self, doc_id):
+        """이전 실행에서 이미 처리된 문서인지: 기록된 구간 안에 있고 pending이 아니다."""
+        doc_id = str(doc_id)
+        if doc_id in self.pending:
+            return False
+        return any(lo <= doc_id <= hi for lo, hi in self.ranges)
+
+    def record(self, doc_id, processed=True):
+        """
+        쿼리 결과 순서대로 전달된 문서를 기록한다. processed가 False면 다음 실행에서 다시 가져오도록 pending에 남긴다.
+        반드시 커서 순서대로 빠짐없이 호출해야 구간 안에 누락된 문서가 생기지 않는다.
+        """
+        doc_id = str(doc_id)
+        if not ObjectId.is_valid(doc_id):
+            logger.warning(f"Invalid ObjectId {doc_id} cannot be tracked by the resume watermark.")
+            return
+        if self._run_range is None:
+            self._run_range = [doc_id, doc_id]
+        else:
+            self._run_range[0] = min(self._run_range[0], doc_id)
+            self._run_range[1] = max(self._run_range[1], doc_id)
+        if processed:
+            self.pending.pop(doc_id, None)
+            return
+        attempts = self.pending.get(doc_id, 0) + 1
+        if attempts >= self.max_attempts:
+            self.pending.pop(doc_id, None)
+            self.abandoned += 1
+            logger.warning(f"Document {doc_id} produced no output after {attempts} attempts. It will not be retried.")
+        else:
+            self.pending[doc_id] = attempts
+
+    def save(self):
+        """현재까지의 구간을 합쳐 상태 파일에 원자적으로 저장한다."""
+        ranges = self.ranges + ([list(self._run_range)] if self._run_range else [])
+        state = {"ranges": _merge_ranges(ranges), "pending": dict(sorted(self.pending.items()))}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def migrate_from_processed_ids(self, collection, processed_ids):
+        """
+        기존 processed_ids.txt 방식에서 한 번만 옮겨 온다. 처리된 ID의 최소~최대를 하나의 구간으로 잡고,
+        그 구간 안에서 처리되지 않은 문서는 _id만 조회해 pending으로 둔다.
+        """
+        valid_ids = sorted(doc_id for doc_id in processed_ids if ObjectId.is_valid(doc_id))
+        if not valid_ids:
+            return
+        lo, hi = valid_ids[0], valid_ids[-1]
+        processed = set(valid_ids)
+        cursor = collection.find({"_id": {"$gte": ObjectId(lo), "$lte": ObjectId(hi)}}, {"_id": 1})
+        pending = {str(doc["_id"]) for doc in cursor} - processed
+        self.ranges = _merge_ranges(self.ranges + [[lo, hi]])
+        for doc_id in pending:
+            self.pending.setdefault(doc_id, 0)
+        self.save()
+        logger.info(f"Migrated {len(valid_ids)} processed IDs to resume watermark '{self.path}' ({len(pending)} pending IDs in range).")
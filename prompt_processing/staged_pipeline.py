@@ -0,0 +1,139 @@
+import logging
+import queue
+import threading
+import time
+
+from jsonl_io import append_jsonl_records
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREFETCH = 64
+DEFAULT_FLUSH_INTERVAL = 10.0
+_POLL_SECONDS = 0.1
+_DONE = object()
+_END = object()
+
+
+def run_staged(items, prepare, process, workers=8, prefetch=DEFAULT_PREFETCH):
+    """
+    items를 단계별 스레드로 나눠 처리하고 (item, 결과)를 입력 순서대로 내보낸다.
+
+      1. 읽기 스레드 하나: items를 읽고 prepare(item)을 적용해 크기 prefetch의 큐에 넣는다 (Mongo 읽기, 청크 분할)
+      2. 작업 스레드 workers개: process(item, prepared)를 동시에 실행한다 (LLM 호출)
+      3. 호출한 스레드: 결과를 입력 순서대로 다시 맞춰 내보낸다 (쓰기)
+
+    읽었지만 아직 내보내지 않은 항목은 prefetch + workers개를 넘지 않는다.
+    어느 단계에서 예외가 나면 그 항목 차례에 호출한 쪽에서 다시 던진다.
+    제너레이터를 닫으면 남은 스레드는 진행 중인 항목만 끝내고 멈춘다.
+    """
+    prepared = queue.Queue(maxsize=prefetch)
+    results = queue.Queue()
+    window = threading.Semaphore(prefetch + workers)
+    stop = threading.Event()
+
+    def put_prepared(task):
+        while not stop.is_set():
+            try:
+                prepared.put(task, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read():
+        count = 0
+        try:
+            for item in items:
+                while not window.acquire(timeout=_POLL_SECONDS):
+                    if stop.is_set():
+                        return
+                if not put_prepared((count, item, prepare(item))):
+                    return
+                count += 1
+        except BaseException as e:
+            results.put((count, None, None, e))
+            count += 1
+        finally:
+            results.put((_END, count, None, None))
+            for _ in range(workers):
+                put_prepared(_DONE)
+
+    def work():
+        while not stop.is_set():
+            try:
+                task = prepared.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+            if task is _DONE:
+                return
+            seq, item, prepared_item = task
+            try:
+                results.put((seq, item, process(item, prepared_item), None))
+            except BaseException as e:
+                results.put((seq, item, None, e))
+
+    threads = [threading.Thread(target=read, name="staged-reader", daemon=True)]
+    threads += [threading.Thread(target=work, name=f"staged-worker-{n}", daemon=True) for n in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        done = {}
+        next_seq, total = 0, None
+        while total is None or next_seq < total:
+            if next_seq in done:
+                item, result, error = done.pop(next_seq)
+                window.release()
+                if error is not None:
+                    raise error
+                yield item, result
+                next_seq += 1
+                continue
+            seq, item, result, error = results.get()
+            if seq is _END:
+                total = item
+            else:
+                done[seq] = (item, result, error)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+class DurableBatchWriter:
+    """
+    단일 쓰기 단계. 출력 레코드를 batch_size개(또는 flush_interval초)마다 한 번에 이어 쓰고 fsync한 뒤,
+    그 사이에 들어온 항목들의 완료 처리 on_durable(token)을 들어온 순서대로 실행한다.
+    완료 처리(처리된 ID 기록 등)는 항상 출력이 디스크에 반영된 뒤에 일어나므로, 중간에 죽어도 결과 없이 ID만 남지 않는다.
+    """
+    def __init__(self, path, batch_size=30, flush_interval=DEFAULT_FLUSH_INTERVAL, on_durable=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_durable = on_durable
+        self.written = 0
+        self._records = []
+        self._tokens = []
+        self._last_flush = time.monotonic()
+
+    def add(self, records, token=None):
+        """항목 하나의 출력 레코드(없으면 빈 목록)와, 쓰기가 끝난 뒤 on_durable에 넘길 token을 추가한다."""
+        self._records.extend(records)
+        self._tokens.append(token)
+        if len(self._records) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._records:
+            append_jsonl_records(self.path, self._records)
+            self.written += len(self._records)
+            logger.info(f"{len(self._records)} documents appended to '{self.path}'.")
+        if self.on_durable is not None:
+            for token in self._tokens:
+                self.on_durable(token)
+        self._records = []
+        self._tokens = []
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()